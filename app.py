@@ -5,33 +5,151 @@ This module provides the application factory pattern for creating Flask app inst
 Routes are organized in separate blueprint modules in the routes package.
 """
 
+import threading
+
 from flask import Flask
-from database import init_database, add_sample_data
+import database
+import repositories
+from database import (init_database, configure_database, configure_pool, configure_export_connections,
+                      configure_book_cache, start_checkpointer)
 from routes import register_blueprints
+from services import library_service, payment_queue, payment_service, resilience
+from routes.fragments import configure_fragment_cache, ROW_CACHE_MAX_ENTRIES, ROW_CACHE_MAX_BYTES
+from cli import register_commands
 
 
-def create_app():
+def create_app(config=None):
     """
     Application factory function to create and configure Flask app.
     
+    Args:
+        config: Optional mapping of settings overriding the defaults
+            (e.g. DATABASE, SAMPLE_DATA, DB_POOL_SIZE, DB_STORAGE_PROFILE,
+            BOOK_CACHE_TTL, STORAGE_BACKEND)
+    
     Returns:
         Flask: Configured Flask application instance
     """
     app = Flask(__name__)
     app.secret_key = "super secret key"
+    app.config.from_mapping(
+        # None keeps the current database: LIBRARY_DATABASE or library.db
+        DATABASE=None,
+        SAMPLE_DATA=True,
+        # WAL checkpointer and payment workers, started by the first request
+        BACKGROUND_SERVICES=True,
+        DB_POOL_SIZE=database.POOL_SIZE,
+        DB_POOL_TIMEOUT=database.POOL_TIMEOUT,
+        DB_EXPORT_CONNECTIONS=database.EXPORT_CONNECTIONS,
+        DB_STORAGE_PROFILE=database.STORAGE_PROFILE,
+        DB_PRAGMAS=None,
+        DB_CHECKPOINT_INTERVAL=database.CHECKPOINT_INTERVAL,
+        STORAGE_BACKEND='sqlite',
+        STORAGE_OPTIONS=None,
+        BOOK_CACHE_MAX_ENTRIES=database.BOOK_CACHE_MAX_ENTRIES,
+        BOOK_CACHE_MAX_BYTES=database.BOOK_CACHE_MAX_BYTES,
+        BOOK_CACHE_TTL=database.BOOK_CACHE_TTL,
+        AVAILABILITY_CACHE_TTL=database.AVAILABILITY_CACHE_TTL,
+        ROW_CACHE_MAX_ENTRIES=ROW_CACHE_MAX_ENTRIES,
+        ROW_CACHE_MAX_BYTES=ROW_CACHE_MAX_BYTES,
+        PAYMENT_WORKERS=payment_queue.PAYMENT_WORKERS,
+        PAYMENT_POLL_INTERVAL=payment_queue.PAYMENT_POLL_INTERVAL,
+        PAYMENT_GATEWAY_LIVE=False,
+        PAYMENT_GATEWAY_URL=payment_service.DEFAULT_BASE_URL,
+        PAYMENT_GATEWAY_API_KEY="test_key_12345",
+        PAYMENT_GATEWAY_POOL_SIZE=payment_service.GATEWAY_POOL_SIZE,
+        PAYMENT_GATEWAY_MAX_RETRIES=payment_service.GATEWAY_MAX_RETRIES,
+        PAYMENT_BREAKER_ERROR_RATE=resilience.BREAKER_ERROR_RATE,
+        PAYMENT_BREAKER_SLOW_CALL_SECONDS=resilience.BREAKER_SLOW_CALL_SECONDS,
+        PAYMENT_BREAKER_OPEN_SECONDS=resilience.BREAKER_OPEN_SECONDS,
+        PAYMENT_BULKHEAD_SIZE=resilience.BULKHEAD_SIZE,
+        PAYMENT_BULKHEAD_WAIT=resilience.BULKHEAD_WAIT,
+    )
+    if config:
+        app.config.update(config)
+    
+    # Set up the shared database connection pool and storage profile
+    if app.config['DATABASE']:
+        configure_database(app.config['DATABASE'])
+    configure_pool(
+        size=app.config['DB_POOL_SIZE'],
+        timeout=app.config['DB_POOL_TIMEOUT'],
+        storage_profile=app.config['DB_STORAGE_PROFILE'],
+        pragmas=app.config['DB_PRAGMAS'],
+    )
+    configure_export_connections(app.config['DB_EXPORT_CONNECTIONS'])
+    
+    # Stores behind the business logic: 'sqlite', 'memory', another registered
+    # backend or a 'module:factory' import path
+    repositories.configure_repository(repositories.create_repository(
+        app.config['STORAGE_BACKEND'], **(app.config['STORAGE_OPTIONS'] or {})
+    ))
+    
+    # Size the read-through book cache and the rendered catalog row cache
+    configure_book_cache(
+        max_entries=app.config['BOOK_CACHE_MAX_ENTRIES'],
+        max_bytes=app.config['BOOK_CACHE_MAX_BYTES'],
+        ttl=app.config['BOOK_CACHE_TTL'],
+        availability_ttl=app.config['AVAILABILITY_CACHE_TTL'],
+    )
+    configure_fragment_cache(
+        max_entries=app.config['ROW_CACHE_MAX_ENTRIES'],
+        max_bytes=app.config['ROW_CACHE_MAX_BYTES'],
+    )
     
     # Initialize the database
     init_database()
     
     # Add sample data for testing and demonstration
-    add_sample_data()
+    if app.config['SAMPLE_DATA']:
+        library_service.add_sample_data()
+    
+    # One gateway (and HTTP connection pool) shared by all request threads,
+    # behind a circuit breaker and a bulkhead so a slow gateway cannot starve them
+    payment_service.configure_default_gateway(
+        circuit_breaker=resilience.CircuitBreaker(
+            error_rate=app.config['PAYMENT_BREAKER_ERROR_RATE'],
+            slow_call_seconds=app.config['PAYMENT_BREAKER_SLOW_CALL_SECONDS'],
+            open_seconds=app.config['PAYMENT_BREAKER_OPEN_SECONDS'],
+        ),
+        bulkhead=resilience.Bulkhead(app.config['PAYMENT_BULKHEAD_SIZE'], app.config['PAYMENT_BULKHEAD_WAIT']),
+        api_key=app.config['PAYMENT_GATEWAY_API_KEY'],
+        base_url=app.config['PAYMENT_GATEWAY_URL'],
+        live=app.config['PAYMENT_GATEWAY_LIVE'],
+        pool_size=app.config['PAYMENT_GATEWAY_POOL_SIZE'],
+        max_retries=app.config['PAYMENT_GATEWAY_MAX_RETRIES'],
+    )
+    
+    # Background threads start with the first request, so the CLI commands
+    # (which build the app too) never claim payment jobs or checkpoint
+    if app.config['BACKGROUND_SERVICES']:
+        app.before_request(lambda: start_background_services(app))
     
     # Register all route blueprints
     register_blueprints(app)
     
+    # Register command line entry points (flask --app app <command>)
+    register_commands(app)
+    
     return app
 
 
+_background_lock = threading.Lock()
+
+def start_background_services(app):
+    """Start the WAL checkpointer and payment workers for `app`, once."""
+    if app.extensions.get('background_services'):
+        return
+    with _background_lock:
+        if app.extensions.get('background_services'):
+            return
+        # Keep the WAL file from growing without bound
+        start_checkpointer(app.config['DB_CHECKPOINT_INTERVAL'])
+        # Drain queued late fee payments in the background
+        payment_queue.start_payment_workers(app.config['PAYMENT_WORKERS'], app.config['PAYMENT_POLL_INTERVAL'])
+        app.extensions['background_services'] = True
+
+
 if __name__ == '__main__':
     app = create_app()
     app.run(debug=True, host='0.0.0.0', port=5000)
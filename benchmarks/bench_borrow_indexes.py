@@ -0,0 +1,107 @@
+"""
+Benchmark: borrow_records hot queries before and after the index migrations.
+
+Builds a throwaway database with a large loan history (default 5M rows, mostly
+returned), times the patron/book lookups on the bare schema, applies the schema
+migrations and times them again.
+
+Usage:
+    python benchmarks/bench_borrow_indexes.py [--rows 5000000] [--patrons 200000]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+
+QUERIES = {
+    'borrow count': ('''
+        SELECT COUNT(*) FROM borrow_records WHERE patron_id = ? AND return_date IS NULL
+    ''', lambda p, b: (p,)),
+    'borrowed books': ('''
+        SELECT br.*, b.title, b.author FROM borrow_records br JOIN books b ON br.book_id = b.id
+        WHERE br.patron_id = ? AND br.return_date IS NULL ORDER BY br.borrow_date
+    ''', lambda p, b: (p,)),
+    'open loan lookup': ('''
+        SELECT * FROM borrow_records WHERE patron_id = ? AND book_id = ? AND return_date IS NULL
+    ''', lambda p, b: (p, b)),
+    'patron history': ('''
+        SELECT * FROM borrow_records WHERE patron_id = ? ORDER BY borrow_date
+    ''', lambda p, b: (p,)),
+}
+
+
+def populate(conn, rows, patrons, books):
+    """Fill books and borrow_records using recursive CTEs (no Python row loop)."""
+    conn.execute('''
+        WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < ?)
+        INSERT INTO books (title, author, isbn, total_copies, available_copies)
+        SELECT 'Title ' || i, 'Author ' || (i % 997), printf('%013d', i), 5, 5 FROM n
+    ''', (books,))
+    # Roughly 1 in 500 loans is still open
+    conn.execute('''
+        WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < ?)
+        INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date, return_date)
+        SELECT printf('%06d', i % ?), 1 + (i * 7919) % ?,
+               datetime('2020-01-01', '+' || (i % 2000) || ' days'),
+               datetime('2020-01-15', '+' || (i % 2000) || ' days'),
+               CASE WHEN i % 500 = 0 THEN NULL ELSE datetime('2020-01-10', '+' || (i % 2000) || ' days') END
+        FROM n
+    ''', (rows, patrons, books))
+    conn.commit()
+
+
+def time_queries(conn, samples):
+    results = {}
+    for name, (sql, params) in QUERIES.items():
+        start = time.perf_counter()
+        for patron_id, book_id in samples:
+            conn.execute(sql, params(patron_id, book_id)).fetchall()
+        results[name] = (time.perf_counter() - start) / len(samples) * 1000
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=5_000_000)
+    parser.add_argument('--patrons', type=int, default=200_000)
+    parser.add_argument('--books', type=int, default=100_000)
+    parser.add_argument('--samples', type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DATABASE = os.path.join(tmp, 'bench.db')
+        database.configure_pool(size=1)
+        # Base tables only; migrations are applied after the first timing run
+        migrations, database.MIGRATIONS = database.MIGRATIONS, []
+        database.init_database()
+        database.MIGRATIONS = migrations
+
+        with database.db_connection() as conn:
+            start = time.perf_counter()
+            populate(conn, args.rows, args.patrons, args.books)
+            print(f"Loaded {args.rows:,} loans in {time.perf_counter() - start:.1f}s")
+
+            samples = [(f"{(i * 104729) % args.patrons:06d}", 1 + (i * 31) % args.books) for i in range(args.samples)]
+            before = time_queries(conn, samples)
+
+            start = time.perf_counter()
+            database.apply_migrations(conn)
+            conn.execute('ANALYZE')
+            conn.commit()
+            print(f"Applied migrations in {time.perf_counter() - start:.1f}s")
+            after = time_queries(conn, samples)
+
+        print(f"\n{'query':<20}{'no index (ms)':>16}{'indexed (ms)':>16}{'speedup':>10}")
+        for name in QUERIES:
+            print(f"{name:<20}{before[name]:>16.2f}{after[name]:>16.3f}{before[name] / after[name]:>9.0f}x")
+        database._get_pool().close_all()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+Benchmark: nightly fee assessment over a large set of open loans.
+
+Builds a throwaway database with N open loans (default 10M, about half of them
+overdue) and times run_fee_assessment. Target: 10M loans in under a minute.
+
+Usage:
+    python benchmarks/bench_fee_assessment.py [--loans 10000000] [--profile fast] [--memory]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+from services.fee_engine import run_fee_assessment
+
+
+def populate(conn, loans, books):
+    """Fill books and open borrow_records with due dates spread over 60 days."""
+    conn.execute('''
+        WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < ?)
+        INSERT INTO books (title, author, isbn, total_copies, available_copies)
+        SELECT 'Title ' || i, 'Author', printf('%013d', i), 5, 5 FROM n
+    ''', (books,))
+    conn.execute('''
+        WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < ?)
+        INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date)
+        SELECT printf('%06d', i % 999983), 1 + i % ?,
+               strftime('%Y-%m-%dT%H:%M:%S', '2025-10-01', '+' || (i % 60) || ' days'),
+               strftime('%Y-%m-%dT%H:%M:%S', '2025-10-15', '+' || (i % 60) || ' days', '+' || (i % 86400) || ' seconds')
+        FROM n
+    ''', (loans, books))
+    conn.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--loans', type=int, default=10_000_000)
+    parser.add_argument('--books', type=int, default=100_000)
+    parser.add_argument('--profile', choices=list(database.STORAGE_PROFILES), default='fast')
+    parser.add_argument('--memory', action='store_true', help='Keep the database in RAM instead of a temp file.')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.configure_database(database.MEMORY_DATABASE if args.memory else os.path.join(tmp, 'bench.db'))
+        database.configure_pool(size=2, storage_profile=args.profile)
+        database.init_database()
+
+        start = time.perf_counter()
+        with database.db_connection() as conn:
+            populate(conn, args.loans, args.books)
+        print(f"Loaded {args.loans:,} open loans in {time.perf_counter() - start:.1f}s")
+
+        result = run_fee_assessment(date(2025, 11, 15))
+        rate = args.loans / result['elapsed_seconds'] if result['elapsed_seconds'] else 0
+        print(f"Assessed {result['assessed_loans']:,} overdue loans in {result['elapsed_seconds']:.2f}s "
+              f"({rate:,.0f} open loans/s)")
+        database.configure_database()
+
+
+if __name__ == '__main__':
+    main()
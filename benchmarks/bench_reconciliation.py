@@ -0,0 +1,74 @@
+"""
+Benchmark: payments ledger reconciliation throughput.
+
+Fills a throwaway ledger with pending charges and reconciles them against the
+simulated gateway (300ms per status call, asyncio.sleep) and, with --http,
+against the local fake gateway server over real HTTP (which does not know
+the generated transactions, so they come back as mismatches).
+
+Usage:
+    python benchmarks/bench_reconciliation.py [--payments 10000] [--concurrency 500 1000] [--http] [--memory]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+from services.async_payment_gateway import AsyncPaymentGateway
+from services.fake_payment_server import FakePaymentServer
+from services.reconciliation import RECONCILE_BATCH_SIZE, reconcile_payments
+
+
+def reset_ledger(count):
+    """Replace the ledger with `count` pending 10.50 charges."""
+    with database.db_connection() as conn:
+        conn.execute('DELETE FROM payments')
+        conn.execute('''
+            WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < ?)
+            INSERT INTO payments (transaction_id, kind, patron_id, book_id, amount, created_at)
+            SELECT 'txn_' || printf('%06d', i % 1000000) || '_' || i, 'payment', printf('%06d', i % 1000000), 1, 10.5,
+                   '2025-01-01' FROM n
+        ''', (count,))
+        conn.commit()
+
+
+def run(label, gateway, batch_size):
+    # The simulator cannot verify payments, so those runs leave the ledger alone
+    report = reconcile_payments(gateway, batch_size=batch_size, dry_run=gateway.base_url is None)
+    print(f"{label:<28}{report.checked:>10,}{report.elapsed_seconds:>12.2f}{report.verifications_per_second:>14,.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--payments', type=int, default=10_000)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[100, 500, 1000])
+    parser.add_argument('--batch-size', type=int, default=RECONCILE_BATCH_SIZE)
+    parser.add_argument('--http', action='store_true', help='Also reconcile against the fake HTTP server.')
+    parser.add_argument('--memory', action='store_true', help='Keep the database in RAM instead of a temp file.')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.configure_database(database.MEMORY_DATABASE if args.memory else os.path.join(tmp, 'bench.db'))
+        database.configure_pool(size=2)
+        database.init_database()
+
+        print(f"{'gateway':<28}{'payments':>10}{'seconds':>12}{'verified/s':>14}")
+        for concurrency in args.concurrency:
+            reset_ledger(args.payments)
+            run(f"simulated, {concurrency} in flight", AsyncPaymentGateway(max_in_flight=concurrency), args.batch_size)
+
+        if args.http:
+            with FakePaymentServer() as server:
+                for concurrency in args.concurrency:
+                    reset_ledger(args.payments)
+                    gateway = AsyncPaymentGateway(base_url=server.url, max_in_flight=concurrency)
+                    run(f"http, {concurrency} in flight", gateway, args.batch_size)
+        database.configure_database()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+In-process caching for the Library Management System
+A small thread-safe LRU cache with optional TTL and memory budget, used to
+keep hot, rarely-changing rows out of the database.
+"""
+
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+def approximate_size(value: Any) -> int:
+    """Rough in-memory size of a cached value (containers plus their direct items)."""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set)):
+        size += sum(sys.getsizeof(item) for item in value)
+    return size
+
+class LRUCache:
+    """
+    Thread-safe least-recently-used cache.
+
+    Entries are evicted when there are more than `max_entries` of them or their
+    approximate total size exceeds `max_bytes`, and expire `ttl` seconds after
+    being stored (None keeps them until evicted or invalidated).
+    """
+
+    def __init__(self, max_entries: int = 1024, max_bytes: Optional[int] = None,
+                 ttl: Optional[float] = None, clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()  # key -> (value, size, expires_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'invalidations': 0}
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Get a cached value, or `default` on a miss or expired entry."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return default
+            value, size, expires_at = entry
+            if expires_at is not None and self._clock() >= expires_at:
+                self._remove(key)
+                self._stats['expirations'] += 1
+                self._stats['misses'] += 1
+                return default
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return value
+
+    def set(self, key: Hashable, value: Any):
+        """Store a value, evicting least recently used entries to stay in budget."""
+        size = approximate_size(value)
+        expires_at = self._clock() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if self.max_bytes is not None and size > self.max_bytes:
+                return
+            self._entries[key] = (value, size, expires_at)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or (
+                    self.max_bytes is not None and self._bytes > self.max_bytes):
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self._stats['evictions'] += 1
+
+    def delete(self, key: Hashable):
+        """Invalidate one key."""
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+                self._stats['invalidations'] += 1
+
+    def clear(self):
+        """Drop every entry (counters are kept)."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self) -> Dict:
+        """Return size, memory use and hit/miss counters."""
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['misses']
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'ttl': self.ttl,
+                'hit_rate': round(self._stats['hits'] / lookups, 4) if lookups else 0.0,
+                **self._stats
+            }
@@ -0,0 +1,100 @@
+"""
+Command line entry points for the Library Management System.
+
+Registered on the Flask app, so they run with the app's database settings:
+    flask --app app export books --format csv --gzip -o books.csv.gz
+    flask --app app import-books catalog.csv --errors-out rejected.csv
+    flask --app app assess-fees --date 2025-11-01
+    flask --app app reconcile-payments --concurrency 500
+"""
+
+import csv
+import os
+import sys
+
+import click
+
+from services.export_service import EXPORT_FORMATS, EXPORT_BATCH_SIZE, export_table
+from services.fee_engine import run_fee_assessment
+from services.import_service import IMPORT_FORMATS, IMPORT_BATCH_SIZE, import_books, read_records
+from services.async_payment_gateway import AsyncPaymentGateway
+from services.reconciliation import RECONCILE_CONCURRENCY, RECONCILE_BATCH_SIZE, reconcile_payments
+from database import EXPORT_TABLES
+
+
+def register_commands(app):
+    """Register all CLI commands with the Flask app."""
+
+    @app.cli.command('export')
+    @click.argument('table', type=click.Choice(list(EXPORT_TABLES)))
+    @click.option('--format', 'fmt', type=click.Choice(EXPORT_FORMATS), default='ndjson', show_default=True)
+    @click.option('--gzip', 'compress', is_flag=True, help='Gzip-compress the output.')
+    @click.option('--batch-size', type=click.IntRange(min=1), default=EXPORT_BATCH_SIZE, show_default=True)
+    @click.option('-o', '--output', type=click.Path(dir_okay=False, writable=True),
+                  help='File to write (default: stdout).')
+    def export_command(table, fmt, compress, batch_size, output):
+        """Stream TABLE out as NDJSON or CSV."""
+        if output:
+            with open(output, 'wb') as out:
+                written = export_table(table, out, fmt, compress, batch_size)
+            click.echo(f"Exported {table} to {output} ({written:,} bytes).", err=True)
+        else:
+            export_table(table, sys.stdout.buffer, fmt, compress, batch_size)
+
+    @app.cli.command('import-books')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--format', 'fmt', type=click.Choice(IMPORT_FORMATS),
+                  help='Input format (default: from the file extension).')
+    @click.option('--batch-size', type=click.IntRange(min=1), default=IMPORT_BATCH_SIZE, show_default=True)
+    @click.option('--errors-out', type=click.Path(dir_okay=False, writable=True),
+                  help='Write rejected rows (row, error) to this CSV file.')
+    def import_books_command(path, fmt, batch_size, errors_out):
+        """Bulk-load books from a CSV or NDJSON file at PATH."""
+        if fmt is None:
+            fmt = 'csv' if os.path.splitext(path)[1].lower() == '.csv' else 'ndjson'
+        with open(path, encoding='utf-8', newline='') as stream:
+            report = import_books(read_records(stream, fmt), batch_size)
+
+        if errors_out:
+            with open(errors_out, 'w', encoding='utf-8', newline='') as out:
+                writer = csv.writer(out)
+                writer.writerow(['row', 'error'])
+                writer.writerows(report.errors)
+        click.echo(f"Imported {report.imported:,} of {report.total_rows:,} rows "
+                   f"({len(report.errors):,} rejected) in {report.elapsed_seconds:.2f}s "
+                   f"[{report.rows_per_second:,.0f} rows/s, {report.batches} batches].")
+
+    @app.cli.command('assess-fees')
+    @click.option('--date', 'assessed_on', type=click.DateTime(formats=['%Y-%m-%d']),
+                  help='Day to assess (default: today).')
+    def assess_fees_command(assessed_on):
+        """Assess late fees for every overdue open loan."""
+        result = run_fee_assessment(assessed_on.date() if assessed_on else None)
+        click.echo(f"Assessed {result['assessed_loans']:,} overdue loans for {result['assessed_on']} "
+                   f"in {result['elapsed_seconds']:.2f}s.")
+
+    @app.cli.command('reconcile-payments')
+    @click.option('--concurrency', type=click.IntRange(min=1), default=RECONCILE_CONCURRENCY, show_default=True,
+                  help='Status checks in flight at once.')
+    @click.option('--batch-size', type=click.IntRange(min=1), default=RECONCILE_BATCH_SIZE, show_default=True)
+    @click.option('--limit', type=click.IntRange(min=1), help='Check at most this many ledger rows.')
+    @click.option('--gateway-url', help='Gateway base URL (default: PAYMENT_GATEWAY_URL when '
+                                        'PAYMENT_GATEWAY_LIVE is set, else the simulated gateway).')
+    @click.option('--dry-run', is_flag=True, help='Report without updating the ledger.')
+    def reconcile_payments_command(concurrency, batch_size, limit, gateway_url, dry_run):
+        """Verify pending payments ledger rows against the payment gateway."""
+        if gateway_url is None and app.config['PAYMENT_GATEWAY_LIVE']:
+            gateway_url = app.config['PAYMENT_GATEWAY_URL']
+        if gateway_url is None and not dry_run:
+            click.echo("No live payment gateway configured: checking against the simulator "
+                       "without updating the ledger.", err=True)
+            dry_run = True
+        gateway = AsyncPaymentGateway(api_key=app.config['PAYMENT_GATEWAY_API_KEY'], base_url=gateway_url,
+                                      max_in_flight=concurrency)
+        report = reconcile_payments(gateway, batch_size=batch_size, limit=limit, dry_run=dry_run)
+        for mismatch in report.mismatches:
+            click.echo(f"MISMATCH {mismatch['kind']} {mismatch['transaction_id']}: {mismatch['message']}")
+        click.echo(f"Checked {report.checked:,} payments: {report.verified:,} verified, "
+                   f"{len(report.mismatches):,} mismatched, {len(report.errors):,} unreachable "
+                   f"in {report.elapsed_seconds:.2f}s [{report.verifications_per_second:,.0f}/s]."
+                   + (" Dry run: ledger not updated." if dry_run else ""))
@@ -3,119 +3,905 @@ Database module for Library Management System
 Handles all database operations and connections
 """
 
+import os
+import queue
 import sqlite3
-from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Tuple
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
 
-# Database configuration
-DATABASE = 'library.db'
+from cache import LRUCache
+
+# Database configuration. The location comes from create_app config, then the
+# LIBRARY_DATABASE environment variable, then library.db in the working directory.
+DEFAULT_DATABASE = 'library.db'
+# One in-memory database shared by every connection of the process. The memdb
+# VFS locks the whole database like a file does, so busy_timeout applies.
+# (Shared-cache URIs such as 'file::memory:?cache=shared' also work, but their
+# table locks fail at once instead of waiting: single-threaded use only.)
+MEMORY_DATABASE = 'file:/library?vfs=memdb'
+
+def memory_database_uri(name: str) -> str:
+    """URI of a named memdb database, shared by all connections of this process."""
+    return f'file:/{name}?vfs=memdb'
+
+def is_memory_database(path: str) -> bool:
+    """Whether `path` names an in-memory database rather than a file."""
+    return (path == ':memory:' or path.startswith('file::memory:')
+            or (path.startswith('file:') and ('vfs=memdb' in path or 'mode=memory' in path)))
+
+def default_database_path() -> str:
+    """
+    LIBRARY_DATABASE or library.db, made unique per pytest-xdist worker.
+
+    Parallel test workers are separate processes: in-memory databases are
+    already private to each, files get the worker ID (gw0, gw1...) inserted.
+    """
+    path = os.environ.get('LIBRARY_DATABASE') or DEFAULT_DATABASE
+    if path == ':memory:':
+        path = MEMORY_DATABASE
+    worker = os.environ.get('PYTEST_XDIST_WORKER')
+    if not worker or is_memory_database(path):
+        return path
+    location, query = path.split('?', 1) if '?' in path else (path, None)
+    root, ext = os.path.splitext(location)
+    location = f"{root}.{worker}{ext}"
+    return f"{location}?{query}" if query else location
+
+DATABASE = default_database_path()
+
+# Connection pool defaults (overridable through create_app config)
+POOL_SIZE = 5
+POOL_TIMEOUT = 5.0
+
+# Storage profiles: PRAGMAs applied to every new connection.
+# WAL lets readers proceed while a writer commits. "safe" fsyncs on every
+# commit; "fast" only fsyncs at checkpoints, so a power loss may drop the most
+# recent commits but never corrupts the database.
+STORAGE_PROFILES = {
+    'safe': {
+        'journal_mode': 'WAL',
+        'synchronous': 'FULL',
+        'cache_size': -16000,        # KiB (negative) -> 16 MB page cache
+        'mmap_size': 0,
+        'temp_store': 'DEFAULT',
+        'busy_timeout': 5000,        # ms
+    },
+    'fast': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -64000,        # 64 MB page cache
+        'mmap_size': 268435456,      # 256 MB memory-mapped I/O
+        'temp_store': 'MEMORY',
+        'busy_timeout': 5000,
+    },
+}
+STORAGE_PROFILE = 'safe'
+CHECKPOINT_INTERVAL = 60.0  # seconds between WAL checkpoints, 0 disables
+
+def resolve_storage_profile(profile: str = STORAGE_PROFILE, overrides: Optional[Dict] = None) -> Dict:
+    """Get the PRAGMA settings for a named storage profile, with optional overrides."""
+    if profile not in STORAGE_PROFILES:
+        raise ValueError(f"Unknown storage profile '{profile}'. Choose from: {', '.join(STORAGE_PROFILES)}.")
+    pragmas = dict(STORAGE_PROFILES[profile])
+    pragmas.update(overrides or {})
+    return pragmas
+
+# Read-through book cache defaults (overridable through create_app config).
+# Catalog fields rarely change and are cached long; available_copies changes on
+# every borrow/return and has its own short-lived cache.
+BOOK_CACHE_MAX_ENTRIES = 10000
+BOOK_CACHE_MAX_BYTES = 16 * 1024 * 1024
+BOOK_CACHE_TTL = 300.0
+AVAILABILITY_CACHE_TTL = 2.0
+
+class PoolTimeoutError(sqlite3.OperationalError):
+    """Raised when no pooled connection becomes free within the wait timeout."""
+
+class PooledConnection:
+    """Wrap a pooled sqlite3 connection so close() hands it back to the pool."""
+
+    def __init__(self, conn, pool):
+        self._conn = conn
+        self._pool = pool
+
+    def __getattr__(self, name):
+        # Delegate everything else to the underlying sqlite3 connection
+        return getattr(self._conn, name)
+
+    def close(self):
+        """Return the connection to the pool instead of closing it."""
+        if self._conn is not None:
+            self._pool.release(self._conn)
+            self._conn = None
+
+class ConnectionPool:
+    """
+    Bounded, thread-safe pool of SQLite connections with checkout/return semantics.
+
+    At most `size` connections are opened. A checkout takes an idle connection
+    (hit), opens a new one while under the limit (miss), or waits up to
+    `timeout` seconds for another thread to return one.
+    """
+
+    def __init__(self, database: str, size: int = POOL_SIZE, timeout: float = POOL_TIMEOUT,
+                 pragmas: Optional[Dict] = None):
+        if size < 1:
+            raise ValueError("Pool size must be at least 1.")
+        self.database = database
+        self.size = size
+        self.timeout = timeout
+        self.pragmas = pragmas if pragmas is not None else resolve_storage_profile()
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._stats = {'hits': 0, 'misses': 0, 'waits': 0, 'timeouts': 0}
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.database, timeout=self.timeout, check_same_thread=False,
+                               uri=self.database.startswith('file:'))
+        conn.row_factory = sqlite3.Row  # This enables column access by name
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def _count(self, key: str):
+        with self._lock:
+            self._stats[key] += 1
+
+    def acquire(self) -> PooledConnection:
+        """Check a connection out of the pool."""
+        try:
+            conn = self._idle.get_nowait()
+            self._count('hits')
+            return PooledConnection(conn, self)
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            can_open = self._created < self.size
+            if can_open:
+                self._created += 1
+                self._stats['misses'] += 1
+        if can_open:
+            try:
+                return PooledConnection(self._connect(), self)
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+
+        try:
+            conn = self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            self._count('timeouts')
+            raise PoolTimeoutError(f"No database connection available after {self.timeout}s.")
+        self._count('waits')
+        return PooledConnection(conn, self)
+
+    def release(self, conn: sqlite3.Connection):
+        """Return a connection to the pool, discarding any uncommitted work."""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            # A broken connection is dropped so a fresh one can replace it
+            with self._lock:
+                self._created -= 1
+            conn.close()
+            return
+        self._idle.put(conn)
+
+    def close_all(self):
+        """Close every idle connection; checked-out ones close when released."""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
+
+    def stats(self) -> Dict:
+        """Return pool size and hit/miss counters."""
+        with self._lock:
+            return {
+                'size': self.size,
+                'open': self._created,
+                'idle': self._idle.qsize(),
+                **self._stats
+            }
+
+_pool = None
+_pool_lock = threading.Lock()
+# An in-memory database lives only while a connection to it is open; this one
+# keeps it alive across pool resets (close_all) until another database is used
+_anchor = None
+
+def _open_pool(size: int, timeout: float, pragmas: Optional[Dict]) -> ConnectionPool:
+    """Replace the shared pool with one for the current DATABASE. Hold _pool_lock."""
+    global _pool, _anchor
+    if _anchor is not None and _anchor[0] != DATABASE:
+        _anchor[1].close()
+        _anchor = None
+    if _anchor is None and is_memory_database(DATABASE):
+        _anchor = (DATABASE, sqlite3.connect(DATABASE, check_same_thread=False, uri=True))
+    if _pool is not None:
+        _pool.close_all()
+    _pool = ConnectionPool(DATABASE, size=size, timeout=timeout, pragmas=pragmas)
+    return _pool
+
+def configure_pool(size: int = POOL_SIZE, timeout: float = POOL_TIMEOUT,
+                   storage_profile: str = STORAGE_PROFILE, pragmas: Optional[Dict] = None) -> ConnectionPool:
+    """(Re)create the shared connection pool for the current DATABASE."""
+    settings = resolve_storage_profile(storage_profile, pragmas)
+    with _pool_lock:
+        pool = _open_pool(size, timeout, settings)
+    clear_book_cache()
+    return pool
+
+def configure_database(path: Optional[str] = None) -> str:
+    """
+    Point the module at another database and drop everything tied to the old one.
+
+    The pool is recreated with its current settings and the book caches are
+    cleared. Nothing is created until the first connection is checked out.
+
+    Args:
+        path: File path, ':memory:', or an SQLite URI such as
+            memory_database_uri(name); None for default_database_path()
+
+    Returns:
+        str: The database now in use
+    """
+    global DATABASE
+    path = path or default_database_path()
+    with _pool_lock:
+        DATABASE = MEMORY_DATABASE if path == ':memory:' else path
+        if _pool is None:
+            _open_pool(POOL_SIZE, POOL_TIMEOUT, resolve_storage_profile())
+        else:
+            _open_pool(_pool.size, _pool.timeout, _pool.pragmas)
+    clear_book_cache()
+    return DATABASE
+
+def _get_pool() -> ConnectionPool:
+    with _pool_lock:
+        if _pool is None or _pool.database != DATABASE:
+            clear_book_cache()
+            if _pool is not None:
+                return _open_pool(_pool.size, _pool.timeout, _pool.pragmas)
+            return _open_pool(POOL_SIZE, POOL_TIMEOUT, resolve_storage_profile())
+        return _pool
+
+def get_pool_stats() -> Dict:
+    """Get hit/miss counters of the shared connection pool."""
+    return _get_pool().stats()
 
 def get_db_connection():
-    """Get a database connection."""
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row  # This enables column access by name
-    return conn
+    """Get a database connection from the pool. Call close() to return it."""
+    return _get_pool().acquire()
+
+@contextmanager
+def db_connection():
+    """Context manager that checks a connection out and always returns it."""
+    conn = get_db_connection()
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+# Exports stream for as long as the client keeps reading, so they use their
+# own connections, opened outside the pool and capped separately
+EXPORT_CONNECTIONS = 2
+_export_slots = threading.BoundedSemaphore(EXPORT_CONNECTIONS)
+
+def configure_export_connections(limit: int = EXPORT_CONNECTIONS):
+    """Set how many exports may stream at once."""
+    global _export_slots
+    if limit < 1:
+        raise ValueError("Export connection limit must be at least 1.")
+    _export_slots = threading.BoundedSemaphore(limit)
+
+@contextmanager
+def export_connection():
+    """
+    Open a dedicated connection for a long-running export and close it afterwards.
+
+    It never takes a pooled connection. When every export slot is busy this
+    waits up to the pool timeout, then raises PoolTimeoutError.
+    """
+    pool = _get_pool()
+    slots = _export_slots
+    if not slots.acquire(timeout=pool.timeout):
+        raise PoolTimeoutError(f"No export connection available after {pool.timeout}s.")
+    try:
+        conn = pool._connect()
+        try:
+            yield conn
+        finally:
+            conn.close()
+    finally:
+        slots.release()
+
+class WalCheckpointer:
+    """Background thread that checkpoints the WAL file every `interval` seconds."""
+
+    def __init__(self, interval: float = CHECKPOINT_INTERVAL, mode: str = 'PASSIVE'):
+        self.interval = interval
+        self.mode = mode
+        self.checkpoints = 0
+        self.failures = 0
+        self.last_result = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def checkpoint(self) -> Optional[Dict]:
+        """Run one checkpoint and record its result."""
+        try:
+            with db_connection() as conn:
+                busy, log_frames, checkpointed = conn.execute(f'PRAGMA wal_checkpoint({self.mode})').fetchone()
+        except sqlite3.Error:
+            self.failures += 1
+            return None
+        self.checkpoints += 1
+        self.last_result = {
+            'busy': bool(busy),
+            'log_frames': log_frames,
+            'checkpointed_frames': checkpointed,
+            'at': datetime.now().isoformat()
+        }
+        return self.last_result
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.checkpoint()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='wal-checkpointer', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+_checkpointer = None
+
+def start_checkpointer(interval: float = CHECKPOINT_INTERVAL) -> Optional[WalCheckpointer]:
+    """Start (or restart) the periodic WAL checkpoint thread; 0 disables it."""
+    global _checkpointer
+    stop_checkpointer()
+    if interval and interval > 0:
+        _checkpointer = WalCheckpointer(interval)
+        _checkpointer.start()
+    return _checkpointer
+
+def stop_checkpointer():
+    """Stop the periodic WAL checkpoint thread if it is running."""
+    global _checkpointer
+    if _checkpointer is not None:
+        _checkpointer.stop()
+        _checkpointer = None
+
+def get_wal_stats() -> Dict:
+    """Get journal mode, current WAL file size and checkpoint counters."""
+    with db_connection() as conn:
+        journal_mode = conn.execute('PRAGMA journal_mode').fetchone()[0]
+        page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+        # The file SQLite actually opened: DATABASE may be a URI with a query string
+        path = next(row['file'] for row in conn.execute('PRAGMA database_list') if row['name'] == 'main')
+    wal_path = path + '-wal' if path and not is_memory_database(DATABASE) else None
+    return {
+        'journal_mode': journal_mode,
+        'wal_bytes': os.path.getsize(wal_path) if wal_path and os.path.exists(wal_path) else 0,
+        'page_size': page_size,
+        'checkpoint_interval': _checkpointer.interval if _checkpointer else 0,
+        'checkpoints': _checkpointer.checkpoints if _checkpointer else 0,
+        'checkpoint_failures': _checkpointer.failures if _checkpointer else 0,
+        'last_checkpoint': _checkpointer.last_result if _checkpointer else None
+    }
 
 def init_database():
     """Initialize the database with required tables."""
-    conn = get_db_connection()
-    
-    # Create books table
+    with db_connection() as conn:
+        # Create books table
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS books (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                title TEXT NOT NULL,
+                author TEXT NOT NULL,
+                isbn TEXT UNIQUE NOT NULL,
+                total_copies INTEGER NOT NULL,
+                available_copies INTEGER NOT NULL
+            )
+        ''')
+
+        # Create borrow_records table
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS borrow_records (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                patron_id TEXT NOT NULL,
+                book_id INTEGER NOT NULL,
+                borrow_date TEXT NOT NULL,
+                due_date TEXT NOT NULL,
+                return_date TEXT,
+                FOREIGN KEY (book_id) REFERENCES books (id)
+            )
+        ''')
+
+        conn.commit()
+
+        # Bring the schema up to date
+        apply_migrations(conn)
+
+def _create_books_fts(conn):
+    """Create the trigram full-text index over book titles and authors, kept in sync by triggers."""
+    try:
+        conn.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5(
+                title, author, content='books', content_rowid='id', tokenize='trigram'
+            )
+        ''')
+    except sqlite3.OperationalError:
+        # SQLite built without FTS5 or older than 3.34 (no trigram tokenizer):
+        # search_books_fulltext() reports the index as unavailable and callers scan
+        return
     conn.execute('''
-        CREATE TABLE IF NOT EXISTS books (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            title TEXT NOT NULL,
-            author TEXT NOT NULL,
-            isbn TEXT UNIQUE NOT NULL,
-            total_copies INTEGER NOT NULL,
-            available_copies INTEGER NOT NULL
-        )
+        CREATE TRIGGER IF NOT EXISTS books_fts_insert AFTER INSERT ON books BEGIN
+            INSERT INTO books_fts (rowid, title, author) VALUES (new.id, new.title, new.author);
+        END
     ''')
-    
-    # Create borrow_records table
     conn.execute('''
-        CREATE TABLE IF NOT EXISTS borrow_records (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            patron_id TEXT NOT NULL,
-            book_id INTEGER NOT NULL,
-            borrow_date TEXT NOT NULL,
-            due_date TEXT NOT NULL,
-            return_date TEXT,
-            FOREIGN KEY (book_id) REFERENCES books (id)
+        CREATE TRIGGER IF NOT EXISTS books_fts_delete AFTER DELETE ON books BEGIN
+            INSERT INTO books_fts (books_fts, rowid, title, author) VALUES ('delete', old.id, old.title, old.author);
+        END
+    ''')
+    # Only title/author changes touch the index, not availability updates
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS books_fts_update AFTER UPDATE OF title, author ON books BEGIN
+            INSERT INTO books_fts (books_fts, rowid, title, author) VALUES ('delete', old.id, old.title, old.author);
+            INSERT INTO books_fts (rowid, title, author) VALUES (new.id, new.title, new.author);
+        END
+    ''')
+    conn.execute("INSERT INTO books_fts (books_fts) VALUES ('rebuild')")
+
+def _close_duplicate_open_loans(conn):
+    """
+    Keep only the earliest open loan of each (patron, book) pair so the unique
+    open-loan index can be built. Duplicates came from racing borrows that each
+    took a copy: the copy goes back and the extra loan is closed at its borrow
+    date, so it never accrues a late fee.
+    """
+    duplicates = conn.execute('''
+        SELECT id, book_id FROM borrow_records b
+        WHERE return_date IS NULL AND EXISTS (
+            SELECT 1 FROM borrow_records e
+            WHERE e.patron_id = b.patron_id AND e.book_id = b.book_id AND e.return_date IS NULL AND e.id < b.id
+        )
+    ''').fetchall()
+    for loan_id, book_id in duplicates:
+        conn.execute('UPDATE borrow_records SET return_date = borrow_date WHERE id = ?', (loan_id,))
+        conn.execute('''
+            UPDATE books SET available_copies = MIN(total_copies, available_copies + 1) WHERE id = ?
+        ''', (book_id,))
+
+# Ordered schema migrations: (version, description, statements).
+# A statement is either SQL text or a callable taking the connection.
+# Append new entries with the next version number; never edit applied ones.
+MIGRATIONS = [
+    (1, 'Indexes for open-loan and history lookups on borrow_records', [
+        # Open loans per patron: borrow count, duplicate check, return lookup
+        '''CREATE INDEX IF NOT EXISTS idx_borrow_records_patron_open
+           ON borrow_records (patron_id, book_id, borrow_date) WHERE return_date IS NULL''',
+        # Open loans per book
+        '''CREATE INDEX IF NOT EXISTS idx_borrow_records_book_open
+           ON borrow_records (book_id, patron_id) WHERE return_date IS NULL''',
+        # Full borrowing history per patron, already in report order
+        '''CREATE INDEX IF NOT EXISTS idx_borrow_records_patron_history
+           ON borrow_records (patron_id, borrow_date)''',
+    ]),
+    (2, 'Trigram full-text index for title/author search', [
+        _create_books_fts,
+    ]),
+    (3, 'Title index for keyset-paginated catalog', [
+        'CREATE INDEX IF NOT EXISTS idx_books_title ON books (title, id)',
+    ]),
+    (4, 'Nightly fee assessments and open-loan due date index', [
+        '''CREATE TABLE IF NOT EXISTS fee_assessments (
+               assessed_on TEXT NOT NULL,
+               borrow_record_id INTEGER NOT NULL,
+               patron_id TEXT NOT NULL,
+               book_id INTEGER NOT NULL,
+               due_date TEXT NOT NULL,
+               days_overdue INTEGER NOT NULL,
+               fee_amount REAL NOT NULL,
+               PRIMARY KEY (assessed_on, borrow_record_id)
+           )''',
+        '''CREATE INDEX IF NOT EXISTS idx_fee_assessments_patron
+           ON fee_assessments (assessed_on, patron_id)''',
+        # Overdue open loans are a range scan: ISO due_date < 'YYYY-MM-DD' of today
+        '''CREATE INDEX IF NOT EXISTS idx_borrow_records_open_due
+           ON borrow_records (due_date) WHERE return_date IS NULL''',
+    ]),
+    (5, 'Materialised per-patron open loan counts and one open loan per (patron, book)', [
+        _close_duplicate_open_loans,
+        '''CREATE TABLE IF NOT EXISTS patron_loan_counts (
+               patron_id TEXT PRIMARY KEY,
+               open_loans INTEGER NOT NULL DEFAULT 0 CHECK (open_loans >= 0)
+           ) WITHOUT ROWID''',
+        '''INSERT INTO patron_loan_counts (patron_id, open_loans)
+           SELECT patron_id, COUNT(*) FROM borrow_records WHERE return_date IS NULL GROUP BY patron_id''',
+        '''CREATE UNIQUE INDEX IF NOT EXISTS uq_borrow_records_open_loan
+           ON borrow_records (patron_id, book_id) WHERE return_date IS NULL''',
+        # Triggers keep the counts right for every writer, transactional or not
+        '''CREATE TRIGGER IF NOT EXISTS patron_loan_counts_borrow
+           AFTER INSERT ON borrow_records WHEN new.return_date IS NULL BEGIN
+               INSERT INTO patron_loan_counts (patron_id, open_loans) VALUES (new.patron_id, 1)
+               ON CONFLICT (patron_id) DO UPDATE SET open_loans = open_loans + 1;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS patron_loan_counts_return
+           AFTER UPDATE OF return_date ON borrow_records
+           WHEN old.return_date IS NULL AND new.return_date IS NOT NULL BEGIN
+               UPDATE patron_loan_counts SET open_loans = open_loans - 1 WHERE patron_id = new.patron_id;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS patron_loan_counts_delete
+           AFTER DELETE ON borrow_records WHEN old.return_date IS NULL BEGIN
+               UPDATE patron_loan_counts SET open_loans = open_loans - 1 WHERE patron_id = old.patron_id;
+           END''',
+    ]),
+    (6, 'Persistent payment job queue', [
+        '''CREATE TABLE IF NOT EXISTS payment_jobs (
+               id INTEGER PRIMARY KEY AUTOINCREMENT,
+               idempotency_key TEXT NOT NULL UNIQUE,
+               patron_id TEXT NOT NULL,
+               book_id INTEGER NOT NULL,
+               status TEXT NOT NULL DEFAULT 'queued'
+                   CHECK (status IN ('queued', 'processing', 'succeeded', 'failed')),
+               attempts INTEGER NOT NULL DEFAULT 0,
+               message TEXT,
+               transaction_id TEXT,
+               created_at TEXT NOT NULL,
+               updated_at TEXT NOT NULL
+           )''',
+        # Workers claim the oldest queued job; the partial index stays tiny
+        '''CREATE INDEX IF NOT EXISTS idx_payment_jobs_queued
+           ON payment_jobs (id) WHERE status = 'queued' ''',
+        '''CREATE INDEX IF NOT EXISTS idx_payment_jobs_processing
+           ON payment_jobs (updated_at) WHERE status = 'processing' ''',
+    ]),
+    (7, 'Payments ledger for gateway reconciliation', [
+        '''CREATE TABLE IF NOT EXISTS payments (
+               id INTEGER PRIMARY KEY AUTOINCREMENT,
+               transaction_id TEXT NOT NULL,
+               kind TEXT NOT NULL CHECK (kind IN ('payment', 'refund')),
+               patron_id TEXT,
+               book_id INTEGER,
+               amount REAL NOT NULL,
+               status TEXT NOT NULL DEFAULT 'pending'
+                   CHECK (status IN ('pending', 'verified', 'mismatch')),
+               gateway_status TEXT,
+               gateway_amount REAL,
+               message TEXT,
+               created_at TEXT NOT NULL,
+               verified_at TEXT
+           )''',
+        '''CREATE UNIQUE INDEX IF NOT EXISTS uq_payments_charge
+           ON payments (transaction_id) WHERE kind = 'payment' ''',
+        # Reconciliation walks pending rows in id order
+        '''CREATE INDEX IF NOT EXISTS idx_payments_pending
+           ON payments (id) WHERE status = 'pending' ''',
+    ]),
+    (8, 'Per-book allocation of payments', [
+        '''CREATE TABLE IF NOT EXISTS payment_allocations (
+               transaction_id TEXT NOT NULL,
+               book_id INTEGER NOT NULL,
+               patron_id TEXT NOT NULL,
+               borrow_record_id INTEGER,
+               amount REAL NOT NULL,
+               PRIMARY KEY (transaction_id, book_id)
+           ) WITHOUT ROWID''',
+        '''CREATE INDEX IF NOT EXISTS idx_payment_allocations_loan
+           ON payment_allocations (borrow_record_id)''',
+        '''CREATE INDEX IF NOT EXISTS idx_payments_refunds
+           ON payments (transaction_id, book_id) WHERE kind = 'refund' ''',
+        # Single-book payments recorded before allocations existed
+        '''INSERT OR IGNORE INTO payment_allocations (transaction_id, book_id, patron_id, borrow_record_id, amount)
+           SELECT p.transaction_id, p.book_id, p.patron_id,
+                  (SELECT br.id FROM borrow_records br
+                   WHERE br.patron_id = p.patron_id AND br.book_id = p.book_id AND br.borrow_date <= p.created_at
+                   ORDER BY br.borrow_date DESC LIMIT 1),
+                  p.amount
+           FROM payments p WHERE p.kind = 'payment' AND p.book_id IS NOT NULL AND p.patron_id IS NOT NULL''',
+    ]),
+    (9, 'Idempotency keys and patron lookups for payments', [
+        'ALTER TABLE payments ADD COLUMN idempotency_key TEXT',
+        '''CREATE UNIQUE INDEX IF NOT EXISTS uq_payments_idempotency_key
+           ON payments (idempotency_key) WHERE idempotency_key IS NOT NULL''',
+        '''CREATE INDEX IF NOT EXISTS idx_payments_patron_book
+           ON payments (patron_id, book_id)''',
+    ]),
+    (10, 'Idempotency keys claimed before the gateway is called', [
+        '''CREATE TABLE IF NOT EXISTS payment_requests (
+               idempotency_key TEXT PRIMARY KEY,
+               patron_id TEXT NOT NULL,
+               book_id INTEGER,
+               status TEXT NOT NULL DEFAULT 'pending'
+                   CHECK (status IN ('pending', 'succeeded', 'failed')),
+               transaction_id TEXT,
+               message TEXT,
+               created_at TEXT NOT NULL,
+               updated_at TEXT NOT NULL
+           )''',
+        '''INSERT OR IGNORE INTO payment_requests
+               (idempotency_key, patron_id, book_id, status, transaction_id, created_at, updated_at)
+           SELECT idempotency_key, patron_id, book_id, 'succeeded', transaction_id, created_at, created_at
+           FROM payments WHERE kind = 'payment' AND idempotency_key IS NOT NULL AND patron_id IS NOT NULL''',
+    ]),
+    (11, 'Backoff for payment jobs retried while the gateway is unavailable', [
+        'ALTER TABLE payment_jobs ADD COLUMN available_at TEXT',
+    ]),
+    (12, 'Catalog version shared by every process using the database', [
+        # One row, bumped by triggers in the writing transaction; the token
+        # keeps versions of different database files from colliding
+        '''CREATE TABLE IF NOT EXISTS catalog_version (
+               id INTEGER PRIMARY KEY CHECK (id = 1),
+               token TEXT NOT NULL,
+               version INTEGER NOT NULL,
+               modified_at REAL NOT NULL
+           )''',
+        '''INSERT OR IGNORE INTO catalog_version (id, token, version, modified_at)
+           VALUES (1, lower(hex(randomblob(4))), 0, (julianday('now') - 2440587.5) * 86400.0)''',
+        *[f'''CREATE TRIGGER IF NOT EXISTS catalog_version_{event.lower()}
+              AFTER {event} ON books BEGIN
+                  UPDATE catalog_version SET version = version + 1,
+                         modified_at = (julianday('now') - 2440587.5) * 86400.0
+                  WHERE id = 1;
+              END''' for event in ('INSERT', 'UPDATE', 'DELETE')],
+    ]),
+]
+
+def get_schema_version(conn) -> int:
+    """Get the highest applied migration version (0 for a fresh database)."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TEXT NOT NULL
         )
     ''')
-    
-    conn.commit()
-    conn.close()
+    return conn.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version').fetchone()[0]
 
-def add_sample_data():
-    """Add sample data to the database if it's empty."""
-    conn = get_db_connection()
-    book_count = conn.execute('SELECT COUNT(*) as count FROM books').fetchone()['count']
-    
-    if book_count == 0:
-        # Add sample books
-        sample_books = [
-            ('The Great Gatsby', 'F. Scott Fitzgerald', '9780743273565', 3),
-            ('To Kill a Mockingbird', 'Harper Lee', '9780061120084', 2),
-            ('1984', 'George Orwell', '9780451524935', 1)
-        ]
-        
-        for title, author, isbn, copies in sample_books:
+def apply_migrations(conn) -> int:
+    """
+    Apply every pending migration in order, each in its own transaction.
+
+    Returns:
+        int: Schema version after migrating
+    """
+    version = get_schema_version(conn)
+    conn.commit()
+    for target, description, statements in MIGRATIONS:
+        if target <= version:
+            continue
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Another process may have migrated while we waited for the lock
+            if get_schema_version(conn) >= target:
+                conn.rollback()
+                continue
+            for statement in statements:
+                if callable(statement):
+                    statement(conn)
+                else:
+                    conn.execute(statement)
             conn.execute('''
-                INSERT INTO books (title, author, isbn, total_copies, available_copies)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (title, author, isbn, copies, copies))
-        
-        # Make 1984 unavailable by adding a borrow record
-        conn.execute('''
-            INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date)
-            VALUES (?, ?, ?, ?)
-        ''', ('123456', 3, 
-              (datetime.now() - timedelta(days=5)).isoformat(),
-              (datetime.now() + timedelta(days=9)).isoformat()))
-        
-        # Update available copies for 1984
-        conn.execute('UPDATE books SET available_copies = 0 WHERE id = 3')
-        
-        conn.commit()
-    
-    conn.close()
+                INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)
+            ''', (target, description, datetime.now().isoformat()))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        version = target
+    return get_schema_version(conn)
 
 # Helper Functions for Database Operations
 
 def get_all_books() -> List[Dict]:
     """Get all books from the database."""
-    conn = get_db_connection()
-    books = conn.execute('SELECT * FROM books ORDER BY title').fetchall()
-    conn.close()
+    with db_connection() as conn:
+        books = conn.execute('SELECT * FROM books ORDER BY title').fetchall()
+    return [dict(book) for book in books]
+
+def get_books_page(limit: int, after: Optional[Tuple[str, int]] = None) -> List[Dict]:
+    """
+    Get one page of books ordered by (title, id) using keyset pagination.
+
+    Args:
+        limit: Maximum number of books to return
+        after: (title, id) of the last book on the previous page, None for the first page
+    """
+    with db_connection() as conn:
+        if after is None:
+            books = conn.execute('''
+                SELECT * FROM books ORDER BY title, id LIMIT ?
+            ''', (limit,)).fetchall()
+        else:
+            books = conn.execute('''
+                SELECT * FROM books WHERE (title, id) > (?, ?) ORDER BY title, id LIMIT ?
+            ''', (after[0], after[1], limit)).fetchall()
     return [dict(book) for book in books]
 
+# Tables that may be streamed out by export, with their column order
+EXPORT_TABLES = {
+    'books': ['id', 'title', 'author', 'isbn', 'total_copies', 'available_copies'],
+    'borrow_records': ['id', 'patron_id', 'book_id', 'borrow_date', 'due_date', 'return_date'],
+}
+
+def iter_table_rows(table: str, batch_size: int = 1000) -> Iterator[List[tuple]]:
+    """
+    Stream a whole table in id order, one batch of row tuples at a time.
+
+    Rows are pulled from a single cursor with fetchmany, so memory stays
+    bounded by batch_size however large the table is. The export connection
+    is held until the generator is exhausted or closed; a slow download
+    never ties up the request pool.
+    """
+    if table not in EXPORT_TABLES:
+        raise ValueError(f"Unknown table '{table}'.")
+    columns = ', '.join(EXPORT_TABLES[table])
+    with export_connection() as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = None  # plain tuples, cheaper than sqlite3.Row
+        cursor.execute(f'SELECT {columns} FROM {table} ORDER BY id')
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
+        cursor.close()
+
+_book_cache = LRUCache(BOOK_CACHE_MAX_ENTRIES, BOOK_CACHE_MAX_BYTES, BOOK_CACHE_TTL)
+_isbn_cache = LRUCache(BOOK_CACHE_MAX_ENTRIES, BOOK_CACHE_MAX_BYTES // 4, BOOK_CACHE_TTL)
+_availability_cache = LRUCache(BOOK_CACHE_MAX_ENTRIES, BOOK_CACHE_MAX_BYTES // 4, AVAILABILITY_CACHE_TTL)
+
+def configure_book_cache(max_entries: int = BOOK_CACHE_MAX_ENTRIES, max_bytes: int = BOOK_CACHE_MAX_BYTES,
+                         ttl: float = BOOK_CACHE_TTL, availability_ttl: float = AVAILABILITY_CACHE_TTL):
+    """Resize the book caches; max_entries 0 disables caching."""
+    global _book_cache, _isbn_cache, _availability_cache
+    _book_cache = LRUCache(max_entries, max_bytes, ttl)
+    _isbn_cache = LRUCache(max_entries, max_bytes // 4, ttl)
+    _availability_cache = LRUCache(max_entries, max_bytes // 4, availability_ttl)
+
+def get_catalog_version() -> Tuple[str, float]:
+    """
+    Get the current catalog version token and its last-modified timestamp.
+
+    Triggers on books keep both in the database (migration 12), so writes made
+    by other processes change the version too. One primary-key read.
+    """
+    with db_connection() as conn:
+        row = conn.execute('SELECT token, version, modified_at FROM catalog_version WHERE id = 1').fetchone()
+    return f"{row['token']}-{row['version']}", row['modified_at']
+
+def clear_book_cache():
+    """Drop every cached book, e.g. after pointing at another database."""
+    _book_cache.clear()
+    _isbn_cache.clear()
+    _availability_cache.clear()
+
+def invalidate_book(book_id: Optional[int] = None, isbn: Optional[str] = None):
+    """
+    Invalidation hook for any write that changes a book's catalog fields.
+    Call after commit from every function that inserts or updates books.
+    """
+    if book_id is not None:
+        _book_cache.delete(book_id)
+        _availability_cache.delete(book_id)
+    if isbn is not None:
+        _isbn_cache.delete(isbn)
+
+def invalidate_book_availability(book_id: int):
+    """Invalidation hook for writes that only change available_copies."""
+    _availability_cache.delete(book_id)
+
+def get_book_cache_stats() -> Dict:
+    """Get hit-rate and memory counters of the book caches."""
+    return {
+        'books': _book_cache.stats(),
+        'isbn': _isbn_cache.stats(),
+        'availability': _availability_cache.stats()
+    }
+
+def _cache_book(book: Dict):
+    static = {key: value for key, value in book.items() if key != 'available_copies'}
+    _book_cache.set(book['id'], static)
+    _isbn_cache.set(book['isbn'], book['id'])
+    _availability_cache.set(book['id'], book['available_copies'])
+
 def get_book_by_id(book_id: int) -> Optional[Dict]:
-    """Get a specific book by ID."""
-    conn = get_db_connection()
-    book = conn.execute('SELECT * FROM books WHERE id = ?', (book_id,)).fetchone()
-    conn.close()
-    return dict(book) if book else None
+    """Get a specific book by ID (read-through cached)."""
+    static = _book_cache.get(book_id)
+    if static is not None:
+        available = _availability_cache.get(book_id)
+        if available is None:
+            # Only the volatile column needs refreshing
+            with db_connection() as conn:
+                row = conn.execute('SELECT available_copies FROM books WHERE id = ?', (book_id,)).fetchone()
+            if row is None:
+                invalidate_book(book_id, static['isbn'])
+                return None
+            available = row['available_copies']
+            _availability_cache.set(book_id, available)
+        return {**static, 'available_copies': available}
+
+    with db_connection() as conn:
+        book = conn.execute('SELECT * FROM books WHERE id = ?', (book_id,)).fetchone()
+    if not book:
+        return None
+    book = dict(book)
+    _cache_book(book)
+    return book
 
 def get_book_by_isbn(isbn: str) -> Optional[Dict]:
-    """Get a specific book by ISBN."""
-    conn = get_db_connection()
-    book = conn.execute('SELECT * FROM books WHERE isbn = ?', (isbn,)).fetchone()
-    conn.close()
-    return dict(book) if book else None
+    """Get a specific book by ISBN (read-through cached)."""
+    book_id = _isbn_cache.get(isbn)
+    if book_id is not None:
+        book = get_book_by_id(book_id)
+        if book is not None and book['isbn'] == isbn:
+            return book
+        _isbn_cache.delete(isbn)
+
+    with db_connection() as conn:
+        book = conn.execute('SELECT * FROM books WHERE isbn = ?', (isbn,)).fetchone()
+    if not book:
+        return None
+    book = dict(book)
+    _cache_book(book)
+    return book
+
+# Trigram full-text lookups need at least one complete trigram
+FULLTEXT_MIN_TERM_LENGTH = 3
+
+def search_books_fulltext(column: str, term: str) -> Optional[List[Dict]]:
+    """
+    Find books whose title or author contains `term`, best matches first.
+
+    Uses the books_fts trigram index, which matches substrings case-insensitively.
+
+    Returns:
+        List[Dict] of candidate books, or None when the index cannot answer
+        (index missing or term shorter than one trigram) and the caller must scan.
+    """
+    if column not in ('title', 'author'):
+        raise ValueError(f"Unsupported full-text column '{column}'.")
+    if len(term) < FULLTEXT_MIN_TERM_LENGTH:
+        return None
+    # Quote the term as a phrase so FTS5 query syntax in user input is literal
+    query = f'{column}:"{term.replace(chr(34), chr(34) * 2)}"'
+    with db_connection() as conn:
+        try:
+            books = conn.execute('''
+                SELECT b.* FROM books_fts f JOIN books b ON b.id = f.rowid
+                WHERE books_fts MATCH ?
+                ORDER BY f.rank, b.title
+            ''', (query,)).fetchall()
+        except sqlite3.OperationalError:
+            return None
+    return [dict(book) for book in books]
 
 def get_patron_borrowed_books(patron_id: str) -> List[Dict]:
     """Get currently borrowed books for a patron."""
-    conn = get_db_connection()
-    records = conn.execute('''
-        SELECT br.*, b.title, b.author 
-        FROM borrow_records br 
-        JOIN books b ON br.book_id = b.id 
-        WHERE br.patron_id = ? AND br.return_date IS NULL
-        ORDER BY br.borrow_date
-    ''', (patron_id,)).fetchall()
-    conn.close()
+    with db_connection() as conn:
+        records = conn.execute('''
+            SELECT br.*, b.title, b.author 
+            FROM borrow_records br 
+            JOIN books b ON br.book_id = b.id 
+            WHERE br.patron_id = ? AND br.return_date IS NULL
+            ORDER BY br.borrow_date
+        ''', (patron_id,)).fetchall()
     
     borrowed_books = []
     for record in records:
@@ -130,72 +916,646 @@ def get_patron_borrowed_books(patron_id: str) -> List[Dict]:
     
     return borrowed_books
 
+def get_patron_borrow_history(patron_id: str) -> List[Dict]:
+    """Get every borrow record of a patron, returned or not, oldest first."""
+    with db_connection() as conn:
+        records = conn.execute('''
+            SELECT * FROM borrow_records WHERE patron_id = ? ORDER BY borrow_date
+        ''', (patron_id,)).fetchall()
+    return [dict(record) for record in records]
+
+def get_patron_open_loan_count(patron_id: str) -> int:
+    """Get a patron's open loan count from the materialised patron_loan_counts table."""
+    with db_connection() as conn:
+        row = conn.execute('''
+            SELECT open_loans FROM patron_loan_counts WHERE patron_id = ?
+        ''', (patron_id,)).fetchone()
+    return row['open_loans'] if row else 0
+
 def get_patron_borrow_count(patron_id: str) -> int:
     """Get the number of books currently borrowed by a patron."""
-    conn = get_db_connection()
-    count = conn.execute('''
-        SELECT COUNT(*) as count FROM borrow_records 
-        WHERE patron_id = ? AND return_date IS NULL
-    ''', (patron_id,)).fetchone()['count']
-    conn.close()
+    with db_connection() as conn:
+        count = conn.execute('''
+            SELECT COUNT(*) as count FROM borrow_records 
+            WHERE patron_id = ? AND return_date IS NULL
+        ''', (patron_id,)).fetchone()['count']
     return count
 
 def insert_book(title: str, author: str, isbn: str, total_copies: int, available_copies: int) -> bool:
     """Insert a new book into the database."""
-    conn = get_db_connection()
-    try:
-        conn.execute('''
-            INSERT INTO books (title, author, isbn, total_copies, available_copies)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (title, author, isbn, total_copies, available_copies))
-        conn.commit()
-        conn.close()
-        return True
-    except Exception as e:
-        conn.close()
-        return False
+    with db_connection() as conn:
+        try:
+            conn.execute('''
+                INSERT INTO books (title, author, isbn, total_copies, available_copies)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (title, author, isbn, total_copies, available_copies))
+            conn.commit()
+        except Exception as e:
+            return False
+    invalidate_book(isbn=isbn)
+    return True
+
+def get_all_isbns() -> set:
+    """Get the ISBNs of every book, for duplicate checks during bulk loads."""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        return {row[0] for row in cursor.execute('SELECT isbn FROM books')}
+
+def insert_books_batch(books: List[Tuple[str, str, str, int, int]]) -> bool:
+    """
+    Insert many books in one transaction with executemany.
+
+    Args:
+        books: (title, author, isbn, total_copies, available_copies) tuples
+
+    Returns:
+        bool: True if the whole batch was committed, False if it was rolled back
+    """
+    with db_connection() as conn:
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.executemany('''
+                INSERT INTO books (title, author, isbn, total_copies, available_copies)
+                VALUES (?, ?, ?, ?, ?)
+            ''', books)
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            return False
+    for book in books:
+        invalidate_book(isbn=book[2])
+    return True
 
 def insert_borrow_record(patron_id: str, book_id: int, borrow_date: datetime, due_date: datetime) -> bool:
     """Insert a new borrow record into the database."""
-    conn = get_db_connection()
-    try:
-        conn.execute('''
-            INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date)
-            VALUES (?, ?, ?, ?)
-        ''', (patron_id, book_id, borrow_date.isoformat(), due_date.isoformat()))
-        conn.commit()
-        conn.close()
-        return True
-    except Exception as e:
-        conn.close()
-        return False
+    with db_connection() as conn:
+        try:
+            conn.execute('''
+                INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date)
+                VALUES (?, ?, ?, ?)
+            ''', (patron_id, book_id, borrow_date.isoformat(), due_date.isoformat()))
+            conn.commit()
+            return True
+        except Exception as e:
+            return False
 
 def update_book_availability(book_id: int, change: int) -> bool:
     """Update the available copies of a book by a given amount (+1 for return, -1 for borrow)."""
-    conn = get_db_connection()
-    try:
-        conn.execute('''
-            UPDATE books SET available_copies = available_copies + ? WHERE id = ?
-        ''', (change, book_id))
-        conn.commit()
-        conn.close()
-        return True
-    except Exception as e:
-        conn.close()
-        return False
+    with db_connection() as conn:
+        try:
+            conn.execute('''
+                UPDATE books SET available_copies = available_copies + ? WHERE id = ?
+            ''', (change, book_id))
+            conn.commit()
+        except Exception as e:
+            return False
+    invalidate_book_availability(book_id)
+    return True
 
 def update_borrow_record_return_date(patron_id: str, book_id: int, return_date: datetime) -> bool:
     """Update the return date for a borrow record."""
-    conn = get_db_connection()
-    try:
-        conn.execute('''
-            UPDATE borrow_records 
-            SET return_date = ? 
-            WHERE patron_id = ? AND book_id = ? AND return_date IS NULL
-        ''', (return_date.isoformat(), patron_id, book_id))
+    with db_connection() as conn:
+        try:
+            conn.execute('''
+                UPDATE borrow_records 
+                SET return_date = ? 
+                WHERE patron_id = ? AND book_id = ? AND return_date IS NULL
+            ''', (return_date.isoformat(), patron_id, book_id))
+            conn.commit()
+            return True
+        except Exception as e:
+            return False
+
+def borrow_book_transaction(patron_id: str, book_id: int, borrow_date: datetime, due_date: datetime,
+                            max_borrowed: int = 5) -> Tuple[bool, str]:
+    """
+    Borrow a book in a single BEGIN IMMEDIATE transaction.
+
+    The availability, borrowing-limit and duplicate-loan checks, the conditional
+    availability decrement and the borrow record insert all commit together, so
+    concurrent borrowers can never take more copies than exist.
+
+    Returns:
+        tuple: (success: bool, message: str)
+    """
+    with db_connection() as conn:
+        stage = "creating borrow record"
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            book = conn.execute('SELECT title, available_copies FROM books WHERE id = ?', (book_id,)).fetchone()
+            if not book:
+                conn.rollback()
+                return False, "Book not found."
+
+            if book['available_copies'] <= 0:
+                conn.rollback()
+                return False, "This book is currently not available."
+
+            # Open loan count is a primary-key lookup on the trigger-maintained summary
+            counts = conn.execute('''
+                SELECT open_loans FROM patron_loan_counts WHERE patron_id = ?
+            ''', (patron_id,)).fetchone()
+            current_borrowed = counts['open_loans'] if counts else 0
+            if current_borrowed >= max_borrowed:
+                conn.rollback()
+                return False, f"You have reached the maximum borrowing limit of {max_borrowed} books."
+
+            # Single-row probe of the unique open-loan index
+            already_borrowed = conn.execute('''
+                SELECT 1 FROM borrow_records
+                WHERE patron_id = ? AND book_id = ? AND return_date IS NULL
+            ''', (patron_id, book_id)).fetchone()
+            if already_borrowed:
+                conn.rollback()
+                return False, "You can only borrow the same book once."
+
+            stage = "updating book availability"
+            updated = conn.execute('''
+                UPDATE books SET available_copies = available_copies - 1
+                WHERE id = ? AND available_copies > 0
+            ''', (book_id,)).rowcount
+            if updated == 0:
+                conn.rollback()
+                return False, "This book is currently not available."
+
+            stage = "creating borrow record"
+            conn.execute('''
+                INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date)
+                VALUES (?, ?, ?, ?)
+            ''', (patron_id, book_id, borrow_date.isoformat(), due_date.isoformat()))
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            return False, f"Database error occurred while {stage}."
+
+    invalidate_book_availability(book_id)
+    return True, f'Successfully borrowed "{book["title"]}". Due date: {due_date.strftime("%Y-%m-%d")}.'
+
+def return_book_transaction(patron_id: str, book_id: int, return_date: datetime) -> Tuple[bool, str, Optional[Dict]]:
+    """
+    Return a book in a single BEGIN IMMEDIATE transaction.
+
+    Locates the patron's open borrow record for the book, marks it returned and
+    increments availability with one commit. The returned record carries the
+    due date the late fee must be computed from.
+
+    Returns:
+        tuple: (success: bool, message: str, borrow_record: Optional[Dict])
+    """
+    with db_connection() as conn:
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            book = conn.execute('SELECT available_copies, total_copies FROM books WHERE id = ?', (book_id,)).fetchone()
+            if not book:
+                conn.rollback()
+                return False, "Does not found any book with that book ID", None
+
+            if book['available_copies'] == book['total_copies']:
+                conn.rollback()
+                return False, " This book is at its full availability", None
+
+            record = conn.execute('''
+                SELECT * FROM borrow_records
+                WHERE patron_id = ? AND book_id = ? AND return_date IS NULL
+                ORDER BY borrow_date LIMIT 1
+            ''', (patron_id, book_id)).fetchone()
+            if not record:
+                conn.rollback()
+                return False, "This book with this book id is not borrowed by patron", None
+
+            conn.execute('''
+                UPDATE books SET available_copies = available_copies + 1 WHERE id = ?
+            ''', (book_id,))
+            conn.execute('''
+                UPDATE borrow_records SET return_date = ? WHERE id = ?
+            ''', (return_date.isoformat(), record['id']))
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            return False, "Database error occurred while returning the book.", None
+    invalidate_book_availability(book_id)
+
+    borrow_record = dict(record)
+    borrow_record['borrow_date'] = datetime.fromisoformat(record['borrow_date'])
+    borrow_record['due_date'] = datetime.fromisoformat(record['due_date'])
+    borrow_record['return_date'] = return_date
+    return True, "", borrow_record
+
+def assess_overdue_fees(assessed_on: str, first_tier_days: int, first_tier_rate: float,
+                        later_rate: float, max_fee: float) -> int:
+    """
+    Compute the late fee of every overdue open loan in one set-based pass.
+
+    Replaces any earlier assessment for the same day, all in one transaction,
+    so re-running a night is idempotent.
+
+    Args:
+        assessed_on: Assessment date as 'YYYY-MM-DD'
+        first_tier_days, first_tier_rate, later_rate, max_fee: fee schedule
+
+    Returns:
+        int: Number of overdue loans assessed
+    """
+    with db_connection() as conn:
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('DELETE FROM fee_assessments WHERE assessed_on = ?', (assessed_on,))
+            assessed = conn.execute('''
+                INSERT INTO fee_assessments
+                    (assessed_on, borrow_record_id, patron_id, book_id, due_date, days_overdue, fee_amount)
+                SELECT :day, id, patron_id, book_id, due_date, days,
+                       MIN(:max_fee, CASE WHEN days <= :tier_days THEN days * :tier_rate
+                                          ELSE :tier_days * :tier_rate + (days - :tier_days) * :later_rate END)
+                FROM (
+                    SELECT id, patron_id, book_id, due_date,
+                           CAST(julianday(:day) - julianday(date(due_date)) AS INTEGER) AS days
+                    FROM borrow_records
+                    WHERE return_date IS NULL AND due_date < :day
+                )
+            ''', {
+                'day': assessed_on, 'tier_days': first_tier_days, 'tier_rate': first_tier_rate,
+                'later_rate': later_rate, 'max_fee': max_fee
+            }).rowcount
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+    return assessed
+
+def get_fee_assessments(assessed_on: str, patron_id: Optional[str] = None) -> List[Dict]:
+    """Get the stored fee assessments for a day, optionally for one patron."""
+    with db_connection() as conn:
+        if patron_id is None:
+            rows = conn.execute('''
+                SELECT * FROM fee_assessments WHERE assessed_on = ? ORDER BY patron_id, borrow_record_id
+            ''', (assessed_on,)).fetchall()
+        else:
+            rows = conn.execute('''
+                SELECT * FROM fee_assessments WHERE assessed_on = ? AND patron_id = ? ORDER BY borrow_record_id
+            ''', (assessed_on, patron_id)).fetchall()
+    return [dict(row) for row in rows]
+
+def create_payment_job(idempotency_key: str, patron_id: str, book_id: int) -> Tuple[Dict, bool]:
+    """
+    Queue a payment job unless one already exists for the idempotency key.
+
+    A failed job for the same patron and book is queued again, as long as
+    nothing was charged for it: no transaction on the job and no charge
+    recorded, in progress or of unknown outcome under its key.
+
+    Returns:
+        tuple: (job: Dict, queued: bool) - the existing job when the key was seen before
+    """
+    now = datetime.now().isoformat()
+    with db_connection() as conn:
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            queued = conn.execute('''
+                INSERT OR IGNORE INTO payment_jobs (idempotency_key, patron_id, book_id, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (idempotency_key, patron_id, book_id, now, now)).rowcount == 1
+            if not queued:
+                queued = conn.execute('''
+                    UPDATE payment_jobs SET status = 'queued', message = NULL, available_at = NULL, updated_at = ?
+                    WHERE idempotency_key = ? AND patron_id = ? AND book_id = ?
+                      AND status = 'failed' AND transaction_id IS NULL
+                      AND NOT EXISTS (SELECT 1 FROM payment_requests r
+                                      WHERE r.idempotency_key = payment_jobs.idempotency_key
+                                        AND r.status IN ('pending', 'succeeded'))
+                ''', (now, idempotency_key, patron_id, book_id)).rowcount == 1
+            job = conn.execute('SELECT * FROM payment_jobs WHERE idempotency_key = ?', (idempotency_key,)).fetchone()
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+    return dict(job), queued
+
+def get_payment_job(job_id: int) -> Optional[Dict]:
+    """Get a payment job by ID."""
+    with db_connection() as conn:
+        job = conn.execute('SELECT * FROM payment_jobs WHERE id = ?', (job_id,)).fetchone()
+    return dict(job) if job else None
+
+def claim_payment_job() -> Optional[Dict]:
+    """
+    Atomically move the oldest queued payment job to 'processing'.
+
+    BEGIN IMMEDIATE serialises claimers, so a job is handed to exactly one
+    worker even with several threads or processes draining the queue. Jobs
+    put back with a backoff are skipped until their available_at time.
+    """
+    with db_connection() as conn:
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            job = conn.execute('''
+                SELECT * FROM payment_jobs
+                WHERE status = 'queued' AND (available_at IS NULL OR available_at <= ?)
+                ORDER BY id LIMIT 1
+            ''', (datetime.now().isoformat(),)).fetchone()
+            if job is None:
+                conn.rollback()
+                return None
+            conn.execute('''
+                UPDATE payment_jobs SET status = 'processing', attempts = attempts + 1, updated_at = ?
+                WHERE id = ?
+            ''', (datetime.now().isoformat(), job['id']))
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+    claimed = dict(job)
+    claimed['status'] = 'processing'
+    claimed['attempts'] += 1
+    return claimed
+
+def finish_payment_job(job_id: int, succeeded: bool, message: str, transaction_id: Optional[str] = None) -> bool:
+    """Record the outcome of a claimed payment job."""
+    with db_connection() as conn:
+        try:
+            conn.execute('''
+                UPDATE payment_jobs SET status = ?, message = ?, transaction_id = ?, updated_at = ?
+                WHERE id = ? AND status = 'processing'
+            ''', ('succeeded' if succeeded else 'failed', message, transaction_id,
+                  datetime.now().isoformat(), job_id))
+            conn.commit()
+            return True
+        except Exception as e:
+            return False
+
+def retry_payment_job(job_id: int, message: str, available_at: str) -> bool:
+    """Put a claimed payment job back in the queue, not to be claimed before `available_at`."""
+    with db_connection() as conn:
+        retried = conn.execute('''
+            UPDATE payment_jobs SET status = 'queued', message = ?, available_at = ?, updated_at = ?
+            WHERE id = ? AND status = 'processing'
+        ''', (message, available_at, datetime.now().isoformat(), job_id)).rowcount == 1
         conn.commit()
-        conn.close()
-        return True
-    except Exception as e:
-        conn.close()
+    return retried
+
+def fail_stale_payment_jobs(older_than: str, message: str) -> int:
+    """
+    Fail jobs left in 'processing' since before `older_than` (e.g. by a crashed worker).
+
+    They are not re-queued: the gateway may already have charged the patron.
+    """
+    with db_connection() as conn:
+        failed = conn.execute('''
+            UPDATE payment_jobs SET status = 'failed', message = ?, updated_at = ?
+            WHERE status = 'processing' AND updated_at < ?
+        ''', (message, datetime.now().isoformat(), older_than)).rowcount
+        conn.commit()
+    return failed
+
+def get_payment_job_counts() -> Dict[str, int]:
+    """Get the number of payment jobs in each status."""
+    with db_connection() as conn:
+        rows = conn.execute('SELECT status, COUNT(*) AS count FROM payment_jobs GROUP BY status').fetchall()
+    counts = {'queued': 0, 'processing': 0, 'succeeded': 0, 'failed': 0}
+    counts.update({row['status']: row['count'] for row in rows})
+    return counts
+
+def record_payment(transaction_id: str, patron_id: str, book_id: int, amount: float,
+                   idempotency_key: Optional[str] = None) -> bool:
+    """Record a single-book charge returned by the gateway in the payments ledger."""
+    return _record_charge(transaction_id, patron_id, book_id, amount, [(book_id, amount)], idempotency_key)
+
+def record_batch_payment(transaction_id: str, patron_id: str, amount: float,
+                         allocations: List[Tuple[int, float]], idempotency_key: Optional[str] = None) -> bool:
+    """
+    Record one gateway charge and how it splits across books, in one transaction.
+
+    A charge for several books has no book_id of its own; the per-book amounts
+    go to payment_allocations, tied to the patron's open loan of each book.
+
+    Args:
+        allocations: (book_id, amount) pairs summing to `amount`
+        idempotency_key: Key of the request that made the charge; a second
+            charge under the same key is refused
+    """
+    return _record_charge(transaction_id, patron_id, None, amount, allocations, idempotency_key)
+
+def _record_charge(transaction_id: str, patron_id: str, book_id: Optional[int], amount: float,
+                   allocations: List[Tuple[int, float]], idempotency_key: Optional[str]) -> bool:
+    now = datetime.now().isoformat()
+    # The charge already went through: any failure here, waiting for a pooled
+    # connection included, is reported as an unrecorded charge, never raised
+    try:
+        with db_connection() as conn:
+            try:
+                conn.execute('BEGIN IMMEDIATE')
+                conn.execute('''
+                    INSERT INTO payments (transaction_id, kind, patron_id, book_id, amount, idempotency_key, created_at)
+                    VALUES (?, 'payment', ?, ?, ?, ?, ?)
+                ''', (transaction_id, patron_id, book_id, amount, idempotency_key, now))
+                conn.executemany('''
+                    INSERT INTO payment_allocations (transaction_id, book_id, patron_id, borrow_record_id, amount)
+                    VALUES (:txn, :book_id, :patron_id,
+                            (SELECT id FROM borrow_records
+                             WHERE patron_id = :patron_id AND book_id = :book_id AND return_date IS NULL),
+                            :amount)
+                ''', [{'txn': transaction_id, 'book_id': allocated_book, 'patron_id': patron_id, 'amount': allocated}
+                      for allocated_book, allocated in allocations])
+                conn.commit()
+            except sqlite3.Error:
+                conn.rollback()
+                raise
+    except sqlite3.Error:
         return False
+    return True
+
+def get_payment(transaction_id: str) -> Optional[Dict]:
+    """Get the ledger row of a charge, with the amount refunded so far."""
+    with db_connection() as conn:
+        payment = conn.execute('''
+            SELECT p.*, COALESCE((SELECT SUM(r.amount) FROM payments r
+                                  WHERE r.transaction_id = p.transaction_id AND r.kind = 'refund'), 0) AS refunded
+            FROM payments p WHERE p.transaction_id = ? AND p.kind = 'payment'
+        ''', (transaction_id,)).fetchone()
+    return dict(payment) if payment else None
+
+def claim_payment_request(idempotency_key: str, patron_id: str, book_id: Optional[int]) -> Tuple[bool, Dict]:
+    """
+    Claim an idempotency key before charging, so concurrent retries cannot both charge.
+
+    A new key is inserted as 'pending'. A key whose earlier attempt failed is
+    claimed again, but only for the same patron and book.
+
+    Returns:
+        tuple: (claimed: bool, request: Dict) - the request row as it is now
+    """
+    now = datetime.now().isoformat()
+    with db_connection() as conn:
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            claimed = conn.execute('''
+                INSERT INTO payment_requests (idempotency_key, patron_id, book_id, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (idempotency_key) DO NOTHING
+            ''', (idempotency_key, patron_id, book_id, now, now)).rowcount == 1
+            if not claimed:
+                claimed = conn.execute('''
+                    UPDATE payment_requests
+                    SET status = 'pending', transaction_id = NULL, message = NULL, updated_at = ?
+                    WHERE idempotency_key = ? AND status = 'failed' AND patron_id = ? AND book_id IS ?
+                ''', (now, idempotency_key, patron_id, book_id)).rowcount == 1
+            request = conn.execute('''
+                SELECT * FROM payment_requests WHERE idempotency_key = ?
+            ''', (idempotency_key,)).fetchone()
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+    return claimed, dict(request)
+
+def finish_payment_request(idempotency_key: str, success: Optional[bool], message: str,
+                           transaction_id: Optional[str] = None) -> bool:
+    """
+    Record the outcome of a claimed payment request.
+
+    success None means the outcome is unknown (the gateway call broke off
+    midway): the request keeps its message but stays 'pending', so the key
+    is never claimed again.
+    """
+    status = 'pending' if success is None else 'succeeded' if success else 'failed'
+    # Runs after the gateway call, so it never raises: a request that cannot
+    # be finished stays pending, which blocks retries rather than charging twice
+    try:
+        with db_connection() as conn:
+            try:
+                conn.execute('''
+                    UPDATE payment_requests SET status = ?, message = ?, transaction_id = ?, updated_at = ?
+                    WHERE idempotency_key = ?
+                ''', (status, message, transaction_id, datetime.now().isoformat(), idempotency_key))
+                conn.commit()
+            except sqlite3.Error:
+                conn.rollback()
+                raise
+    except sqlite3.Error:
+        return False
+    return True
+
+def get_patron_payments(patron_id: str, book_id: Optional[int] = None) -> List[Dict]:
+    """Get a patron's charges and refunds, optionally only those for one book, oldest first."""
+    with db_connection() as conn:
+        if book_id is None:
+            rows = conn.execute('''
+                SELECT * FROM payments WHERE patron_id = ? ORDER BY id
+            ''', (patron_id,)).fetchall()
+        else:
+            rows = conn.execute('''
+                SELECT * FROM payments WHERE patron_id = ? AND book_id = ? ORDER BY id
+            ''', (patron_id, book_id)).fetchall()
+    return [dict(row) for row in rows]
+
+def get_payment_allocation(transaction_id: str, book_id: int) -> Optional[Dict]:
+    """Get the part of a charge allocated to one book, with the amount already refunded."""
+    with db_connection() as conn:
+        allocation = conn.execute('''
+            SELECT a.*, COALESCE((SELECT SUM(r.amount) FROM payments r
+                                  WHERE r.transaction_id = a.transaction_id AND r.book_id = a.book_id
+                                    AND r.kind = 'refund'), 0) AS refunded
+            FROM payment_allocations a WHERE a.transaction_id = ? AND a.book_id = ?
+        ''', (transaction_id, book_id)).fetchone()
+    return dict(allocation) if allocation else None
+
+def get_outstanding_fee_loans(patron_id: str, today: str) -> List[Dict]:
+    """
+    Get a patron's overdue open loans with the net amount already paid towards each, in one query.
+
+    Args:
+        patron_id: 6-digit library card ID
+        today: 'YYYY-MM-DD'; loans due before this day are overdue
+    """
+    with db_connection() as conn:
+        records = conn.execute('''
+            SELECT br.id AS borrow_record_id, br.book_id, br.due_date, b.title,
+                   COALESCE((SELECT SUM(a.amount) FROM payment_allocations a
+                             WHERE a.borrow_record_id = br.id), 0)
+                   - COALESCE((SELECT SUM(r.amount) FROM payment_allocations a
+                               JOIN payments r ON r.transaction_id = a.transaction_id AND r.book_id = a.book_id
+                                              AND r.kind = 'refund'
+                               WHERE a.borrow_record_id = br.id), 0) AS paid
+            FROM borrow_records br
+            JOIN books b ON b.id = br.book_id
+            WHERE br.patron_id = ? AND br.return_date IS NULL AND br.due_date < ?
+            ORDER BY br.due_date, br.id
+        ''', (patron_id, today)).fetchall()
+    loans = []
+    for record in records:
+        loan = dict(record)
+        loan['due_date'] = datetime.fromisoformat(record['due_date'])
+        loans.append(loan)
+    return loans
+
+def get_open_loan_paid_amount(patron_id: str, book_id: int) -> float:
+    """Net amount (payments minus refunds) already paid towards the patron's open loan of a book."""
+    with db_connection() as conn:
+        paid = conn.execute('''
+            SELECT COALESCE(SUM(a.amount), 0)
+                   - COALESCE((SELECT SUM(r.amount) FROM payment_allocations a2
+                               JOIN payments r ON r.transaction_id = a2.transaction_id AND r.book_id = a2.book_id
+                                              AND r.kind = 'refund'
+                               WHERE a2.borrow_record_id = br.id), 0) AS paid
+            FROM borrow_records br
+            LEFT JOIN payment_allocations a ON a.borrow_record_id = br.id
+            WHERE br.patron_id = ? AND br.book_id = ? AND br.return_date IS NULL
+        ''', (patron_id, book_id)).fetchone()['paid']
+    return paid or 0.0
+
+def record_refund(transaction_id: str, amount: float, book_id: Optional[int] = None) -> bool:
+    """
+    Record a refund of `transaction_id`, attributed to the patron of the original
+    charge and to `book_id` (default: the charge's book, if it covered only one).
+    """
+    with db_connection() as conn:
+        try:
+            conn.execute('''
+                INSERT INTO payments (transaction_id, kind, patron_id, book_id, amount, created_at)
+                SELECT :txn, 'refund',
+                       (SELECT patron_id FROM payments WHERE transaction_id = :txn AND kind = 'payment'),
+                       COALESCE(:book_id, (SELECT book_id FROM payments WHERE transaction_id = :txn AND kind = 'payment')),
+                       :amount, :now
+            ''', {'txn': transaction_id, 'book_id': book_id, 'amount': amount, 'now': datetime.now().isoformat()})
+            conn.commit()
+            return True
+        except Exception as e:
+            return False
+
+def get_pending_payments(after_id: int = 0, limit: int = 1000) -> List[Dict]:
+    """Get up to `limit` unverified ledger rows with id greater than `after_id`."""
+    with db_connection() as conn:
+        rows = conn.execute('''
+            SELECT * FROM payments WHERE status = 'pending' AND id > ? ORDER BY id LIMIT ?
+        ''', (after_id, limit)).fetchall()
+    return [dict(row) for row in rows]
+
+def update_payment_verifications(results: List[Tuple[str, Optional[str], Optional[float], str, int]]) -> bool:
+    """
+    Store reconciliation outcomes in one transaction.
+
+    Args:
+        results: (status, gateway_status, gateway_amount, message, payment id) tuples
+    """
+    verified_at = datetime.now().isoformat()
+    with db_connection() as conn:
+        try:
+            conn.executemany('''
+                UPDATE payments SET status = ?, gateway_status = ?, gateway_amount = ?, message = ?, verified_at = ?
+                WHERE id = ?
+            ''', [(status, gateway_status, gateway_amount, message, verified_at, payment_id)
+                  for status, gateway_status, gateway_amount, message, payment_id in results])
+            conn.commit()
+            return True
+        except sqlite3.Error:
+            conn.rollback()
+            return False
+
+def get_payments(status: Optional[str] = None) -> List[Dict]:
+    """Get ledger rows, optionally only those in one reconciliation status."""
+    with db_connection() as conn:
+        if status is None:
+            rows = conn.execute('SELECT * FROM payments ORDER BY id').fetchall()
+        else:
+            rows = conn.execute('SELECT * FROM payments WHERE status = ? ORDER BY id', (status,)).fetchall()
+    return [dict(row) for row in rows]
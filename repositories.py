@@ -0,0 +1,448 @@
+"""
+Repositories Module - Storage interface for the business logic
+services/library_service.py reads and writes books, loans, patrons and
+payments through the stores of a Repository instead of calling database.py
+directly, so each store can move to another backend without touching the
+business rules.
+
+Backends: 'sqlite' (database.py, the default) and 'memory' (plain Python
+structures, for tests and benchmarks). Others are added with
+register_backend(), or named by import path ('package.module:factory') in the
+STORAGE_BACKEND setting of create_app.
+"""
+
+import importlib
+import itertools
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Protocol, Tuple
+
+import database
+
+class BookStore(Protocol):
+    def get(self, book_id: int) -> Optional[Dict]: ...
+    def get_by_isbn(self, isbn: str) -> Optional[Dict]: ...
+    def insert(self, title: str, author: str, isbn: str, total_copies: int, available_copies: int) -> bool: ...
+    def list_all(self) -> List[Dict]: ...
+    def page(self, limit: int, after: Optional[Tuple[str, int]] = None) -> List[Dict]: ...
+    def search(self, column: str, term: str) -> Optional[List[Dict]]: ...
+    def catalog_version(self) -> Tuple[str, float]: ...
+
+class LoanStore(Protocol):
+    def borrow(self, patron_id: str, book_id: int, borrow_date: datetime, due_date: datetime,
+               max_borrowed: int = 5) -> Tuple[bool, str]: ...
+    def return_book(self, patron_id: str, book_id: int, return_date: datetime) -> Tuple[bool, str, Optional[Dict]]: ...
+    def outstanding_fee_loans(self, patron_id: str, today: str) -> List[Dict]: ...
+    def paid_towards_open_loan(self, patron_id: str, book_id: int) -> float: ...
+
+class PatronStore(Protocol):
+    def borrow_count(self, patron_id: str) -> int: ...
+    def borrowed_books(self, patron_id: str) -> List[Dict]: ...
+    def borrow_history(self, patron_id: str) -> List[Dict]: ...
+
+class PaymentStore(Protocol):
+    def record(self, transaction_id: str, patron_id: str, book_id: int, amount: float,
+               idempotency_key: Optional[str] = None) -> bool: ...
+    def record_batch(self, transaction_id: str, patron_id: str, amount: float,
+                     allocations: List[Tuple[int, float]], idempotency_key: Optional[str] = None) -> bool: ...
+    def record_refund(self, transaction_id: str, amount: float, book_id: Optional[int] = None) -> bool: ...
+    def get(self, transaction_id: str) -> Optional[Dict]: ...
+    def claim_request(self, idempotency_key: str, patron_id: str, book_id: Optional[int]) -> Tuple[bool, Dict]: ...
+    def finish_request(self, idempotency_key: str, success: Optional[bool], message: str,
+                       transaction_id: Optional[str] = None) -> bool: ...
+    def get_allocation(self, transaction_id: str, book_id: int) -> Optional[Dict]: ...
+    def list_for_patron(self, patron_id: str, book_id: Optional[int] = None) -> List[Dict]: ...
+
+@dataclass
+class Repository:
+    """The four stores the business logic uses; each may come from a different backend."""
+    books: BookStore
+    loans: LoanStore
+    patrons: PatronStore
+    payments: PaymentStore
+
+# SQLite backend: thin adapters over database.py. Functions are looked up on
+# the module at call time so the pool, caches and test patches all still apply.
+
+class SQLiteBookStore:
+    def get(self, book_id):
+        return database.get_book_by_id(book_id)
+
+    def get_by_isbn(self, isbn):
+        return database.get_book_by_isbn(isbn)
+
+    def insert(self, title, author, isbn, total_copies, available_copies):
+        return database.insert_book(title, author, isbn, total_copies, available_copies)
+
+    def list_all(self):
+        return database.get_all_books()
+
+    def page(self, limit, after=None):
+        return database.get_books_page(limit, after)
+
+    def search(self, column, term):
+        return database.search_books_fulltext(column, term)
+
+    def catalog_version(self):
+        return database.get_catalog_version()
+
+class SQLiteLoanStore:
+    def borrow(self, patron_id, book_id, borrow_date, due_date, max_borrowed=5):
+        return database.borrow_book_transaction(patron_id, book_id, borrow_date, due_date, max_borrowed)
+
+    def return_book(self, patron_id, book_id, return_date):
+        return database.return_book_transaction(patron_id, book_id, return_date)
+
+    def outstanding_fee_loans(self, patron_id, today):
+        return database.get_outstanding_fee_loans(patron_id, today)
+
+    def paid_towards_open_loan(self, patron_id, book_id):
+        return database.get_open_loan_paid_amount(patron_id, book_id)
+
+class SQLitePatronStore:
+    def borrow_count(self, patron_id):
+        return database.get_patron_open_loan_count(patron_id)
+
+    def borrowed_books(self, patron_id):
+        return database.get_patron_borrowed_books(patron_id)
+
+    def borrow_history(self, patron_id):
+        return database.get_patron_borrow_history(patron_id)
+
+class SQLitePaymentStore:
+    def record(self, transaction_id, patron_id, book_id, amount, idempotency_key=None):
+        return database.record_payment(transaction_id, patron_id, book_id, amount, idempotency_key)
+
+    def record_batch(self, transaction_id, patron_id, amount, allocations, idempotency_key=None):
+        return database.record_batch_payment(transaction_id, patron_id, amount, allocations, idempotency_key)
+
+    def record_refund(self, transaction_id, amount, book_id=None):
+        return database.record_refund(transaction_id, amount, book_id)
+
+    def get(self, transaction_id):
+        return database.get_payment(transaction_id)
+
+    def claim_request(self, idempotency_key, patron_id, book_id):
+        return database.claim_payment_request(idempotency_key, patron_id, book_id)
+
+    def finish_request(self, idempotency_key, success, message, transaction_id=None):
+        return database.finish_payment_request(idempotency_key, success, message, transaction_id)
+
+    def get_allocation(self, transaction_id, book_id):
+        return database.get_payment_allocation(transaction_id, book_id)
+
+    def list_for_patron(self, patron_id, book_id=None):
+        return database.get_patron_payments(patron_id, book_id)
+
+def create_sqlite_repository() -> Repository:
+    """Stores backed by the shared database.py connection pool."""
+    return Repository(SQLiteBookStore(), SQLiteLoanStore(), SQLitePatronStore(), SQLitePaymentStore())
+
+# Memory backend: the same results and messages as the SQLite backend, kept in
+# dicts and lists behind one lock. Dates are stored as ISO strings, like SQLite.
+
+class _MemoryData:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.books: Dict[int, Dict] = {}
+        self.loans: Dict[int, Dict] = {}
+        self.payments: List[Dict] = []
+        self.allocations: Dict[Tuple[str, int], Dict] = {}
+        self.requests: Dict[str, Dict] = {}
+        self.book_ids = itertools.count(1)
+        self.loan_ids = itertools.count(1)
+        self.payment_ids = itertools.count(1)
+        # Catalog version for HTTP validators, bumped by every write to books
+        self.catalog_boot = uuid.uuid4().hex[:8]
+        self.catalog_changes = 0
+        self.catalog_modified = time.time()
+
+    def catalog_changed(self):
+        self.catalog_changes += 1
+        self.catalog_modified = time.time()
+
+    def open_loan(self, patron_id: str, book_id: int) -> Optional[Dict]:
+        for loan in self.loans.values():
+            if loan['patron_id'] == patron_id and loan['book_id'] == book_id and loan['return_date'] is None:
+                return loan
+        return None
+
+    def refunded(self, transaction_id: str, book_id: Optional[int] = None) -> float:
+        return sum(p['amount'] for p in self.payments
+                   if p['kind'] == 'refund' and p['transaction_id'] == transaction_id
+                   and (book_id is None or p['book_id'] == book_id))
+
+    def charge(self, transaction_id: str) -> Optional[Dict]:
+        for payment in self.payments:
+            if payment['kind'] == 'payment' and payment['transaction_id'] == transaction_id:
+                return payment
+        return None
+
+class MemoryBookStore:
+    def __init__(self, data: _MemoryData):
+        self._data = data
+
+    def get(self, book_id):
+        with self._data.lock:
+            book = self._data.books.get(book_id)
+            return dict(book) if book else None
+
+    def get_by_isbn(self, isbn):
+        with self._data.lock:
+            for book in self._data.books.values():
+                if book['isbn'] == isbn:
+                    return dict(book)
+        return None
+
+    def insert(self, title, author, isbn, total_copies, available_copies):
+        with self._data.lock:
+            if self.get_by_isbn(isbn) is not None:
+                return False
+            book_id = next(self._data.book_ids)
+            self._data.books[book_id] = {'id': book_id, 'title': title, 'author': author, 'isbn': isbn,
+                                         'total_copies': total_copies, 'available_copies': available_copies}
+            self._data.catalog_changed()
+        return True
+
+    def list_all(self):
+        with self._data.lock:
+            return [dict(book) for book in sorted(self._data.books.values(), key=lambda b: b['title'])]
+
+    def page(self, limit, after=None):
+        with self._data.lock:
+            books = sorted(self._data.books.values(), key=lambda b: (b['title'], b['id']))
+        if after is not None:
+            books = [book for book in books if (book['title'], book['id']) > tuple(after)]
+        return [dict(book) for book in books[:limit]]
+
+    def search(self, column, term):
+        if column not in ('title', 'author'):
+            raise ValueError(f"Unsupported full-text column '{column}'.")
+        term = term.lower()
+        return [book for book in self.list_all() if term in book[column].lower()]
+
+    def catalog_version(self):
+        with self._data.lock:
+            return f"{self._data.catalog_boot}-{self._data.catalog_changes}", self._data.catalog_modified
+
+class MemoryLoanStore:
+    def __init__(self, data: _MemoryData):
+        self._data = data
+
+    def borrow(self, patron_id, book_id, borrow_date, due_date, max_borrowed=5):
+        with self._data.lock:
+            book = self._data.books.get(book_id)
+            if not book:
+                return False, "Book not found."
+            if book['available_copies'] <= 0:
+                return False, "This book is currently not available."
+            open_loans = sum(1 for loan in self._data.loans.values()
+                             if loan['patron_id'] == patron_id and loan['return_date'] is None)
+            if open_loans >= max_borrowed:
+                return False, f"You have reached the maximum borrowing limit of {max_borrowed} books."
+            if self._data.open_loan(patron_id, book_id):
+                return False, "You can only borrow the same book once."
+            book['available_copies'] -= 1
+            self._data.catalog_changed()
+            loan_id = next(self._data.loan_ids)
+            self._data.loans[loan_id] = {'id': loan_id, 'patron_id': patron_id, 'book_id': book_id,
+                                         'borrow_date': borrow_date.isoformat(), 'due_date': due_date.isoformat(),
+                                         'return_date': None}
+        return True, f'Successfully borrowed "{book["title"]}". Due date: {due_date.strftime("%Y-%m-%d")}.'
+
+    def return_book(self, patron_id, book_id, return_date):
+        with self._data.lock:
+            book = self._data.books.get(book_id)
+            if not book:
+                return False, "Does not found any book with that book ID", None
+            if book['available_copies'] == book['total_copies']:
+                return False, " This book is at its full availability", None
+            loan = self._data.open_loan(patron_id, book_id)
+            if not loan:
+                return False, "This book with this book id is not borrowed by patron", None
+            book['available_copies'] += 1
+            self._data.catalog_changed()
+            loan['return_date'] = return_date.isoformat()
+            record = dict(loan)
+        record['borrow_date'] = datetime.fromisoformat(record['borrow_date'])
+        record['due_date'] = datetime.fromisoformat(record['due_date'])
+        record['return_date'] = return_date
+        return True, "", record
+
+    def outstanding_fee_loans(self, patron_id, today):
+        with self._data.lock:
+            loans = sorted((loan for loan in self._data.loans.values()
+                            if loan['patron_id'] == patron_id and loan['return_date'] is None
+                            and loan['due_date'] < today),
+                           key=lambda loan: (loan['due_date'], loan['id']))
+            return [{'borrow_record_id': loan['id'], 'book_id': loan['book_id'],
+                     'due_date': datetime.fromisoformat(loan['due_date']),
+                     'title': self._data.books[loan['book_id']]['title'], 'paid': self._paid(loan)}
+                    for loan in loans]
+
+    def paid_towards_open_loan(self, patron_id, book_id):
+        with self._data.lock:
+            loan = self._data.open_loan(patron_id, book_id)
+            return self._paid(loan) if loan else 0.0
+
+    def _paid(self, loan: Dict) -> float:
+        return sum(a['amount'] - self._data.refunded(a['transaction_id'], a['book_id'])
+                   for a in self._data.allocations.values() if a['borrow_record_id'] == loan['id'])
+
+class MemoryPatronStore:
+    def __init__(self, data: _MemoryData):
+        self._data = data
+
+    def _loans(self, patron_id: str) -> List[Dict]:
+        return sorted((loan for loan in self._data.loans.values() if loan['patron_id'] == patron_id),
+                      key=lambda loan: loan['borrow_date'])
+
+    def borrow_count(self, patron_id):
+        with self._data.lock:
+            return sum(1 for loan in self._loans(patron_id) if loan['return_date'] is None)
+
+    def borrowed_books(self, patron_id):
+        now = datetime.now()
+        with self._data.lock:
+            borrowed = []
+            for loan in self._loans(patron_id):
+                if loan['return_date'] is not None:
+                    continue
+                book = self._data.books[loan['book_id']]
+                due_date = datetime.fromisoformat(loan['due_date'])
+                borrowed.append({'book_id': loan['book_id'], 'title': book['title'], 'author': book['author'],
+                                 'borrow_date': datetime.fromisoformat(loan['borrow_date']),
+                                 'due_date': due_date, 'is_overdue': now > due_date})
+        return borrowed
+
+    def borrow_history(self, patron_id):
+        with self._data.lock:
+            return [dict(loan) for loan in self._loans(patron_id)]
+
+class MemoryPaymentStore:
+    def __init__(self, data: _MemoryData):
+        self._data = data
+
+    def record(self, transaction_id, patron_id, book_id, amount, idempotency_key=None):
+        return self._record_charge(transaction_id, patron_id, book_id, amount, [(book_id, amount)], idempotency_key)
+
+    def record_batch(self, transaction_id, patron_id, amount, allocations, idempotency_key=None):
+        return self._record_charge(transaction_id, patron_id, None, amount, allocations, idempotency_key)
+
+    def _record_charge(self, transaction_id, patron_id, book_id, amount, allocations, idempotency_key):
+        with self._data.lock:
+            if self._data.charge(transaction_id) is not None:
+                return False
+            if idempotency_key is not None and any(p['idempotency_key'] == idempotency_key
+                                                   for p in self._data.payments):
+                return False
+            if any((transaction_id, allocated_book) in self._data.allocations for allocated_book, _ in allocations):
+                return False
+            self._append(transaction_id, 'payment', patron_id, book_id, amount, idempotency_key)
+            for allocated_book, allocated in allocations:
+                loan = self._data.open_loan(patron_id, allocated_book)
+                self._data.allocations[(transaction_id, allocated_book)] = {
+                    'transaction_id': transaction_id, 'book_id': allocated_book, 'patron_id': patron_id,
+                    'borrow_record_id': loan['id'] if loan else None, 'amount': allocated}
+        return True
+
+    def _append(self, transaction_id, kind, patron_id, book_id, amount, idempotency_key=None):
+        self._data.payments.append({
+            'id': next(self._data.payment_ids), 'transaction_id': transaction_id, 'kind': kind,
+            'patron_id': patron_id, 'book_id': book_id, 'amount': amount, 'status': 'pending',
+            'gateway_status': None, 'gateway_amount': None, 'message': None,
+            'created_at': datetime.now().isoformat(), 'verified_at': None, 'idempotency_key': idempotency_key})
+
+    def record_refund(self, transaction_id, amount, book_id=None):
+        with self._data.lock:
+            charge = self._data.charge(transaction_id)
+            if book_id is None and charge is not None:
+                book_id = charge['book_id']
+            self._append(transaction_id, 'refund', charge['patron_id'] if charge else None, book_id, amount)
+        return True
+
+    def get(self, transaction_id):
+        with self._data.lock:
+            charge = self._data.charge(transaction_id)
+            return {**charge, 'refunded': self._data.refunded(transaction_id)} if charge else None
+
+    def claim_request(self, idempotency_key, patron_id, book_id):
+        now = datetime.now().isoformat()
+        with self._data.lock:
+            request = self._data.requests.get(idempotency_key)
+            if request is None:
+                request = self._data.requests[idempotency_key] = {
+                    'idempotency_key': idempotency_key, 'patron_id': patron_id, 'book_id': book_id,
+                    'status': 'pending', 'transaction_id': None, 'message': None,
+                    'created_at': now, 'updated_at': now}
+                return True, dict(request)
+            if request['status'] == 'failed' and (request['patron_id'], request['book_id']) == (patron_id, book_id):
+                request.update(status='pending', transaction_id=None, message=None, updated_at=now)
+                return True, dict(request)
+            return False, dict(request)
+
+    def finish_request(self, idempotency_key, success, message, transaction_id=None):
+        with self._data.lock:
+            self._data.requests[idempotency_key].update(
+                status='pending' if success is None else 'succeeded' if success else 'failed', message=message,
+                transaction_id=transaction_id, updated_at=datetime.now().isoformat())
+        return True
+
+    def get_allocation(self, transaction_id, book_id):
+        with self._data.lock:
+            allocation = self._data.allocations.get((transaction_id, book_id))
+            if allocation is None:
+                return None
+            return {**allocation, 'refunded': self._data.refunded(transaction_id, book_id)}
+
+    def list_for_patron(self, patron_id, book_id=None):
+        with self._data.lock:
+            return [dict(p) for p in self._data.payments
+                    if p['patron_id'] == patron_id and (book_id is None or p['book_id'] == book_id)]
+
+def create_memory_repository() -> Repository:
+    """Stores kept in process memory; every call returns a fresh, empty repository."""
+    data = _MemoryData()
+    return Repository(MemoryBookStore(data), MemoryLoanStore(data), MemoryPatronStore(data), MemoryPaymentStore(data))
+
+_backends: Dict[str, Callable[..., Repository]] = {
+    'sqlite': create_sqlite_repository,
+    'memory': create_memory_repository,
+}
+
+def register_backend(name: str, factory: Callable[..., Repository]):
+    """Make a backend available to create_repository() under `name`."""
+    _backends[name] = factory
+
+def create_repository(backend: str = 'sqlite', **options) -> Repository:
+    """
+    Build a repository from a registered backend name or a 'module:factory' import path.
+
+    Args:
+        backend: Backend name, or import path of a factory returning a Repository
+        options: Keyword arguments for the factory (e.g. a server DSN)
+    """
+    factory = _backends.get(backend)
+    if factory is None and ':' in backend:
+        module_name, attr = backend.split(':', 1)
+        factory = getattr(importlib.import_module(module_name), attr)
+    if factory is None:
+        raise ValueError(f"Unknown storage backend '{backend}'.")
+    return factory(**options)
+
+_repository: Optional[Repository] = None
+
+def configure_repository(repository: Optional[Repository] = None) -> Repository:
+    """Set the repository the business logic uses (default: a new SQLite repository)."""
+    global _repository
+    _repository = repository or create_sqlite_repository()
+    return _repository
+
+def get_repository() -> Repository:
+    """The configured repository, created on first use with the SQLite backend."""
+    if _repository is None:
+        return configure_repository()
+    return _repository
@@ -2,8 +2,17 @@
 API Routes - JSON API endpoints
 """
 
-from flask import Blueprint, jsonify, request
-from services.library_service import calculate_late_fee_for_book, search_books_in_catalog
+import io
+from flask import Blueprint, Response, jsonify, request, url_for
+from database import EXPORT_TABLES, get_pool_stats, get_wal_stats, get_book_cache_stats, get_payment_job
+from services.library_service import (calculate_late_fee_for_book, search_books_in_catalog, get_catalog_page,
+                                      get_patron_payments)
+from services.export_service import iter_export, gzip_chunks
+from services.import_service import IMPORT_FORMATS, import_books, read_records
+from services.payment_queue import enqueue_payment, get_payment_queue_stats
+from services.payment_service import get_gateway_stats
+from .http_cache import catalog_conditional
+from .fragments import get_fragment_cache_stats
 
 api_bp = Blueprint('api', __name__, url_prefix='/api')
 
@@ -14,9 +23,45 @@ def get_late_fee(patron_id, book_id):
     API endpoint for R4: Late Fee Calculation
     """
     result = calculate_late_fee_for_book(patron_id, book_id)
-    return jsonify(result), 501 if 'not implemented' in result.get('status', '') else 200
+    return jsonify(result.to_dict())
+
+@api_bp.route('/books')
+def list_books_api():
+    """
+    List the catalog one page at a time.
+    JSON interface for R2: Book Catalog Display
+    """
+    cursor = request.args.get('cursor')
+    limit = request.args.get('limit', type=int)
+    
+    success, message, page = get_catalog_page(cursor, limit)
+    if not success:
+        return jsonify({'error': message}), 400
+    
+    return jsonify({
+        'results': page['books'],
+        'count': len(page['books']),
+        'limit': page['limit'],
+        'next_cursor': page['next_cursor']
+    })
+
+@api_bp.route('/books/import', methods=['POST'])
+def import_books_api():
+    """
+    Bulk-load books from a CSV (with header) or NDJSON request body.
+    Bulk interface for R1: Book Catalog Management
+    """
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in IMPORT_FORMATS:
+        return jsonify({'error': f"Unknown import format '{fmt}'"}), 400
+    
+    stream = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+    report = import_books(read_records(stream, fmt))
+    
+    return jsonify(report.to_dict())
 
 @api_bp.route('/search')
+@catalog_conditional
 def search_books_api():
     """
     Search for books via API endpoint.
@@ -37,3 +82,87 @@ def search_books_api():
         'results': books,
         'count': len(books)
     })
+
+@api_bp.route('/export/<table>')
+def export_table_api(table):
+    """
+    Stream a full table export (books or borrow_records) as NDJSON or CSV.
+    Add gzip=1 for a gzip-compressed download.
+    """
+    fmt = request.args.get('format', 'ndjson')
+    compress = request.args.get('gzip', '0').lower() in ('1', 'true', 'yes')
+    
+    if table not in EXPORT_TABLES:
+        return jsonify({'error': f"Unknown export table '{table}'"}), 404
+    try:
+        chunks = iter_export(table, fmt)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    filename = f"{table}.{fmt}"
+    mimetype = 'application/x-ndjson' if fmt == 'ndjson' else 'text/csv'
+    if compress:
+        chunks = gzip_chunks(chunks)
+        filename += '.gz'
+        mimetype = 'application/gzip'
+    
+    return Response(chunks, mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+@api_bp.route('/payments', methods=['POST'])
+def submit_payment_api():
+    """
+    Queue a late fee payment and return its job ID without waiting for the gateway.
+    Send an Idempotency-Key header so retries return the original job.
+    """
+    data = request.get_json(silent=True) or request.form
+    patron_id = str(data.get('patron_id', '')).strip()
+    try:
+        book_id = int(data.get('book_id', ''))
+    except (ValueError, TypeError):
+        return jsonify({'error': 'Invalid book ID.'}), 400
+    
+    success, message, job = enqueue_payment(patron_id, book_id, request.headers.get('Idempotency-Key'))
+    if not success:
+        status = 409 if 'Idempotency' in message else 400
+        return jsonify({'error': message}), status
+    
+    return jsonify({
+        'message': message,
+        'job': job,
+        'status_url': url_for('api.payment_status_api', job_id=job['id'])
+    }), 202
+
+@api_bp.route('/payments/<int:job_id>')
+def payment_status_api(job_id):
+    """
+    Get the status of a queued payment job.
+    """
+    job = get_payment_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Payment job not found'}), 404
+    return jsonify(job)
+
+@api_bp.route('/patrons/<patron_id>/payments')
+def patron_payments_api(patron_id):
+    """
+    List a patron's recorded charges and refunds, optionally for one book (?book_id=).
+    """
+    if not patron_id.isdigit() or len(patron_id) != 6:
+        return jsonify({'error': 'Invalid patron ID. Must be exactly 6 digits.'}), 400
+    book_id = request.args.get('book_id', type=int)
+    return jsonify({'payments': get_patron_payments(patron_id, book_id)})
+
+@api_bp.route('/metrics')
+def metrics():
+    """
+    Expose runtime counters for monitoring.
+    """
+    return jsonify({
+        'db_pool': get_pool_stats(),
+        'wal': get_wal_stats(),
+        'book_cache': get_book_cache_stats(),
+        'fragment_cache': get_fragment_cache_stats(),
+        'payment_queue': get_payment_queue_stats(),
+        'payment_gateway': get_gateway_stats()
+    })
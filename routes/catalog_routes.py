@@ -3,8 +3,9 @@ Catalog Routes - Book catalog related endpoints
 """
 
 from flask import Blueprint, render_template, request, redirect, url_for, flash
-from database import get_all_books
-from services.library_service import add_book_to_catalog
+from services.library_service import add_book_to_catalog, get_catalog_page
+from .http_cache import catalog_conditional
+from .fragments import render_book_rows
 
 catalog_bp = Blueprint('catalog', __name__)
 
@@ -14,13 +15,22 @@ def index():
     return redirect(url_for('catalog.catalog'))
 
 @catalog_bp.route('/catalog')
+@catalog_conditional
 def catalog():
     """
-    Display all books in the catalog.
+    Display the catalog one page at a time.
     Implements R2: Book Catalog Display
     """
-    books = get_all_books()
-    return render_template('catalog.html', books=books)
+    cursor = request.args.get('cursor')
+    limit = request.args.get('limit', type=int)
+    
+    success, message, page = get_catalog_page(cursor, limit)
+    if not success:
+        flash(message, 'error')
+        success, message, page = get_catalog_page()
+    
+    return render_template('catalog.html', books=page['books'], rows=render_book_rows(page['books']),
+                           next_cursor=page['next_cursor'], limit=page['limit'], is_first_page=not cursor)
 
 @catalog_bp.route('/add_book', methods=['GET', 'POST'])
 def add_book():
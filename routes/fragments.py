@@ -0,0 +1,51 @@
+"""
+Fragment Cache - Rendered catalog rows cached per book
+"""
+
+from typing import Dict, Iterable
+from flask import current_app
+from markupsafe import Markup
+from cache import LRUCache
+
+ROW_TEMPLATE = '_catalog_row.html'
+ROW_CACHE_MAX_ENTRIES = 20000
+ROW_CACHE_MAX_BYTES = 32 * 1024 * 1024
+ROW_FIELDS = ('title', 'author', 'isbn', 'total_copies', 'available_copies')
+
+_row_cache = LRUCache(ROW_CACHE_MAX_ENTRIES, ROW_CACHE_MAX_BYTES)
+
+def configure_fragment_cache(max_entries: int = ROW_CACHE_MAX_ENTRIES, max_bytes: int = ROW_CACHE_MAX_BYTES):
+    """Resize the rendered-row cache; max_entries 0 disables it."""
+    global _row_cache
+    _row_cache = LRUCache(max_entries, max_bytes)
+
+def clear_fragment_cache():
+    """Drop every rendered row."""
+    _row_cache.clear()
+
+def get_fragment_cache_stats() -> Dict:
+    """Get hit-rate and memory counters of the rendered-row cache."""
+    return _row_cache.stats()
+
+def row_version(book: Dict) -> tuple:
+    """Every value the row markup depends on; a changed value means a re-render."""
+    return tuple(book[field] for field in ROW_FIELDS)
+
+def render_book_rows(books: Iterable[Dict]) -> Markup:
+    """
+    Render the catalog table rows for `books`, reusing cached markup.
+
+    Rows are cached under (book id, row version), so only books whose fields
+    (in practice available_copies) changed since they were last rendered go
+    through Jinja again; superseded versions age out of the LRU.
+    """
+    template = current_app.jinja_env.get_template(ROW_TEMPLATE)
+    rows = []
+    for book in books:
+        key = (book['id'], row_version(book))
+        markup = _row_cache.get(key)
+        if markup is None:
+            markup = template.render(book=book)
+            _row_cache.set(key, markup)
+        rows.append(markup)
+    return Markup('\n'.join(rows))
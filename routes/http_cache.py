@@ -0,0 +1,69 @@
+"""
+HTTP Caching - Conditional GET for catalog-backed pages
+"""
+
+import hashlib
+import math
+import time
+from datetime import datetime, timezone
+from functools import wraps
+from typing import Optional
+from flask import make_response, request, session
+from services.library_service import get_catalog_version
+
+def catalog_etag(version: str) -> str:
+    """Strong ETag for the current request: catalog version plus path and query."""
+    key = f"{version}|{request.endpoint}|{request.full_path}"
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+def catalog_last_modified(modified: float) -> Optional[datetime]:
+    """
+    Last-Modified for a catalog last written at `modified` (a Unix timestamp).
+
+    HTTP dates have whole seconds, so this is the end of the second of the
+    write. Until that second is over another write could share the date, so
+    none is given and clients revalidate with the ETag only.
+    """
+    seconds = math.floor(modified) + 1
+    if seconds > time.time():
+        return None
+    return datetime.fromtimestamp(seconds, timezone.utc)
+
+def _not_modified(etag: str, modified: float) -> bool:
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since:
+        return modified < request.if_modified_since.timestamp()
+    return False
+
+def catalog_conditional(view):
+    """
+    Answer GETs whose output depends only on the books table conditionally.
+
+    A request carrying a matching If-None-Match (or an If-Modified-Since
+    later than the last catalog write) gets a 304 before the view runs, so
+    only the catalog version is read. Responses that show flash messages left by an earlier
+    request are not cacheable and get no validators.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if session.get('_flashes'):
+            return view(*args, **kwargs)
+        
+        version, modified = get_catalog_version()
+        etag = catalog_etag(version)
+        
+        if _not_modified(etag, modified):
+            response = make_response('', 304)
+        else:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+        
+        response.set_etag(etag)
+        last_modified = catalog_last_modified(modified)
+        if last_modified is not None:
+            response.last_modified = last_modified
+        response.cache_control.no_cache = True
+        return response
+    return wrapper
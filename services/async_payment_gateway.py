@@ -0,0 +1,171 @@
+"""
+Async Payment Gateway Module - asyncio client for the payment gateway
+Same contract as PaymentGateway, but every call is a coroutine, the number of
+calls in flight is bounded by a semaphore, each call has a timeout, and bulk
+helpers run many calls concurrently with asyncio.gather.
+
+With a base_url the client speaks HTTP/1.1 JSON over asyncio streams (see
+services/fake_payment_server.py for a local server); without one it simulates
+the gateway with asyncio.sleep, mirroring PaymentGateway.
+"""
+
+import asyncio
+import json
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from services.payment_service import (
+    CHARGE_LATENCY, REFUND_LATENCY, STATUS_LATENCY,
+    simulate_charge, simulate_refund, simulate_status
+)
+
+MAX_IN_FLIGHT = 100
+CALL_TIMEOUT = 5.0
+
+class PaymentGatewayError(Exception):
+    """The gateway could not be reached or returned an unusable response."""
+
+class AsyncPaymentGateway:
+    """
+    Asynchronous payment gateway client.
+
+    Use an instance from a single event loop (its semaphore binds to the loop
+    on first use). Calls raise TimeoutError after `timeout` seconds and
+    PaymentGatewayError on transport failures; the bulk helpers turn both into
+    failed results so one bad call does not sink the batch.
+    """
+
+    def __init__(self, api_key: str = "test_key_12345", base_url: Optional[str] = None,
+                 max_in_flight: int = MAX_IN_FLIGHT, timeout: float = CALL_TIMEOUT):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        self.calls = 0
+        self.timeouts = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._semaphore = asyncio.BoundedSemaphore(max_in_flight)
+
+    async def _call(self, method: str, path: str, body: Optional[Dict], latency: float, simulate):
+        async with self._semaphore:
+            self.calls += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            try:
+                if self.base_url is None:
+                    return await asyncio.wait_for(self._simulate(latency, simulate), self.timeout)
+                return await asyncio.wait_for(self._request(method, path, body), self.timeout)
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                raise TimeoutError(f"Payment gateway did not answer within {self.timeout}s")
+            finally:
+                self.in_flight -= 1
+
+    async def _simulate(self, latency: float, simulate):
+        await asyncio.sleep(latency)
+        return simulate()
+
+    async def _request(self, method: str, path: str, body: Optional[Dict]) -> Dict:
+        url = urlsplit(self.base_url)
+        port = url.port or (443 if url.scheme == 'https' else 80)
+        payload = json.dumps(body).encode('utf-8') if body is not None else b''
+        head = (f"{method} {url.path.rstrip('/')}{path} HTTP/1.1\r\n"
+                f"Host: {url.hostname}:{port}\r\n"
+                f"Authorization: Bearer {self.api_key}\r\n"
+                f"Content-Type: application/json\r\n"
+                f"Content-Length: {len(payload)}\r\n"
+                f"Connection: close\r\n\r\n")
+
+        try:
+            reader, writer = await asyncio.open_connection(url.hostname, port, ssl=url.scheme == 'https')
+        except OSError as e:
+            raise PaymentGatewayError(f"Cannot reach payment gateway: {e}") from e
+        try:
+            writer.write(head.encode('ascii') + payload)
+            await writer.drain()
+            status_line, *header_lines = (await reader.readuntil(b'\r\n\r\n')).decode('latin-1').split('\r\n')
+            headers = dict(line.split(': ', 1) for line in header_lines if ': ' in line)
+            status = int(status_line.split()[1])
+            length = int(headers.get('Content-Length', 0))
+            data = json.loads(await reader.readexactly(length)) if length else {}
+        except (OSError, asyncio.IncompleteReadError, ValueError, IndexError) as e:
+            raise PaymentGatewayError(f"Bad response from payment gateway: {e}") from e
+        finally:
+            writer.close()
+
+        if status >= 400:
+            raise PaymentGatewayError(f"Payment gateway returned HTTP {status}: {data.get('message', '')}")
+        return data
+
+    async def process_payment(self, patron_id: str, amount: float, description: str = "") -> Tuple[bool, str, str]:
+        """
+        Process a payment through the gateway.
+
+        Returns:
+            tuple: (success: bool, transaction_id: str, message: str)
+        """
+        body = {"customer_id": patron_id, "amount": amount, "currency": "usd", "description": description}
+        result = await self._call('POST', '/charges', body, CHARGE_LATENCY,
+                                  lambda: simulate_charge(patron_id, amount))
+        if isinstance(result, tuple):
+            return result
+        return result['success'], result['transaction_id'], result['message']
+
+    async def refund_payment(self, transaction_id: str, amount: float) -> Tuple[bool, str]:
+        """
+        Refund a previous payment.
+
+        Returns:
+            tuple: (success: bool, message: str)
+        """
+        body = {"transaction_id": transaction_id, "amount": amount}
+        result = await self._call('POST', '/refunds', body, REFUND_LATENCY,
+                                  lambda: simulate_refund(transaction_id, amount))
+        if isinstance(result, tuple):
+            return result
+        return result['success'], result['message']
+
+    async def verify_payment_status(self, transaction_id: str) -> Dict:
+        """
+        Check the status of a payment transaction.
+
+        Returns:
+            dict: Payment status information
+        """
+        return await self._call('GET', f'/charges/{transaction_id}', None, STATUS_LATENCY,
+                                lambda: simulate_status(transaction_id))
+
+    async def process_payments(self, payments: Iterable[Tuple[str, float, str]]) -> List[Tuple[bool, str, str]]:
+        """Charge many (patron_id, amount, description) payments concurrently, in input order."""
+        results = await asyncio.gather(*(self.process_payment(*payment) for payment in payments),
+                                       return_exceptions=True)
+        return [(False, "", f"Payment processing error: {result}") if isinstance(result, Exception) else result
+                for result in results]
+
+    async def refund_payments(self, refunds: Iterable[Tuple[str, float]]) -> List[Tuple[bool, str]]:
+        """Refund many (transaction_id, amount) pairs concurrently, in input order."""
+        results = await asyncio.gather(*(self.refund_payment(*refund) for refund in refunds),
+                                       return_exceptions=True)
+        return [(False, f"Refund processing error: {result}") if isinstance(result, Exception) else result
+                for result in results]
+
+    async def verify_payment_statuses(self, transaction_ids: Iterable[str]) -> List[Dict]:
+        """Check many transactions concurrently; failed lookups get status 'error'."""
+        transaction_ids = list(transaction_ids)
+        results = await asyncio.gather(*(self.verify_payment_status(txn) for txn in transaction_ids),
+                                       return_exceptions=True)
+        return [{"transaction_id": txn, "status": "error", "message": str(result)}
+                if isinstance(result, Exception) else result
+                for txn, result in zip(transaction_ids, results)]
+
+    def stats(self) -> Dict:
+        """Get call counters and the concurrency limit."""
+        return {
+            'calls': self.calls,
+            'timeouts': self.timeouts,
+            'in_flight': self.in_flight,
+            'peak_in_flight': self.peak_in_flight,
+            'max_in_flight': self.max_in_flight,
+            'timeout': self.timeout
+        }
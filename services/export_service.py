@@ -0,0 +1,80 @@
+"""
+Export Service Module - Streaming catalog and borrow history exports
+Turns table rows into NDJSON or CSV text incrementally so exports of any size
+run in constant memory, optionally gzip-compressed on the fly.
+"""
+
+import csv
+import io
+import json
+import zlib
+from typing import BinaryIO, Iterator
+
+from database import EXPORT_TABLES, iter_table_rows
+
+EXPORT_FORMATS = ('ndjson', 'csv')
+EXPORT_BATCH_SIZE = 1000
+
+def iter_export(table: str, fmt: str = 'ndjson', batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[str]:
+    """
+    Stream a table as NDJSON or CSV text, one chunk per fetched batch.
+
+    Args:
+        table: One of database.EXPORT_TABLES
+        fmt: 'ndjson' (one JSON object per line) or 'csv' (with header row)
+        batch_size: Rows fetched from the database per chunk
+
+    Returns:
+        Iterator[str]: text chunks to write or send in order
+    """
+    if table not in EXPORT_TABLES:
+        raise ValueError(f"Unknown export table '{table}'. Choose from: {', '.join(EXPORT_TABLES)}.")
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format '{fmt}'. Choose from: {', '.join(EXPORT_FORMATS)}.")
+
+    columns = EXPORT_TABLES[table]
+    # Validate eagerly above; rows are only pulled once iteration starts
+    return _iter_csv(table, columns, batch_size) if fmt == 'csv' else _iter_ndjson(table, columns, batch_size)
+
+def _iter_ndjson(table, columns, batch_size) -> Iterator[str]:
+    dumps = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+    for rows in iter_table_rows(table, batch_size):
+        yield ''.join(dumps(dict(zip(columns, row))) + '\n' for row in rows)
+
+def _iter_csv(table, columns, batch_size) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(columns)
+    for rows in iter_table_rows(table, batch_size):
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # header only, for an empty table
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def gzip_chunks(chunks: Iterator[str], level: int = 6) -> Iterator[bytes]:
+    """Gzip-compress a stream of text chunks incrementally."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits 31 -> gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+def export_table(table: str, out: BinaryIO, fmt: str = 'ndjson', compress: bool = False,
+                 batch_size: int = EXPORT_BATCH_SIZE) -> int:
+    """
+    Write a table export to a binary file object.
+
+    Returns:
+        int: Number of bytes written
+    """
+    chunks = iter_export(table, fmt, batch_size)
+    encoded = gzip_chunks(chunks) if compress else (chunk.encode('utf-8') for chunk in chunks)
+    written = 0
+    for data in encoded:
+        out.write(data)
+        written += len(data)
+    return written
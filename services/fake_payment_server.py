@@ -0,0 +1,179 @@
+"""
+Fake Payment Server - Local stand-in for the payment gateway HTTP API
+Serves the same decisions as PaymentGateway over real HTTP so the async
+gateway (and load tests) can be exercised without an external service.
+
+    POST /charges                {"customer_id", "amount", "description"}
+    POST /refunds                {"transaction_id", "amount"}
+    GET  /charges/<transaction>  status of a charge made on this server
+
+Run standalone with: python -m services.fake_payment_server --port 8765
+"""
+
+import argparse
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+from services.payment_service import simulate_charge, simulate_refund
+
+class _GatewayHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: Dict):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _authorised(self) -> bool:
+        if self.headers.get('Authorization') != f"Bearer {self.server.api_key}":
+            self._send(401, {'message': 'Invalid API key'})
+            return False
+        if self.server.take_failure():
+            self._send(503, {'message': 'Service unavailable'})
+            return False
+        return True
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            data = json.loads(self.rfile.read(length) or b'{}')
+            amount = float(data.get('amount', 0))
+        except (ValueError, TypeError, AttributeError):
+            return self._send(400, {'message': 'Malformed request'})
+        if not self._authorised():
+            return
+        self.server.pause()
+
+        if self.path == '/charges':
+            success, transaction_id, message = simulate_charge(str(data.get('customer_id', '')), amount)
+            if success:
+                transaction_id = self.server.record_charge(transaction_id, data)
+            self._send(200, {'success': success, 'transaction_id': transaction_id, 'message': message})
+        elif self.path == '/refunds':
+            success, message = simulate_refund(str(data.get('transaction_id', '')), amount)
+            self._send(200, {'success': success, 'message': message})
+        else:
+            self._send(404, {'message': 'Not found'})
+
+    def do_GET(self):
+        if not self._authorised():
+            return
+        self.server.pause()
+
+        if self.path.startswith('/charges/'):
+            self._send(200, self.server.charge_status(self.path[len('/charges/'):]))
+        else:
+            self._send(404, {'message': 'Not found'})
+
+class FakePaymentServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP server implementing the gateway API in memory.
+
+    `latency` adds a fixed delay to every call to mimic the real network, and
+    `fail_next(n)` makes the next n calls answer 503 to exercise retries.
+    Use as a context manager; `url` is the base_url to give a gateway client.
+    """
+
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.0,
+                 api_key: str = "test_key_12345"):
+        super().__init__((host, port), _GatewayHandler)
+        self.latency = latency
+        self.api_key = api_key
+        self.charges = {}
+        self.requests = 0
+        self.failures_left = 0
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def fail_next(self, count: int):
+        with self._lock:
+            self.failures_left = count
+
+    def take_failure(self) -> bool:
+        with self._lock:
+            if self.failures_left <= 0:
+                return False
+            self.failures_left -= 1
+            self.requests += 1
+            return True
+
+    def pause(self):
+        with self._lock:
+            self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def record_charge(self, transaction_id: str, data: Dict) -> str:
+        """Store a successful charge under a unique transaction ID."""
+        with self._lock:
+            transaction_id = f"{transaction_id}_{next(self._ids)}"
+            self.charges[transaction_id] = {
+                'transaction_id': transaction_id,
+                'status': 'completed',
+                'amount': float(data['amount']),
+                'customer_id': str(data.get('customer_id', '')),
+                'timestamp': time.time()
+            }
+        return transaction_id
+
+    def charge_status(self, transaction_id: str) -> Dict:
+        with self._lock:
+            charge = self.charges.get(transaction_id)
+        if charge is None:
+            return {"status": "not_found", "message": "Transaction not found"}
+        return dict(charge)
+
+    def start(self) -> 'FakePaymentServer':
+        self._thread = threading.Thread(target=self.serve_forever, kwargs={'poll_interval': 0.05},
+                                        name='fake-payment-server', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+def main(argv: Optional[list] = None):
+    parser = argparse.ArgumentParser(description="Run the fake payment gateway locally.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every call.')
+    args = parser.parse_args(argv)
+
+    server = FakePaymentServer(args.host, args.port, args.latency)
+    print(f"Fake payment gateway listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
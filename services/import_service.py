@@ -0,0 +1,134 @@
+"""
+Import Service Module - Bulk catalog loading
+Streams book records from CSV or NDJSON, validates them with the same R1 rules
+as add_book_to_catalog and inserts them in large batched transactions.
+"""
+
+import csv
+import json
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+from database import get_all_isbns, insert_books_batch, insert_book
+from services.library_service import validate_book_fields
+
+IMPORT_FORMATS = ('csv', 'ndjson')
+IMPORT_BATCH_SIZE = 5000
+IMPORT_FIELDS = ('title', 'author', 'isbn', 'total_copies')
+
+@dataclass
+class ImportReport:
+    """Outcome of a bulk import: counts, per-row errors and throughput."""
+    total_rows: int = 0
+    imported: int = 0
+    batches: int = 0
+    errors: List[Tuple[int, str]] = field(default_factory=list)  # (row number, message)
+    elapsed_seconds: float = 0.0
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.total_rows / self.elapsed_seconds if self.elapsed_seconds else 0.0
+
+    def to_dict(self) -> Dict:
+        return {
+            'total_rows': self.total_rows,
+            'imported': self.imported,
+            'rejected': len(self.errors),
+            'batches': self.batches,
+            'elapsed_seconds': round(self.elapsed_seconds, 3),
+            'rows_per_second': round(self.rows_per_second, 1),
+            'errors': [{'row': row, 'error': message} for row, message in self.errors]
+        }
+
+def read_records(stream: TextIO, fmt: str) -> Iterator[Tuple[int, Dict]]:
+    """
+    Yield (row number, record) pairs from a CSV (with header) or NDJSON stream.
+
+    Row numbers are 1-based data rows, so they line up with the error report.
+    A line that cannot be parsed yields None as its record.
+    """
+    if fmt == 'csv':
+        for row_number, record in enumerate(csv.DictReader(stream), start=1):
+            yield row_number, record
+    elif fmt == 'ndjson':
+        row_number = 0
+        for line in stream:
+            if not line.strip():
+                continue
+            row_number += 1
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            yield row_number, record if isinstance(record, dict) else None
+    else:
+        raise ValueError(f"Unknown import format '{fmt}'. Choose from: {', '.join(IMPORT_FORMATS)}.")
+
+def _parse_record(record: Optional[Dict]) -> Tuple[Optional[tuple], Optional[str]]:
+    """Normalise one record into an insert tuple, or return the validation error."""
+    if record is None:
+        return None, "Malformed record."
+    title = record.get('title') or ''
+    author = record.get('author') or ''
+    isbn = str(record.get('isbn') or '').strip()
+    total_copies = record.get('total_copies')
+    if isinstance(total_copies, str) and total_copies.strip().isdigit():
+        total_copies = int(total_copies.strip())
+
+    error = validate_book_fields(title, author, isbn, total_copies)
+    if error:
+        return None, error
+    return (title.strip(), author.strip(), isbn, total_copies, total_copies), None
+
+def _flush(batch: List[Tuple[int, tuple]], report: ImportReport):
+    if not batch:
+        return
+    report.batches += 1
+    if insert_books_batch([book for _, book in batch]):
+        report.imported += len(batch)
+        return
+    # The batch was rolled back; retry row by row to pinpoint the failures
+    for row_number, book in batch:
+        if insert_book(*book):
+            report.imported += 1
+        else:
+            report.errors.append((row_number, "Database error occurred while adding the book."))
+
+def import_books(records: Iterable[Tuple[int, Optional[Dict]]], batch_size: int = IMPORT_BATCH_SIZE) -> ImportReport:
+    """
+    Validate and insert book records in batches of `batch_size` per transaction.
+
+    Duplicate ISBNs, both against the catalog and within the import itself,
+    are rejected using an in-memory set instead of a query per row.
+
+    Args:
+        records: (row number, record dict) pairs, e.g. from read_records()
+        batch_size: Books inserted per transaction
+
+    Returns:
+        ImportReport: counts, per-row errors and throughput
+    """
+    report = ImportReport()
+    start = time.perf_counter()
+    seen_isbns = get_all_isbns()
+    batch = []
+
+    for row_number, record in records:
+        report.total_rows += 1
+        book, error = _parse_record(record)
+        if error:
+            report.errors.append((row_number, error))
+            continue
+        if book[2] in seen_isbns:
+            report.errors.append((row_number, "A book with this ISBN already exists."))
+            continue
+        seen_isbns.add(book[2])
+        batch.append((row_number, book))
+        if len(batch) >= batch_size:
+            _flush(batch, report)
+            batch = []
+
+    _flush(batch, report)
+    report.elapsed_seconds = time.perf_counter() - start
+    return report
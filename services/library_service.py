@@ -2,18 +2,142 @@
 Library Service Module - Business Logic Functions
 Contains all the core business logic for the Library Management System
 """
-from services.payment_service import PaymentGateway
+from services.payment_service import PaymentGateway, get_default_gateway
+from services.resilience import GatewayUnavailableError
 
 
+import base64
 import json
+from dataclasses import dataclass
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Tuple
-from database import (
-    get_book_by_id, get_book_by_isbn, get_patron_borrow_count,
-    insert_book, insert_borrow_record, update_book_availability,
-    update_borrow_record_return_date, get_all_books, get_patron_borrowed_books,
-    get_db_connection
-)
+from typing import Callable, Dict, List, Optional, Tuple
+from repositories import get_repository
+
+# Storage goes through the configured repository (see repositories.py). These
+# module-level names are the seams the rest of this module calls, and tests patch.
+
+def get_book_by_id(book_id: int) -> Optional[Dict]:
+    return get_repository().books.get(book_id)
+
+def get_book_by_isbn(isbn: str) -> Optional[Dict]:
+    return get_repository().books.get_by_isbn(isbn)
+
+def insert_book(title: str, author: str, isbn: str, total_copies: int, available_copies: int) -> bool:
+    return get_repository().books.insert(title, author, isbn, total_copies, available_copies)
+
+def get_all_books() -> List[Dict]:
+    return get_repository().books.list_all()
+
+def get_catalog_version() -> Tuple[str, float]:
+    return get_repository().books.catalog_version()
+
+def get_books_page(limit: int, after: Optional[Tuple[str, int]] = None) -> List[Dict]:
+    return get_repository().books.page(limit, after)
+
+def search_books_fulltext(column: str, term: str) -> Optional[List[Dict]]:
+    return get_repository().books.search(column, term)
+
+def borrow_book_transaction(patron_id: str, book_id: int, borrow_date: datetime, due_date: datetime) -> Tuple[bool, str]:
+    return get_repository().loans.borrow(patron_id, book_id, borrow_date, due_date)
+
+def return_book_transaction(patron_id: str, book_id: int, return_date: datetime) -> Tuple[bool, str, Optional[Dict]]:
+    return get_repository().loans.return_book(patron_id, book_id, return_date)
+
+def get_outstanding_fee_loans(patron_id: str, today: str) -> List[Dict]:
+    return get_repository().loans.outstanding_fee_loans(patron_id, today)
+
+def get_open_loan_paid_amount(patron_id: str, book_id: int) -> float:
+    return get_repository().loans.paid_towards_open_loan(patron_id, book_id)
+
+def get_patron_borrow_count(patron_id: str) -> int:
+    return get_repository().patrons.borrow_count(patron_id)
+
+def get_patron_borrowed_books(patron_id: str) -> List[Dict]:
+    return get_repository().patrons.borrowed_books(patron_id)
+
+def get_patron_borrow_history(patron_id: str) -> List[Dict]:
+    return get_repository().patrons.borrow_history(patron_id)
+
+def record_payment(transaction_id: str, patron_id: str, book_id: int, amount: float,
+                   idempotency_key: Optional[str] = None) -> bool:
+    return get_repository().payments.record(transaction_id, patron_id, book_id, amount, idempotency_key)
+
+def record_batch_payment(transaction_id: str, patron_id: str, amount: float,
+                         allocations: List[Tuple[int, float]], idempotency_key: Optional[str] = None) -> bool:
+    return get_repository().payments.record_batch(transaction_id, patron_id, amount, allocations, idempotency_key)
+
+def record_refund(transaction_id: str, amount: float, book_id: Optional[int] = None) -> bool:
+    return get_repository().payments.record_refund(transaction_id, amount, book_id)
+
+def get_payment(transaction_id: str) -> Optional[Dict]:
+    return get_repository().payments.get(transaction_id)
+
+def claim_payment_request(idempotency_key: str, patron_id: str, book_id: Optional[int]) -> Tuple[bool, Dict]:
+    return get_repository().payments.claim_request(idempotency_key, patron_id, book_id)
+
+def finish_payment_request(idempotency_key: str, success: Optional[bool], message: str,
+                           transaction_id: Optional[str] = None) -> bool:
+    return get_repository().payments.finish_request(idempotency_key, success, message, transaction_id)
+
+def get_payment_allocation(transaction_id: str, book_id: int) -> Optional[Dict]:
+    return get_repository().payments.get_allocation(transaction_id, book_id)
+
+def get_patron_payments(patron_id: str, book_id: Optional[int] = None) -> List[Dict]:
+    return get_repository().payments.list_for_patron(patron_id, book_id)
+
+# Late fee schedule (R5): $0.50/day for the first 7 overdue days, $1.00/day after, capped at $15.00
+LATE_FEE_FIRST_TIER_DAYS = 7
+LATE_FEE_FIRST_TIER_RATE = 0.5
+LATE_FEE_LATER_RATE = 1.0
+LATE_FEE_MAX = 15.0
+
+# Catalog pagination limits
+CATALOG_PAGE_SIZE = 100
+MAX_CATALOG_PAGE_SIZE = 500
+
+# Added to the error of a gateway call that failed after it may have charged
+CHARGE_MAY_HAVE_GONE_THROUGH = "The charge may have gone through; check with the library before paying again."
+
+class _ChargeOutcomeUnknown(Exception):
+    """The gateway call failed in a way that may still have charged the patron."""
+
+@dataclass(slots=True)
+class LateFeeResult:
+    """Late fee owed on one loan."""
+    fee_amount: float
+    days_overdue: int
+    status: str
+
+    def to_dict(self) -> Dict:
+        """Plain dict for JSON responses; only needed at the HTTP edge."""
+        return {'fee_amount': self.fee_amount, 'days_overdue': self.days_overdue, 'status': self.status}
+
+def validate_book_fields(title: str, author: str, isbn: str, total_copies: int) -> Optional[str]:
+    """
+    Check a book's fields against the R1 catalog rules.
+
+    Returns:
+        Optional[str]: Error message for the first rule broken, None if valid
+    """
+    if not title or not title.strip():
+        return "Title is required."
+    
+    if len(title.strip()) > 200:
+        return "Title must be less than 200 characters."
+    
+    if not author or not author.strip():
+        return "Author is required."
+    
+    if len(author.strip()) > 100:
+        return "Author must be less than 100 characters."
+    
+    if len(isbn) != 13:
+        return "ISBN must be exactly 13 digits."
+    
+    if not isinstance(total_copies, int) or total_copies <= 0:
+        return "Total copies must be a positive integer."
+    
+    return None
 
 def add_book_to_catalog(title: str, author: str, isbn: str, total_copies: int) -> Tuple[bool, str]:
     """
@@ -30,23 +154,9 @@ def add_book_to_catalog(title: str, author: str, isbn: str, total_copies: int) -
         tuple: (success: bool, message: str)
     """
     # Input validation
-    if not title or not title.strip():
-        return False, "Title is required."
-    
-    if len(title.strip()) > 200:
-        return False, "Title must be less than 200 characters."
-    
-    if not author or not author.strip():
-        return False, "Author is required."
-    
-    if len(author.strip()) > 100:
-        return False, "Author must be less than 100 characters."
-    
-    if len(isbn) != 13:
-        return False, "ISBN must be exactly 13 digits."
-    
-    if not isinstance(total_copies, int) or total_copies <= 0:
-        return False, "Total copies must be a positive integer."
+    error = validate_book_fields(title, author, isbn, total_copies)
+    if error:
+        return False, error
     
     # Check for duplicate ISBN
     existing = get_book_by_isbn(isbn)
@@ -60,6 +170,24 @@ def add_book_to_catalog(title: str, author: str, isbn: str, total_copies: int) -
     else:
         return False, "Database error occurred while adding the book."
 
+def add_sample_data():
+    """Add sample books and one loan to the configured storage if its catalog is empty."""
+    # A one-row page is enough to tell; reading the whole catalog at startup is not
+    if get_books_page(1):
+        return
+    sample_books = [
+        ('The Great Gatsby', 'F. Scott Fitzgerald', '9780743273565', 3),
+        ('To Kill a Mockingbird', 'Harper Lee', '9780061120084', 2),
+        ('1984', 'George Orwell', '9780451524935', 1)
+    ]
+    for title, author, isbn, copies in sample_books:
+        insert_book(title, author, isbn, copies, copies)
+    
+    # Make 1984 unavailable by lending its only copy
+    now = datetime.now()
+    book = get_book_by_isbn('9780451524935')
+    borrow_book_transaction('123456', book['id'], now - timedelta(days=5), now + timedelta(days=9))
+
 def borrow_book_by_patron(patron_id: str, book_id: int) -> Tuple[bool, str]:
     """
     Allow a patron to borrow a book.
@@ -76,41 +204,13 @@ def borrow_book_by_patron(patron_id: str, book_id: int) -> Tuple[bool, str]:
     if not patron_id or not patron_id.isdigit() or len(patron_id) != 6:
         return False, "Invalid patron ID. Must be exactly 6 digits."
     
-    # Check if book exists and is available
-    book = get_book_by_id(book_id)
-    if not book:
-        return False, "Book not found."
-    
-    if book['available_copies'] <= 0:
-        return False, "This book is currently not available."
-    
-    # Check patron's current borrowed books count
-    current_borrowed = get_patron_borrow_count(patron_id)
-    
-    ############### greater than or equal to
-    if current_borrowed >= 5:
-        return False, "You have reached the maximum borrowing limit of 5 books."
-    
-    ######### added an if statement to make sure each patron can only borrow one book from each book id
-    books = get_patron_borrowed_books(patron_id)
-    for book in books:
-        if book['book_id'] == book_id:
-            return False, "You can only borrow the same book once."
-    ########## changes
     # Create borrow record
     borrow_date = datetime.now()
     due_date = borrow_date + timedelta(days=14)
     
-    # Insert borrow record and update availability
-    borrow_success = insert_borrow_record(patron_id, book_id, borrow_date, due_date)
-    if not borrow_success:
-        return False, "Database error occurred while creating borrow record."
-    
-    availability_success = update_book_availability(book_id, -1)
-    if not availability_success:
-        return False, "Database error occurred while updating book availability."
-    
-    return True, f'Successfully borrowed "{book["title"]}". Due date: {due_date.strftime("%Y-%m-%d")}.'
+    # Availability, borrowing limit (5 books), one copy per book id, the
+    # availability decrement and the borrow record all happen in one transaction
+    return borrow_book_transaction(patron_id, book_id, borrow_date, due_date)
 
 def return_book_by_patron(patron_id: str, book_id: int) -> Tuple[bool, str]:
     """
@@ -132,37 +232,60 @@ def return_book_by_patron(patron_id: str, book_id: int) -> Tuple[bool, str]:
         return False, "Invalid patron ID. Must be exactly 6 digits."
     
     # book id assumed to be positive integer(no 0 or negative number)
-    # Check if book exists
-    book = get_book_by_id(book_id)
-    if not book:
-        return False, "Does not found any book with that book ID"
-    # Check if book full avaliability
-    if book['available_copies'] == book['total_copies']:
-        return False, " This book is at its full availability"
+    # Book existence, full availability and the patron's open borrow record are
+    # checked, and both tables updated, in one transaction
+    return_date = datetime.now()
+    success, message, record = return_book_transaction(patron_id, book_id, return_date)
+    if not success:
+        return False, message
 
-    # Check if book is borrowed by the patron given
-    borrowed_books = get_patron_borrowed_books(patron_id)
-    is_borrowed = False
-    for book in borrowed_books:
-        if book_id == book['book_id']:
-            is_borrowed = True
-    
-    if not is_borrowed:
-        return False, "This book with this book id is not borrowed by patron"
+    # Calculates late fees owed from the due date of the record just closed
+    fee = late_fee_for_due_date(record['due_date'], return_date)
+
+    return True,f"Fee amount owed: ${fee.fee_amount:.2f}\nDays overdue: {fee.days_overdue}\nStatus: {fee.status}"
+
+def late_fee_for_due_date(due_date: datetime, today: Optional[datetime] = None) -> LateFeeResult:
+    """
+    Compute the late fee for a single loan from its due date.
 
-    # Calculates and displays any late fees owed
-    # calculate before update to ensure the fee is right
-    late_dict = json.loads(calculate_late_fee_for_book(patron_id, book_id))
+    $0.50/day for the first 7 overdue days, $1.00/day after that, capped at $15.00.
 
-    # Update book availablility
-    update_book_availability(book_id, 1)
+    Args:
+        due_date: Loan due date
+        today: Date to compute the fee at (defaults to now)
+
+    Returns:
+        LateFeeResult
+    """
+    # covert to date to ignore the hour subtraction. 2025-10-11 17:00 to 2025-10-11
+    due = due_date.date()
+    today = (today or datetime.now()).date()
+    if due >= today:
+        return LateFeeResult(0.0, 0, "This book is not overdue")
+
+    days_over = (today - due).days
+    if days_over <= LATE_FEE_FIRST_TIER_DAYS:
+        book_fee = days_over * LATE_FEE_FIRST_TIER_RATE
+    else:
+        book_fee = (LATE_FEE_FIRST_TIER_DAYS * LATE_FEE_FIRST_TIER_RATE
+                    + (days_over - LATE_FEE_FIRST_TIER_DAYS) * LATE_FEE_LATER_RATE)
+    return LateFeeResult(min(book_fee, LATE_FEE_MAX), days_over, "Book overdue")
 
-    # Records return date
-    update_borrow_record_return_date(patron_id, book_id, datetime.now())
+def calculate_late_fees(loans: List[Dict], today: Optional[datetime] = None) -> List[LateFeeResult]:
+    """
+    Calculate late fees for already-loaded loans in one pass, without queries.
 
-    return True,f"Fee amount owed: ${late_dict['fee_amount']:.2f}\nDays overdue: {late_dict['days_overdue']}\nStatus: {late_dict['status']}"
+    Args:
+        loans: Loan rows with 'book_id' and 'due_date' (e.g. from get_patron_borrowed_books)
+        today: Date to compute fees at (defaults to now, taken once for all loans)
+
+    Returns:
+        List[LateFeeResult]: one per loan, in the same order
+    """
+    today = today or datetime.now()
+    return [late_fee_for_due_date(loan['due_date'], today) for loan in loans]
 
-def calculate_late_fee_for_book(patron_id: str, book_id: int) -> Dict:
+def calculate_late_fee_for_book(patron_id: str, book_id: int) -> LateFeeResult:
     """
     Calculate late fees for a specific book.
 
@@ -171,77 +294,87 @@ def calculate_late_fee_for_book(patron_id: str, book_id: int) -> Dict:
         book_id: ID of the book to borrow (greater than or equal to 1)
         
     Returns:
-        Dict{'fee_amount':float,
-        'days_overdue': int,
-        'status': str}
+        LateFeeResult(fee_amount: float, days_overdue: int, status: str)
     
     Implement R5 as per requirements 
     """
-    book_fee = 0.0
-    days_over = 0
-    msg = "This book is not overdue"
     # Validate patron ID
     if not patron_id or not patron_id.isdigit() or len(patron_id) != 6:
-        return json.dumps({ 
-        'fee_amount': book_fee,
-        'days_overdue': days_over,
-        'status': "This is invalid patron id"})
-
+        return LateFeeResult(0.0, 0, "This is invalid patron id")
 
     # Check if book exists
     # book id should be greater than or equal to 1
     if book_id < 1:
-        return json.dumps({'fee_amount': book_fee,
-        'days_overdue': days_over,
-        'status': "invalid book id"})
+        return LateFeeResult(0.0, 0, "invalid book id")
     
     book = get_book_by_id(book_id)
     if not book:
-        return json.dumps({ 
-        'fee_amount': book_fee,
-        'days_overdue': days_over,
-        'status': "Book not found"})
+        return LateFeeResult(0.0, 0, "Book not found")
     
     # assume if 6 digit number, then for sure there will be record
     borrowed_books = get_patron_borrowed_books(patron_id)
 
     # this patron currently has no borrowed books in record
     if borrowed_books==[]:
-        return json.dumps({ 
-        'fee_amount': 0.00,
-        'days_overdue': 0,
-        'status': 'No charges available for this patron'
-    })
+        return LateFeeResult(0.00, 0, 'No charges available for this patron')
     
     # Look for the one book with book id
     for book in borrowed_books:
-        book_fee = 0.0
-        # covert to date to ignore the hour subtraction. 2025-10-11 17:00 to 2025-10-11
-        due_date = book['due_date'].date()
-        today = (datetime.now()).date()
         # found the book, start calculation
         if book['book_id'] == book_id:
-            if (due_date<today):  ##########test with >
-                msg = "Book overdue"
-                # days_over = (due_date - today).days ######test use
-                
-                # days_over = 20 #and test with daysover by 20
-                days_over = (today - due_date).days # right statement
-                if days_over <= 7:
-                    book_fee = days_over*0.5
-                elif days_over > 7:
-                    book_fee = 7 * 0.5 + (days_over-7) * 1.0
-            break
-    if book_fee > 15.0:
-        book_fee = 15.0
+            return late_fee_for_due_date(book['due_date'])
     #Fee amount owed: $6.50 Days overdue: 10 Status: Book(s) overdue
-    # return the calculated values
-    return json.dumps({ 
-        'fee_amount': book_fee,
-        'days_overdue': days_over,
-        'status': msg
-    })
-    
+    return LateFeeResult(0.0, 0, "This book is not overdue")
+
+def encode_catalog_cursor(book: Dict) -> str:
+    """Encode the (title, id) position of a book as an opaque cursor token."""
+    raw = json.dumps([book['title'], book['id']]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_catalog_cursor(cursor: str) -> Optional[Tuple[str, int]]:
+    """Decode a cursor token back into (title, id); None if it is malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        title, book_id = json.loads(raw.decode('utf-8'))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(title, str) or not isinstance(book_id, int):
+        return None
+    return title, book_id
+
+def get_catalog_page(cursor: Optional[str] = None, limit: Optional[int] = None) -> Tuple[bool, str, Dict]:
+    """
+    Get one page of the catalog ordered by title.
+
+    Args:
+        cursor: Opaque token from a previous page's next_cursor, None for the first page
+        limit: Page size (1 to MAX_CATALOG_PAGE_SIZE, default CATALOG_PAGE_SIZE)
+
+    Returns:
+        tuple: (success: bool, message: str, page: Dict{
+            'books': List[Dict],
+            'next_cursor': Optional[str], None on the last page
+            'limit': int})
+    """
+    if limit is None:
+        limit = CATALOG_PAGE_SIZE
+    if not isinstance(limit, int) or limit < 1 or limit > MAX_CATALOG_PAGE_SIZE:
+        return False, f"Limit must be between 1 and {MAX_CATALOG_PAGE_SIZE}.", {}
+
+    after = None
+    if cursor:
+        after = decode_catalog_cursor(cursor)
+        if after is None:
+            return False, "Invalid page cursor.", {}
+
+    # Fetch one extra row to learn whether another page follows
+    books = get_books_page(limit + 1, after)
+    next_cursor = None
+    if len(books) > limit:
+        books = books[:limit]
+        next_cursor = encode_catalog_cursor(books[-1])
+
+    return True, "", {'books': books, 'next_cursor': next_cursor, 'limit': limit}
 
 def search_books_in_catalog(search_term: str, search_type: str) -> List[Dict]:
     """
@@ -257,28 +390,25 @@ def search_books_in_catalog(search_term: str, search_type: str) -> List[Dict]:
 
     Implement R6 as per requirements
     """
-    all_books = get_all_books()
-    
+    search_type = search_type.lower()
     # wrong search type - return empty list
-    if search_type.lower() != "title" and search_type.lower() != "author" and search_type.lower() != "isbn":
+    if search_type != "title" and search_type != "author" and search_type != "isbn":
         return []
-    match_book = []
-    
-    for book in all_books:
-        found = False
-        if search_type.lower() == "title": # Title search: Partial matching, case-insensitive 
-            if search_term.lower() in book['title'].lower():
-                found = True
-        elif search_type.lower() == "author": # Author search: Partial matching, case-insensitive
-            if search_term.lower() in book['author'].lower(): 
-                found = True
-        elif search_type.lower() == "isbn":# ISBN search: Exact matching
-            if search_term == book['isbn']:
-                found = True
-        if found:
-            match_book.append(book)
-            #match_book.append({'ID':book['id'],'Title':book['title'],'Author':book['author'],'ISBN':book['isbn'],'available_copies':book['available_copies']})
-    return match_book
+
+    # ISBN search: Exact matching, straight to the unique index
+    if search_type == "isbn":
+        book = get_book_by_isbn(search_term)
+        return [book] if book else []
+
+    # Title/Author search: Partial matching, case-insensitive, ranked by the
+    # full-text index when it can answer, otherwise scan the whole catalog
+    candidates = search_books_fulltext(search_type, search_term)
+    if candidates is None:
+        candidates = get_all_books()
+
+    # The index only narrows candidates; this keeps the exact matching rules
+    term = search_term.lower()
+    return [book for book in candidates if term in book[search_type].lower()]
 
 def get_patron_status_report(patron_id: str) -> Dict:
     """
@@ -303,32 +433,23 @@ def get_patron_status_report(patron_id: str) -> Dict:
     if not patron_id or not patron_id.isdigit() or len(patron_id) != 6:
         return {}
     
+    # Query 1: currently borrowed books with due dates (list of dict)
     books = get_patron_borrowed_books(patron_id)
-    total_fee = 0
-    # Currently borrowed books with due dates
-    # list of dict
+    # Late fees for all of them in one pass over the rows already loaded
+    fees = calculate_late_fees(books)
+    total_fee = 0.0
     borrowed_books = []
-    for book in books:
-        book_fee = json.loads(calculate_late_fee_for_book(patron_id,book['book_id']))['fee_amount']
+    for book, fee in zip(books, fees):
         # Total late fees owed
-        total_fee += book_fee
-        book['current_fee'] = book_fee
+        total_fee += fee.fee_amount
+        book['current_fee'] = fee.fee_amount
         borrowed_books.append(book)
     
     # Number of books currently borrowed
-    borrowed_count = get_patron_borrow_count(patron_id)
-    
-    """Get all borrowing record for this patron from the database."""
-    # Borrowing history
-    # assuming want the borrows records from the database
-    conn = get_db_connection()
-    records = conn.execute('''
-        SELECT * FROM borrow_records WHERE patron_id = ? ORDER BY borrow_date
-    ''', (patron_id,)).fetchall()
-    conn.close()
-    # history is a list of dict
-    ###########maybe add title
-    history = [dict(book) for book in records]
+    borrowed_count = len(borrowed_books)
+    
+    # Query 2: borrowing history, currently borrowed and returned
+    history = get_patron_borrow_history(patron_id)
     return {
         'borrowed_book_with_due_date': borrowed_books,
         'fee_amount':total_fee,
@@ -337,7 +458,45 @@ def get_patron_status_report(patron_id: str) -> Dict:
         }
 
 
-def pay_late_fees(patron_id: str, book_id: int, payment_gateway: PaymentGateway = None) -> Tuple[bool, str, Optional[str]]:
+def _with_idempotency_key(idempotency_key: Optional[str], patron_id: str, book_id: Optional[int],
+                          pay: Callable[[], Tuple[bool, str, Optional[str]]]) -> Tuple[bool, str, Optional[str]]:
+    """
+    Run `pay` at most once per idempotency key.
+
+    The key is claimed before the gateway is called, so a retry arriving while
+    the first attempt is still waiting on the gateway cannot charge again. A
+    key whose attempt was declined or never reached the gateway may be
+    retried; one that succeeded replays its transaction. A key whose gateway
+    call failed midway (timeout, dropped connection) stays pending for good,
+    since the patron may have been charged.
+    """
+    if not idempotency_key:
+        try:
+            return pay()
+        except _ChargeOutcomeUnknown as e:
+            return False, f"{e} {CHARGE_MAY_HAVE_GONE_THROUGH}", None
+
+    claimed, request = claim_payment_request(idempotency_key, patron_id, book_id)
+    if not claimed:
+        if (request['patron_id'], request['book_id']) != (patron_id, book_id):
+            return False, "Idempotency key was already used for a different payment.", None
+        if request['status'] == 'pending':
+            return False, request['message'] or "Payment with this idempotency key is already in progress.", None
+        return True, f"Payment already processed. Transaction ID: {request['transaction_id']}", request['transaction_id']
+
+    result = (False, "Payment processing error: payment interrupted", None)
+    settled = True
+    try:
+        result = pay()
+    except _ChargeOutcomeUnknown as e:
+        result, settled = (False, f"{e} {CHARGE_MAY_HAVE_GONE_THROUGH}", None), False
+    finally:
+        finish_payment_request(idempotency_key, result[0] if settled else None, result[1], result[2])
+    return result
+
+
+def pay_late_fees(patron_id: str, book_id: int, payment_gateway: PaymentGateway = None,
+                  idempotency_key: Optional[str] = None) -> Tuple[bool, str, Optional[str]]:
     """
     Process payment for late fees using external payment gateway.
     
@@ -348,6 +507,8 @@ def pay_late_fees(patron_id: str, book_id: int, payment_gateway: PaymentGateway
         patron_id: 6-digit library card ID
         book_id: ID of the book with late fees
         payment_gateway: Payment gateway instance (injectable for testing)
+        idempotency_key: Client-chosen key for this payment; resubmitting it
+            returns the recorded charge instead of charging again
         
     Returns:
         tuple: (success: bool, message: str, transaction_id: Optional[str])
@@ -362,14 +523,17 @@ def pay_late_fees(patron_id: str, book_id: int, payment_gateway: PaymentGateway
     if not patron_id or not patron_id.isdigit() or len(patron_id) != 6:
         return False, "Invalid patron ID. Must be exactly 6 digits.", None
     
+    return _with_idempotency_key(idempotency_key, patron_id, book_id,
+                                 lambda: _pay_late_fee(patron_id, book_id, payment_gateway, idempotency_key))
+
+
+def _pay_late_fee(patron_id: str, book_id: int, payment_gateway: Optional[PaymentGateway],
+                  idempotency_key: Optional[str]) -> Tuple[bool, str, Optional[str]]:
     # Calculate late fee first
     fee_info = calculate_late_fee_for_book(patron_id, book_id)
     
-    # Check if there's a fee to pay
-    if not fee_info or 'fee_amount' not in fee_info:
-        return False, "Unable to calculate late fees.", None
-    
-    fee_amount = fee_info.get('fee_amount', 0.0)
+    # Only what is still owed: earlier payments (single or pay-all) count towards the fee
+    fee_amount = round(max(fee_info.fee_amount - get_open_loan_paid_amount(patron_id, book_id), 0.0), 2)
     
     if fee_amount <= 0:
         return False, "No late fees to pay for this book.", None
@@ -379,9 +543,9 @@ def pay_late_fees(patron_id: str, book_id: int, payment_gateway: PaymentGateway
     if not book:
         return False, "Book not found.", None
     
-    # Use provided gateway or create new one
+    # Use provided gateway or the shared one
     if payment_gateway is None:
-        payment_gateway = PaymentGateway()
+        payment_gateway = get_default_gateway()
     
     # Process payment through external gateway
     # THIS IS WHAT YOU SHOULD MOCK IN THEIR TESTS!
@@ -392,17 +556,89 @@ def pay_late_fees(patron_id: str, book_id: int, payment_gateway: PaymentGateway
             description=f"Late fees for '{book['title']}'"
         )
         
-        if success:
-            return True, f"Payment successful! {message}", transaction_id
-        else:
+        if not success:
             return False, f"Payment failed: {message}", None
             
+    except GatewayUnavailableError as e:
+        # Refused by the breaker or bulkhead: the gateway never saw the charge
+        return False, f"Payment processing error: {str(e)}", None
     except Exception as e:
-        # Handle payment gateway errors
+        # Timeouts and dropped connections may come after the charge was made
+        raise _ChargeOutcomeUnknown(f"Payment processing error: {str(e)}") from e
+    
+    # The charge went through; a failed ledger write is flagged, not turned into an error
+    if not record_payment(transaction_id, patron_id, book_id, fee_amount, idempotency_key):
+        message += " (not recorded in the payments ledger)"
+    return True, f"Payment successful! {message}", transaction_id
+
+
+def pay_all_late_fees(patron_id: str, payment_gateway: PaymentGateway = None,
+                      idempotency_key: Optional[str] = None) -> Tuple[bool, str, Optional[str]]:
+    """
+    Pay every outstanding late fee of a patron with a single gateway charge.
+
+    Fees come from one query over the patron's overdue loans, net of what was
+    already paid towards each loan. The charge is itemised per book in its
+    description and its per-book split is kept in the payments ledger, so
+    refund_late_fee_payment can refund one book of it.
+
+    Args:
+        patron_id: 6-digit library card ID
+        payment_gateway: Payment gateway instance (injectable for testing)
+        idempotency_key: Client-chosen key for this payment, as for pay_late_fees
+
+    Returns:
+        tuple: (success: bool, message: str, transaction_id: Optional[str])
+    """
+    if not patron_id or not patron_id.isdigit() or len(patron_id) != 6:
+        return False, "Invalid patron ID. Must be exactly 6 digits.", None
+
+    return _with_idempotency_key(idempotency_key, patron_id, None,
+                                 lambda: _pay_all_late_fees(patron_id, payment_gateway, idempotency_key))
+
+
+def _pay_all_late_fees(patron_id: str, payment_gateway: Optional[PaymentGateway],
+                       idempotency_key: Optional[str]) -> Tuple[bool, str, Optional[str]]:
+    today = datetime.now()
+    loans = get_outstanding_fee_loans(patron_id, today.date().isoformat())
+    items = []
+    for loan, fee in zip(loans, calculate_late_fees(loans, today)):
+        owed = round(max(fee.fee_amount - loan['paid'], 0.0), 2)
+        if owed > 0:
+            items.append((loan, owed))
+
+    if not items:
+        return False, "No late fees to pay.", None
+
+    total = round(sum(owed for _, owed in items), 2)
+    description = "Late fees: " + "; ".join(f"'{loan['title']}' ${owed:.2f}" for loan, owed in items)
+
+    if payment_gateway is None:
+        payment_gateway = get_default_gateway()
+
+    try:
+        success, transaction_id, message = payment_gateway.process_payment(
+            patron_id=patron_id,
+            amount=total,
+            description=description
+        )
+
+        if not success:
+            return False, f"Payment failed: {message}", None
+
+    except GatewayUnavailableError as e:
         return False, f"Payment processing error: {str(e)}", None
+    except Exception as e:
+        raise _ChargeOutcomeUnknown(f"Payment processing error: {str(e)}") from e
+
+    allocations = [(loan['book_id'], owed) for loan, owed in items]
+    if not record_batch_payment(transaction_id, patron_id, total, allocations, idempotency_key):
+        message += " (not recorded in the payments ledger)"
+    return True, f"Payment successful! {message}", transaction_id
 
 
-def refund_late_fee_payment(transaction_id: str, amount: float, payment_gateway: PaymentGateway = None) -> Tuple[bool, str]:
+def refund_late_fee_payment(transaction_id: str, amount: float, payment_gateway: PaymentGateway = None,
+                            book_id: Optional[int] = None) -> Tuple[bool, str]:
     """
     Refund a late fee payment (e.g., if book was returned on time but fees were charged in error).
     
@@ -412,6 +648,8 @@ def refund_late_fee_payment(transaction_id: str, amount: float, payment_gateway:
         transaction_id: Original transaction ID to refund
         amount: Amount to refund
         payment_gateway: Payment gateway instance (injectable for testing)
+        book_id: Book whose share of the payment to refund; required for
+            payments made with pay_all_late_fees
         
     Returns:
         tuple: (success: bool, message: str)
@@ -426,19 +664,40 @@ def refund_late_fee_payment(transaction_id: str, amount: float, payment_gateway:
     if amount > 15.00:  # Maximum late fee per book
         return False, "Refund amount exceeds maximum late fee."
     
-    # Use provided gateway or create new one
+    # Charges made before the ledger existed are only held to the per-book maximum,
+    # but no refund goes out when the ledger cannot be read
+    try:
+        payment = get_payment(transaction_id)
+    except Exception:
+        return False, "Unable to verify the original payment."
+    if payment is not None and amount > round(payment['amount'] - payment['refunded'], 2):
+        return False, "Refund amount exceeds the amount paid."
+    if payment is not None and payment['book_id'] is None and book_id is None:
+        # The refund must net against one book's fee, or that fee stays paid
+        return False, "This payment covered several books; choose the book to refund."
+    
+    if book_id is not None:
+        allocation = get_payment_allocation(transaction_id, book_id)
+        if allocation is None:
+            return False, "This payment did not cover that book."
+        if amount > round(allocation['amount'] - allocation['refunded'], 2):
+            return False, "Refund amount exceeds the amount paid for this book."
+    
+    # Use provided gateway or the shared one
     if payment_gateway is None:
-        payment_gateway = PaymentGateway()
+        payment_gateway = get_default_gateway()
     
     # Process refund through external gateway
     # THIS IS WHAT YOU SHOULD MOCK IN YOUR TESTS!
     try:
         success, message = payment_gateway.refund_payment(transaction_id, amount)
         
-        if success:
-            return True, message
-        else:
+        if not success:
             return False, f"Refund failed: {message}"
             
     except Exception as e:
         return False, f"Refund processing error: {str(e)}"
+    
+    if not record_refund(transaction_id, amount, book_id):
+        message += " (not recorded in the payments ledger)"
+    return True, message
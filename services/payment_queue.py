@@ -0,0 +1,206 @@
+"""
+Payment Queue Module - Asynchronous late fee payments
+Payments are recorded as jobs in the payment_jobs table and charged by a pool
+of background workers, so a request only waits for one INSERT instead of the
+gateway round trip. An idempotency key per job makes client retries safe.
+"""
+
+import sqlite3
+import threading
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, Optional, Tuple
+
+from database import (
+    create_payment_job, claim_payment_job, finish_payment_job, retry_payment_job,
+    fail_stale_payment_jobs, get_payment_job_counts
+)
+from services.library_service import pay_late_fees
+from services.payment_service import PaymentGateway, get_default_gateway
+from services.resilience import GatewayUnavailableError
+
+PAYMENT_WORKERS = 2
+PAYMENT_POLL_INTERVAL = 5.0
+# Jobs still 'processing' after this long belonged to a worker that died
+STALE_JOB_AFTER = timedelta(minutes=10)
+STALE_JOB_MESSAGE = "Payment interrupted. Check the gateway before submitting it again."
+# Jobs refused by the circuit breaker or bulkhead go back in the queue,
+# waiting twice as long after each refusal, until they run out of attempts
+RETRY_BACKOFF = timedelta(seconds=5)
+RETRY_MAX_BACKOFF = timedelta(minutes=5)
+MAX_ATTEMPTS = 10
+
+def default_idempotency_key(patron_id: str, book_id: int) -> str:
+    """Key used when the client sends none: one late fee payment per book per day."""
+    return f"late-fee:{patron_id}:{book_id}:{date.today().isoformat()}"
+
+def enqueue_payment(patron_id: str, book_id: int, idempotency_key: Optional[str] = None) -> Tuple[bool, str, Optional[Dict]]:
+    """
+    Queue a late fee payment for a borrowed book.
+
+    Submitting the same idempotency key again returns the job created the first
+    time instead of queueing (and charging) a second payment. A job that failed
+    without charging anything is queued again.
+
+    Args:
+        patron_id: 6-digit library card ID
+        book_id: ID of the book with late fees
+        idempotency_key: Client-chosen key identifying this payment attempt
+
+    Returns:
+        tuple: (success: bool, message: str, job: Optional[Dict])
+    """
+    if not patron_id or not patron_id.isdigit() or len(patron_id) != 6:
+        return False, "Invalid patron ID. Must be exactly 6 digits.", None
+
+    if not isinstance(book_id, int) or book_id <= 0:
+        return False, "Invalid book ID.", None
+
+    key = idempotency_key or default_idempotency_key(patron_id, book_id)
+    job, queued = create_payment_job(key, patron_id, book_id)
+
+    if not queued:
+        if (job['patron_id'], job['book_id']) != (patron_id, book_id):
+            return False, "Idempotency key was already used for a different payment.", None
+        return True, "Payment already submitted.", job
+
+    if _workers is not None:
+        _workers.notify()
+    return True, "Payment queued.", job
+
+class _RefusalWatcher:
+    """Passes charges through to a gateway, remembering whether it refused one as unavailable."""
+
+    def __init__(self, gateway: PaymentGateway):
+        self.gateway = gateway
+        self.refused = False
+
+    def process_payment(self, *args, **kwargs):
+        try:
+            return self.gateway.process_payment(*args, **kwargs)
+        except GatewayUnavailableError:
+            self.refused = True
+            raise
+
+def retry_delay(attempts: int) -> timedelta:
+    """Backoff before a job refused on its `attempts`-th try is claimed again."""
+    seconds = RETRY_BACKOFF.total_seconds() * 2.0 ** (attempts - 1)
+    return timedelta(seconds=min(seconds, RETRY_MAX_BACKOFF.total_seconds()))
+
+def process_next_job(payment_gateway: PaymentGateway) -> Optional[Dict]:
+    """
+    Claim the oldest queued job and charge it through `payment_gateway`.
+
+    A charge refused without reaching the gateway (open circuit breaker, full
+    bulkhead) puts the job back in the queue with a backoff instead of
+    failing it, up to MAX_ATTEMPTS tries.
+
+    Returns:
+        Optional[Dict]: The finished or re-queued job, or None if the queue was empty
+    """
+    job = claim_payment_job()
+    if job is None:
+        return None
+
+    gateway = _RefusalWatcher(payment_gateway)
+    try:
+        success, message, transaction_id = pay_late_fees(job['patron_id'], job['book_id'], gateway,
+                                                         job['idempotency_key'])
+    except Exception as e:
+        success, message, transaction_id = False, f"Payment processing error: {str(e)}", None
+
+    if gateway.refused and job['attempts'] < MAX_ATTEMPTS:
+        available_at = (datetime.now() + retry_delay(job['attempts'])).isoformat()
+        retry_payment_job(job['id'], message, available_at)
+        job.update(status='queued', message=message, available_at=available_at)
+        return job
+
+    finish_payment_job(job['id'], success, message, transaction_id)
+    job.update(status='succeeded' if success else 'failed', message=message, transaction_id=transaction_id)
+    return job
+
+class PaymentWorkerPool:
+    """Background threads that drain the payment queue concurrently."""
+
+    def __init__(self, workers: int = PAYMENT_WORKERS, poll_interval: float = PAYMENT_POLL_INTERVAL,
+                 gateway_factory: Callable[[], PaymentGateway] = get_default_gateway):
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.gateway_factory = gateway_factory
+        self.succeeded = 0
+        self.failed = 0
+        self.retried = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def notify(self):
+        """Wake idle workers because a job was queued."""
+        self._wakeup.set()
+
+    def _run(self):
+        gateway = self.gateway_factory()
+        while not self._stop.is_set():
+            self._wakeup.clear()
+            try:
+                job = process_next_job(gateway)
+            except sqlite3.Error:
+                with self._lock:
+                    self.errors += 1
+                job = None
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                continue
+            with self._lock:
+                if job['status'] == 'succeeded':
+                    self.succeeded += 1
+                elif job['status'] == 'queued':
+                    self.retried += 1
+                else:
+                    self.failed += 1
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f'payment-worker-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {'workers': self.workers, 'succeeded': self.succeeded,
+                    'failed': self.failed, 'retried': self.retried, 'errors': self.errors}
+
+_workers = None
+
+def start_payment_workers(workers: int = PAYMENT_WORKERS, poll_interval: float = PAYMENT_POLL_INTERVAL,
+                          gateway_factory: Callable[[], PaymentGateway] = get_default_gateway) -> Optional[PaymentWorkerPool]:
+    """Start (or restart) the payment workers; 0 workers leaves jobs queued."""
+    global _workers
+    stop_payment_workers()
+    stale_before = (datetime.now() - STALE_JOB_AFTER).isoformat()
+    fail_stale_payment_jobs(stale_before, STALE_JOB_MESSAGE)
+    if workers and workers > 0:
+        _workers = PaymentWorkerPool(workers, poll_interval, gateway_factory)
+        _workers.start()
+    return _workers
+
+def stop_payment_workers():
+    """Stop the payment workers, letting in-flight payments finish."""
+    global _workers
+    if _workers is not None:
+        _workers.stop()
+        _workers = None
+
+def get_payment_queue_stats() -> Dict:
+    """Get job counts per status and worker counters."""
+    return {
+        'jobs': get_payment_job_counts(),
+        'workers': _workers.stats() if _workers else None
+    }
@@ -7,9 +7,65 @@ since we cannot make actual payment API calls during testing.
 """
 
 import requests
-from typing import Dict, Tuple
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import Dict, Optional, Tuple
+import threading
 import time
 
+from services.resilience import Bulkhead, CircuitBreaker, ResilientPaymentGateway
+
+DEFAULT_BASE_URL = "https://api.payment-gateway.example.com"
+
+# HTTP session tuning for live mode
+GATEWAY_POOL_SIZE = 10
+GATEWAY_MAX_RETRIES = 3
+GATEWAY_BACKOFF_FACTOR = 0.2
+GATEWAY_CONNECT_TIMEOUT = 3.05
+GATEWAY_READ_TIMEOUT = 10.0
+
+# Simulated network latency of each gateway call, in seconds
+CHARGE_LATENCY = 0.5
+REFUND_LATENCY = 0.5
+STATUS_LATENCY = 0.3
+
+def simulate_charge(patron_id: str, amount: float) -> Tuple[bool, str, str]:
+    """Gateway decision for a charge; shared by the sync, async and fake-server gateways."""
+    if amount <= 0:
+        return False, "", "Invalid amount: must be greater than 0"
+    
+    if amount > 1000:
+        return False, "", "Payment declined: amount exceeds limit"
+    
+    if len(patron_id) != 6:
+        return False, "", "Invalid patron ID format"
+    
+    transaction_id = f"txn_{patron_id}_{int(time.time())}"
+    return True, transaction_id, f"Payment of ${amount:.2f} processed successfully"
+
+def simulate_refund(transaction_id: str, amount: float) -> Tuple[bool, str]:
+    """Gateway decision for a refund."""
+    if not transaction_id or not transaction_id.startswith("txn_"):
+        return False, "Invalid transaction ID"
+    
+    if amount <= 0:
+        return False, "Invalid refund amount"
+    
+    refund_id = f"refund_{transaction_id}_{int(time.time())}"
+    return True, f"Refund of ${amount:.2f} processed successfully. Refund ID: {refund_id}"
+
+def simulate_status(transaction_id: str) -> Dict:
+    """Gateway answer for a status lookup."""
+    if not transaction_id or not transaction_id.startswith("txn_"):
+        return {"status": "not_found", "message": "Transaction not found"}
+    
+    return {
+        "transaction_id": transaction_id,
+        "status": "completed",
+        "amount": 10.50,
+        "timestamp": time.time()
+    }
+
 
 class PaymentGateway:
     """
@@ -20,17 +76,71 @@ class PaymentGateway:
     - Making actual API calls
     - Depending on external service availability
     - Incurring costs or rate limits
+    
+    With live=True calls go over HTTP through one requests.Session whose
+    connection pool is shared by every thread using this instance, so
+    keep-alive connections are reused instead of reconnecting per call.
+    Only connection failures and idempotent GETs are retried; a charge or
+    refund that may have reached the gateway is never sent twice.
     """
     
-    def __init__(self, api_key: str = "test_key_12345"):
+    def __init__(self, api_key: str = "test_key_12345", base_url: str = DEFAULT_BASE_URL, live: bool = False,
+                 pool_size: int = GATEWAY_POOL_SIZE, max_retries: int = GATEWAY_MAX_RETRIES,
+                 backoff_factor: float = GATEWAY_BACKOFF_FACTOR,
+                 timeout: Tuple[float, float] = (GATEWAY_CONNECT_TIMEOUT, GATEWAY_READ_TIMEOUT)):
         """
         Initialize payment gateway with API credentials.
         
         Args:
             api_key: API key for authentication (default is test key)
+            base_url: Gateway API root used in live mode
+            live: Make real HTTP calls instead of simulating them
+            pool_size: Keep-alive connections kept per host
+            max_retries: Retries for connection errors and failed GETs, with exponential backoff
+            backoff_factor: Backoff base in seconds between retries
+            timeout: (connect, read) timeout in seconds for every request
         """
         self.api_key = api_key
-        self.base_url = "https://api.payment-gateway.example.com"
+        self.base_url = base_url.rstrip('/')
+        self.live = live
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.requests = 0
+        self._lock = threading.Lock()
+        
+        retry = Retry(total=max_retries, connect=max_retries, read=max_retries, status=max_retries,
+                      backoff_factor=backoff_factor, status_forcelist=(502, 503, 504),
+                      allowed_methods=frozenset({'GET'}), raise_on_status=False)
+        self._adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True, max_retries=retry)
+        self.session = requests.Session()
+        self.session.headers['Authorization'] = f"Bearer {api_key}"
+        self.session.mount('https://', self._adapter)
+        self.session.mount('http://', self._adapter)
+    
+    def _request(self, method: str, path: str, **kwargs) -> Dict:
+        with self._lock:
+            self.requests += 1
+        response = self.session.request(method, f"{self.base_url}{path}", timeout=self.timeout, **kwargs)
+        response.raise_for_status()
+        return response.json()
+    
+    def stats(self) -> Dict:
+        """Connection pool counters: requests sent and connections opened to serve them."""
+        pools = self._adapter.poolmanager.pools
+        opened = sum(pool.num_connections for pool in map(pools.get, pools.keys()) if pool is not None)
+        with self._lock:
+            sent = self.requests
+        return {
+            'live': self.live,
+            'requests': sent,
+            'connections_opened': opened,
+            'connections_reused': max(sent - opened, 0),
+            'pool_size': self.pool_size
+        }
+    
+    def close(self):
+        """Close the pooled connections."""
+        self.session.close()
     
     def process_payment(self, patron_id: str, amount: float, description: str = "") -> Tuple[bool, str, str]:
         """
@@ -51,36 +161,21 @@ class PaymentGateway:
             gateway = PaymentGateway()
             success, txn_id, msg = gateway.process_payment("123456", 10.50, "Late fees")
         """
-        # Simulate API call delay
-        time.sleep(0.5)
+        if self.live:
+            result = self._request('POST', '/charges', json={
+                "customer_id": patron_id,
+                "amount": amount,
+                "currency": "usd",
+                "description": description
+            })
+            return result['success'], result['transaction_id'], result['message']
         
-        # In a real implementation, this would make an HTTP request:
-        # response = requests.post(
-        #     f"{self.base_url}/charges",
-        #     headers={"Authorization": f"Bearer {self.api_key}"},
-        #     json={
-        #         "customer_id": patron_id,
-        #         "amount": amount,
-        #         "currency": "usd",
-        #         "description": description
-        #     }
-        # )
+        # Simulate API call delay
+        time.sleep(CHARGE_LATENCY)
         
         # For this template, we simulate different scenarios based on amount
         # This allows testing without a real API
-        
-        if amount <= 0:
-            return False, "", "Invalid amount: must be greater than 0"
-        
-        if amount > 1000:
-            return False, "", "Payment declined: amount exceeds limit"
-        
-        if len(patron_id) != 6:
-            return False, "", "Invalid patron ID format"
-        
-        # Simulate successful payment
-        transaction_id = f"txn_{patron_id}_{int(time.time())}"
-        return True, transaction_id, f"Payment of ${amount:.2f} processed successfully"
+        return simulate_charge(patron_id, amount)
     
     def refund_payment(self, transaction_id: str, amount: float) -> Tuple[bool, str]:
         """
@@ -96,16 +191,12 @@ class PaymentGateway:
         Returns:
             tuple: (success: bool, message: str)
         """
-        time.sleep(0.5)
-        
-        if not transaction_id or not transaction_id.startswith("txn_"):
-            return False, "Invalid transaction ID"
+        if self.live:
+            result = self._request('POST', '/refunds', json={"transaction_id": transaction_id, "amount": amount})
+            return result['success'], result['message']
         
-        if amount <= 0:
-            return False, "Invalid refund amount"
-        
-        refund_id = f"refund_{transaction_id}_{int(time.time())}"
-        return True, f"Refund of ${amount:.2f} processed successfully. Refund ID: {refund_id}"
+        time.sleep(REFUND_LATENCY)
+        return simulate_refund(transaction_id, amount)
     
     def verify_payment_status(self, transaction_id: str) -> Dict:
         """
@@ -120,15 +211,41 @@ class PaymentGateway:
         Returns:
             dict: Payment status information
         """
-        time.sleep(0.3)
+        if self.live:
+            return self._request('GET', f'/charges/{transaction_id}')
         
-        if not transaction_id or not transaction_id.startswith("txn_"):
-            return {"status": "not_found", "message": "Transaction not found"}
+        time.sleep(STATUS_LATENCY)
         
         # Simulate status check
-        return {
-            "transaction_id": transaction_id,
-            "status": "completed",
-            "amount": 10.50,
-            "timestamp": time.time()
-        }
+        return simulate_status(transaction_id)
+
+
+_default_gateway = None
+_default_gateway_lock = threading.Lock()
+
+def configure_default_gateway(circuit_breaker: Optional[CircuitBreaker] = None, bulkhead: Optional[Bulkhead] = None,
+                              **settings) -> ResilientPaymentGateway:
+    """
+    Replace the process-wide gateway, e.g. with live=True and a base_url from app config.
+    
+    It is wrapped in a circuit breaker and bulkhead (defaults from services.resilience).
+    """
+    global _default_gateway
+    with _default_gateway_lock:
+        if _default_gateway is not None:
+            _default_gateway.close()
+        _default_gateway = ResilientPaymentGateway(PaymentGateway(**settings), circuit_breaker, bulkhead)
+        return _default_gateway
+
+def get_default_gateway() -> ResilientPaymentGateway:
+    """Get the process-wide gateway shared by every request thread (created on first use)."""
+    global _default_gateway
+    with _default_gateway_lock:
+        if _default_gateway is None:
+            _default_gateway = ResilientPaymentGateway(PaymentGateway())
+        return _default_gateway
+
+def get_gateway_stats() -> Optional[Dict]:
+    """Connection counters of the process-wide gateway, if one has been created."""
+    gateway = _default_gateway
+    return gateway.stats() if gateway is not None else None
@@ -0,0 +1,130 @@
+"""
+Reconciliation Module - Check the payments ledger against the gateway
+Pending ledger rows are verified with verify_payment_status in batches, the
+calls of a batch running concurrently on an AsyncPaymentGateway, and every row
+is marked verified or mismatch. Rows the gateway could not answer for stay
+pending and are retried by the next run. The simulated gateway knows nothing
+about real charges, so a run against it is always a dry run.
+"""
+
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from database import get_pending_payments, update_payment_verifications
+from services.async_payment_gateway import AsyncPaymentGateway
+
+RECONCILE_CONCURRENCY = 500
+RECONCILE_BATCH_SIZE = 2000
+# Gateway amounts are floats; anything under half a cent is a match
+AMOUNT_TOLERANCE = 0.005
+
+@dataclass
+class ReconciliationReport:
+    """Outcome of a reconciliation run."""
+    checked: int = 0
+    verified: int = 0
+    mismatches: List[Dict] = field(default_factory=list)
+    errors: List[Dict] = field(default_factory=list)
+    batches: int = 0
+    elapsed_seconds: float = 0.0
+
+    @property
+    def verifications_per_second(self) -> float:
+        return self.checked / self.elapsed_seconds if self.elapsed_seconds else 0.0
+
+    def to_dict(self) -> Dict:
+        return {
+            'checked': self.checked,
+            'verified': self.verified,
+            'mismatched': len(self.mismatches),
+            'errored': len(self.errors),
+            'batches': self.batches,
+            'elapsed_seconds': round(self.elapsed_seconds, 3),
+            'verifications_per_second': round(self.verifications_per_second, 1),
+            'mismatches': self.mismatches,
+            'errors': self.errors
+        }
+
+def compare_with_gateway(payment: Dict, status: Dict) -> Tuple[str, str]:
+    """
+    Decide the reconciliation status of one ledger row from the gateway's answer.
+
+    Charges must exist, be completed and match the recorded amount. Refunds
+    are checked against the charge they refund, which must exist.
+
+    Returns:
+        tuple: (status: 'verified' | 'mismatch' | 'error', message: str)
+    """
+    gateway_status = status.get('status')
+    if gateway_status == 'error':
+        return 'error', status.get('message', 'Gateway error')
+    if gateway_status == 'not_found':
+        return 'mismatch', "Transaction not found at the gateway."
+    if payment['kind'] == 'refund':
+        return 'verified', ""
+    if gateway_status != 'completed':
+        return 'mismatch', f"Gateway reports status '{gateway_status}'."
+    gateway_amount = status.get('amount')
+    if gateway_amount is None or abs(gateway_amount - payment['amount']) > AMOUNT_TOLERANCE:
+        return 'mismatch', f"Ledger amount ${payment['amount']:.2f} but gateway has ${gateway_amount or 0:.2f}."
+    return 'verified', ""
+
+async def _reconcile(gateway: AsyncPaymentGateway, batch_size: int, limit: Optional[int], dry_run: bool,
+                     report: ReconciliationReport):
+    last_id = 0
+    while limit is None or report.checked < limit:
+        size = batch_size if limit is None else min(batch_size, limit - report.checked)
+        payments = get_pending_payments(last_id, size)
+        if not payments:
+            break
+        statuses = await gateway.verify_payment_statuses(payment['transaction_id'] for payment in payments)
+
+        results = []
+        for payment, status in zip(payments, statuses):
+            outcome, message = compare_with_gateway(payment, status)
+            stored = 'pending' if outcome == 'error' else outcome
+            results.append((stored, status.get('status'), status.get('amount'), message, payment['id']))
+            if outcome == 'verified':
+                report.verified += 1
+            else:
+                entry = {'payment_id': payment['id'], 'transaction_id': payment['transaction_id'],
+                         'kind': payment['kind'], 'message': message}
+                (report.mismatches if outcome == 'mismatch' else report.errors).append(entry)
+        if not dry_run:
+            update_payment_verifications(results)
+
+        report.checked += len(payments)
+        report.batches += 1
+        last_id = payments[-1]['id']
+
+def reconcile_payments(gateway: Optional[AsyncPaymentGateway] = None, concurrency: int = RECONCILE_CONCURRENCY,
+                       batch_size: int = RECONCILE_BATCH_SIZE, limit: Optional[int] = None,
+                       dry_run: bool = False) -> ReconciliationReport:
+    """
+    Verify every pending ledger row against the payment gateway.
+
+    Args:
+        gateway: Async gateway to query, not yet used by another event loop;
+            defaults to AsyncPaymentGateway(max_in_flight=concurrency)
+        concurrency: Maximum status calls in flight when no gateway is given
+        batch_size: Ledger rows read and updated per transaction
+        limit: Stop after this many rows (default: all pending)
+        dry_run: Report the outcome without updating the ledger
+
+    Returns:
+        ReconciliationReport: counts, mismatches, errors and throughput
+
+    Raises:
+        ValueError: If the gateway is simulated and dry_run is not set
+    """
+    if gateway is None:
+        gateway = AsyncPaymentGateway(max_in_flight=concurrency)
+    if gateway.base_url is None and not dry_run:
+        raise ValueError("The simulated payment gateway cannot verify real payments; use a dry run.")
+    report = ReconciliationReport()
+    start = time.perf_counter()
+    asyncio.run(_reconcile(gateway, batch_size, limit, dry_run, report))
+    report.elapsed_seconds = time.perf_counter() - start
+    return report
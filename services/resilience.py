@@ -0,0 +1,225 @@
+"""
+Resilience Module - Circuit breaker and bulkhead for the payment gateway
+Keeps a slow or failing gateway from tying up every request thread: the
+bulkhead caps how many threads may wait on the gateway at once, and the
+circuit breaker stops calling it altogether while it is unhealthy.
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict
+
+BREAKER_WINDOW_SECONDS = 60.0
+BREAKER_MIN_CALLS = 10
+BREAKER_ERROR_RATE = 0.5
+BREAKER_SLOW_CALL_SECONDS = 2.0
+BREAKER_SLOW_CALL_RATE = 0.5
+BREAKER_OPEN_SECONDS = 30.0
+BREAKER_HALF_OPEN_CALLS = 1
+BULKHEAD_SIZE = 4
+BULKHEAD_WAIT = 0.0
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+class GatewayUnavailableError(Exception):
+    """The call was refused without contacting the gateway."""
+
+class CircuitOpenError(GatewayUnavailableError):
+    """The circuit breaker is open."""
+
+class BulkheadFullError(GatewayUnavailableError):
+    """Too many calls to the gateway are already in flight."""
+
+class CircuitBreaker:
+    """
+    Three-state circuit breaker driven by a rolling time window.
+
+    Closed: calls pass; each outcome is recorded in the window. Once the window
+    holds at least `min_calls` calls and either the error rate or the rate of
+    calls slower than `slow_call_seconds` reaches its threshold, the breaker
+    opens. Open: calls are refused for `open_seconds`. Half-open: up to
+    `half_open_calls` trial calls pass; a healthy one closes the breaker, a
+    failed or slow one opens it again.
+    """
+
+    def __init__(self, window_seconds: float = BREAKER_WINDOW_SECONDS, min_calls: int = BREAKER_MIN_CALLS,
+                 error_rate: float = BREAKER_ERROR_RATE, slow_call_seconds: float = BREAKER_SLOW_CALL_SECONDS,
+                 slow_call_rate: float = BREAKER_SLOW_CALL_RATE, open_seconds: float = BREAKER_OPEN_SECONDS,
+                 half_open_calls: int = BREAKER_HALF_OPEN_CALLS, clock: Callable[[], float] = time.monotonic):
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._trials = 0
+        self._window = deque()  # (finished_at, failed, slow)
+        self._counters = {'calls': 0, 'failures': 0, 'slow_calls': 0, 'rejected': 0,
+                          'opened': 0, 'half_opened': 0, 'closed': 0}
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._maybe_half_open()
+            return self._state
+
+    def _maybe_half_open(self):
+        if self._state == OPEN and self._clock() - self._opened_at >= self.open_seconds:
+            self._state = HALF_OPEN
+            self._trials = 0
+            self._counters['half_opened'] += 1
+
+    def _open(self):
+        self._state = OPEN
+        self._opened_at = self._clock()
+        self._window.clear()
+        self._counters['opened'] += 1
+
+    def before_call(self):
+        """Reserve a call, or raise CircuitOpenError if the breaker refuses it."""
+        with self._lock:
+            self._maybe_half_open()
+            if self._state == CLOSED:
+                return
+            if self._state == HALF_OPEN and self._trials < self.half_open_calls:
+                self._trials += 1
+                return
+            self._counters['rejected'] += 1
+            retry_in = max(self.open_seconds - (self._clock() - self._opened_at), 0)
+        raise CircuitOpenError(f"Payment gateway is temporarily unavailable. Try again in {retry_in:.0f}s.")
+
+    def record(self, succeeded: bool, elapsed: float):
+        """Record the outcome of a call reserved with before_call()."""
+        slow = elapsed >= self.slow_call_seconds
+        with self._lock:
+            now = self._clock()
+            self._counters['calls'] += 1
+            self._counters['failures'] += not succeeded
+            self._counters['slow_calls'] += slow
+
+            if self._state == HALF_OPEN:
+                if succeeded and not slow:
+                    self._state = CLOSED
+                    self._window.clear()
+                    self._counters['closed'] += 1
+                else:
+                    self._open()
+                return
+            if self._state == OPEN:
+                return
+
+            self._window.append((now, not succeeded, slow))
+            while self._window and now - self._window[0][0] > self.window_seconds:
+                self._window.popleft()
+            calls = len(self._window)
+            if calls < self.min_calls:
+                return
+            failures = sum(failed for _, failed, _ in self._window)
+            slow_calls = sum(slow for _, _, slow in self._window)
+            if failures / calls >= self.error_rate or slow_calls / calls >= self.slow_call_rate:
+                self._open()
+
+    def stats(self) -> Dict:
+        """Current state, window rates and transition counters."""
+        with self._lock:
+            self._maybe_half_open()
+            calls = len(self._window)
+            return {
+                'state': self._state,
+                'window_calls': calls,
+                'window_error_rate': round(sum(f for _, f, _ in self._window) / calls, 4) if calls else 0.0,
+                'window_slow_rate': round(sum(s for _, _, s in self._window) / calls, 4) if calls else 0.0,
+                **self._counters
+            }
+
+class Bulkhead:
+    """
+    Caps concurrent calls. A caller waits at most `max_wait` seconds for a slot
+    and then gets BulkheadFullError instead of queueing behind a slow gateway.
+    """
+
+    def __init__(self, max_concurrent: int = BULKHEAD_SIZE, max_wait: float = BULKHEAD_WAIT):
+        self.max_concurrent = max_concurrent
+        self.max_wait = max_wait
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.rejected = 0
+
+    def acquire(self):
+        if self.max_wait > 0:
+            acquired = self._slots.acquire(timeout=self.max_wait)
+        else:
+            acquired = self._slots.acquire(blocking=False)
+        if not acquired:
+            with self._lock:
+                self.rejected += 1
+            raise BulkheadFullError("Payment gateway is busy. Please try again shortly.")
+        with self._lock:
+            self.in_flight += 1
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {'max_concurrent': self.max_concurrent, 'in_flight': self.in_flight, 'rejected': self.rejected}
+
+class ResilientPaymentGateway:
+    """
+    Wraps a payment gateway with a bulkhead and a circuit breaker.
+
+    Same methods and return values as PaymentGateway. Refused calls raise a
+    GatewayUnavailableError with a message fit for the patron, which
+    pay_late_fees and refund_late_fee_payment report as a processing error.
+    Only exceptions (timeouts, connection errors, HTTP errors) count as
+    failures; a declined payment is a healthy answer.
+    """
+
+    def __init__(self, gateway, circuit_breaker: CircuitBreaker = None, bulkhead: Bulkhead = None):
+        self.gateway = gateway
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+        self.bulkhead = bulkhead or Bulkhead()
+
+    def _call(self, method: str, *args, **kwargs):
+        self.bulkhead.acquire()
+        try:
+            self.circuit_breaker.before_call()
+            start = time.monotonic()
+            try:
+                result = getattr(self.gateway, method)(*args, **kwargs)
+            except Exception:
+                self.circuit_breaker.record(False, time.monotonic() - start)
+                raise
+            self.circuit_breaker.record(True, time.monotonic() - start)
+            return result
+        finally:
+            self.bulkhead.release()
+
+    def process_payment(self, patron_id: str, amount: float, description: str = ""):
+        return self._call('process_payment', patron_id=patron_id, amount=amount, description=description)
+
+    def refund_payment(self, transaction_id: str, amount: float):
+        return self._call('refund_payment', transaction_id, amount)
+
+    def verify_payment_status(self, transaction_id: str):
+        return self._call('verify_payment_status', transaction_id)
+
+    def close(self):
+        if hasattr(self.gateway, 'close'):
+            self.gateway.close()
+
+    def stats(self) -> Dict:
+        """Gateway connection counters plus breaker and bulkhead state."""
+        stats = self.gateway.stats() if hasattr(self.gateway, 'stats') else {}
+        return {**stats, 'circuit_breaker': self.circuit_breaker.stats(), 'bulkhead': self.bulkhead.stats()}
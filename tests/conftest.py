@@ -0,0 +1,40 @@
+import uuid
+import pytest
+import database
+import repositories
+from routes import fragments
+from services import payment_queue, payment_service
+
+
+@pytest.fixture(autouse=True)
+def isolated_database():
+    """
+    Give every test its own in-memory database so no test writes library.db.
+    Tests needing a real file (WAL, several processes) point DATABASE at tmp_path.
+    """
+    previous = database.DATABASE
+    database.configure_database(database.memory_database_uri(uuid.uuid4().hex))
+    yield
+    database.configure_database(previous)
+
+
+@pytest.fixture
+def library_db():
+    """The test's in-memory database with the schema created; yields the connection pool."""
+    pool = database.configure_pool(size=2, timeout=5)
+    database.init_database()
+    yield pool
+
+
+@pytest.fixture(autouse=True)
+def isolate_globals():
+    """Keep caches and background workers from leaking between tests that swap the database."""
+    database.clear_book_cache()
+    fragments.clear_fragment_cache()
+    yield
+    payment_queue.stop_payment_workers()
+    payment_service.configure_default_gateway()
+    repositories.configure_repository()
+    database.configure_book_cache()
+    database.configure_export_connections()
+    fragments.configure_fragment_cache()
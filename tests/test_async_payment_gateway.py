@@ -0,0 +1,89 @@
+import asyncio
+import time
+import pytest
+from services import async_payment_gateway, payment_service
+from services.async_payment_gateway import AsyncPaymentGateway, PaymentGatewayError
+from services.fake_payment_server import FakePaymentServer
+
+
+@pytest.fixture
+def server():
+    """Fake gateway on a free local port."""
+    with FakePaymentServer(latency=0.05) as server:
+        yield server
+
+
+def test_simulated_contract_matches_sync_gateway(monkeypatch):
+    """Test the simulated async calls return what PaymentGateway returns."""
+    for name in ("CHARGE_LATENCY", "REFUND_LATENCY", "STATUS_LATENCY"):
+        monkeypatch.setattr(async_payment_gateway, name, 0)
+    monkeypatch.setattr(payment_service.time, "sleep", lambda seconds: None)
+    sync = payment_service.PaymentGateway()
+
+    async def run():
+        gateway = AsyncPaymentGateway()
+        return (await gateway.process_payment("123456", 1500),
+                await gateway.refund_payment("bad", 5),
+                await gateway.verify_payment_status("missing"))
+
+    charge, refund, status = asyncio.run(run())
+
+    assert charge == sync.process_payment("123456", 1500)
+    assert refund == sync.refund_payment("bad", 5)
+    assert status == sync.verify_payment_status("missing")
+
+def test_http_round_trip(server):
+    """Test charge, status and refund against the fake server."""
+    async def run():
+        gateway = AsyncPaymentGateway(base_url=server.url)
+        success, txn, message = await gateway.process_payment("123456", 7.5, "Late fees")
+        return success, txn, message, await gateway.verify_payment_status(txn), await gateway.refund_payment(txn, 7.5)
+
+    success, txn, message, status, refund = asyncio.run(run())
+
+    assert success and txn.startswith("txn_123456_")
+    assert message == "Payment of $7.50 processed successfully"
+    assert status['status'] == 'completed' and status['amount'] == 7.5
+    assert refund[0] is True
+
+def test_bulk_verify_runs_concurrently_within_limit(server):
+    """Test 200 lookups overlap, never exceeding max_in_flight."""
+    async def run():
+        gateway = AsyncPaymentGateway(base_url=server.url, max_in_flight=50)
+        start = time.perf_counter()
+        results = await gateway.verify_payment_statuses(f"txn_{i}" for i in range(200))
+        return gateway, results, time.perf_counter() - start
+
+    gateway, results, elapsed = asyncio.run(run())
+
+    assert len(results) == 200
+    assert all(result['status'] == 'not_found' for result in results)
+    assert gateway.stats()['peak_in_flight'] == 50
+    assert elapsed < 200 * 0.05 / 4
+
+def test_timeout_and_unreachable_become_failed_results(server):
+    """Test slow and unreachable gateways fail per call without breaking the batch."""
+    server.latency = 0.5
+
+    async def run():
+        slow = AsyncPaymentGateway(base_url=server.url, timeout=0.1)
+        with pytest.raises(TimeoutError):
+            await slow.verify_payment_status("txn_1")
+        charges = await slow.process_payments([("123456", 5, ""), ("654321", 5, "")])
+        down = AsyncPaymentGateway(base_url="http://127.0.0.1:1")
+        with pytest.raises(PaymentGatewayError):
+            await down.refund_payment("txn_1", 5)
+        return slow, charges
+
+    slow, charges = asyncio.run(run())
+
+    assert all(success is False and "did not answer" in message for success, _, message in charges)
+    assert slow.stats()['timeouts'] == 3
+
+def test_rejected_api_key(server):
+    """Test an HTTP error status surfaces as PaymentGatewayError."""
+    async def run():
+        await AsyncPaymentGateway(api_key="wrong", base_url=server.url).process_payment("123456", 5)
+
+    with pytest.raises(PaymentGatewayError, match="401"):
+        asyncio.run(run())
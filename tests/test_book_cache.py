@@ -0,0 +1,130 @@
+import pytest
+import database
+from app import create_app
+from cache import LRUCache
+from services import library_service
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def cache_db(library_db):
+    """Database with a couple of books."""
+    database.insert_book("Cached", "Author", "9780000000001", 2, 2)
+    database.insert_book("Other", "Author", "9780000000002", 1, 1)
+    return library_db
+
+
+def test_lru_evicts_least_recently_used():
+    """Test the oldest untouched entry is evicted when over max_entries."""
+    cache = LRUCache(max_entries=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.stats()['evictions'] == 1
+
+def test_lru_respects_byte_budget():
+    """Test entries are evicted to stay under max_bytes and oversize values are skipped."""
+    cache = LRUCache(max_entries=100, max_bytes=200)
+    cache.set('small', 'x')
+    cache.set('huge', 'x' * 1000)
+
+    assert cache.get('huge') is None
+    assert cache.get('small') == 'x'
+    assert cache.stats()['bytes'] <= 200
+
+def test_lru_ttl_expiry():
+    """Test entries expire after ttl seconds."""
+    clock = FakeClock()
+    cache = LRUCache(ttl=5, clock=clock)
+    cache.set('a', 1)
+    clock.now = 4.9
+    assert cache.get('a') == 1
+    clock.now = 5.0
+
+    assert cache.get('a') is None
+    assert cache.stats()['expirations'] == 1
+
+def test_book_lookup_served_from_cache(cache_db, monkeypatch):
+    """Test a repeated lookup by id or ISBN does not touch the database."""
+    assert database.get_book_by_id(1)['title'] == "Cached"
+    assert database.get_book_by_isbn("9780000000001")['id'] == 1
+
+    def no_db():
+        raise AssertionError("database queried")
+    monkeypatch.setattr(database, "get_db_connection", no_db)
+
+    assert database.get_book_by_id(1)['available_copies'] == 2
+    assert database.get_book_by_isbn("9780000000001")['title'] == "Cached"
+    assert database.get_book_cache_stats()['books']['hits'] >= 2
+
+def test_borrow_and_return_refresh_availability(cache_db):
+    """Test borrowing and returning never leave a stale available_copies."""
+    assert database.get_book_by_id(1)['available_copies'] == 2
+
+    assert library_service.borrow_book_by_patron("123456", 1)[0]
+    assert database.get_book_by_id(1)['available_copies'] == 1
+
+    assert library_service.return_book_by_patron("123456", 1)[0]
+    assert database.get_book_by_id(1)['available_copies'] == 2
+
+def test_availability_expiry_only_requeries_copies(cache_db):
+    """Test an expired availability entry is refreshed without reloading the row."""
+    database.get_book_by_id(1)
+    database.invalidate_book_availability(1)
+    hits = database.get_book_cache_stats()['books']['hits']
+
+    book = database.get_book_by_id(1)
+
+    assert book == {'id': 1, 'title': "Cached", 'author': "Author", 'isbn': "9780000000001",
+                    'total_copies': 2, 'available_copies': 2}
+    assert database.get_book_cache_stats()['books']['hits'] == hits + 1
+
+def test_deleted_book_not_served_from_cache(cache_db):
+    """Test a book removed behind the cache's back is dropped on the availability refresh."""
+    database.get_book_by_id(2)
+    with database.db_connection() as conn:
+        conn.execute('DELETE FROM books WHERE id = 2')
+        conn.commit()
+    database.invalidate_book_availability(2)
+
+    assert database.get_book_by_id(2) is None
+    assert database.get_book_by_isbn("9780000000002") is None
+
+def test_insert_invalidates_isbn_miss(cache_db):
+    """Test adding a book makes it visible to ISBN lookups straight away."""
+    assert database.get_book_by_isbn("9780000000003") is None
+
+    assert database.insert_books_batch([("New", "Author", "9780000000003", 1, 1)])
+
+    assert database.get_book_by_isbn("9780000000003")['title'] == "New"
+
+def test_cache_cleared_when_database_changes(cache_db, monkeypatch):
+    """Test pointing at another database does not serve books from the old one."""
+    database.get_book_by_id(1)
+    monkeypatch.setattr(database, "DATABASE", database.memory_database_uri("other"))
+    database.init_database()
+
+    assert database.get_book_by_id(1) is None
+
+def test_cache_configured_and_reported(cache_db):
+    """Test create_app sizes the cache and /api/metrics reports it."""
+    client = create_app({'DB_CHECKPOINT_INTERVAL': 0, 'BOOK_CACHE_MAX_ENTRIES': 50,
+                         'BOOK_CACHE_TTL': 60}).test_client()
+    database.get_book_by_id(1)
+
+    stats = client.get('/api/metrics').get_json()['book_cache']
+
+    assert stats['books']['max_entries'] == 50
+    assert stats['books']['ttl'] == 60
+    assert stats['books']['entries'] == 1
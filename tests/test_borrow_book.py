@@ -1,5 +1,4 @@
 import pytest
-import json
 import pytest
 import sqlite3
 from services import library_service
@@ -84,6 +83,8 @@ def in_memory_db(monkeypatch):
         conn.execute('UPDATE books SET available_copies = 4 WHERE id = 6')
         conn.execute('UPDATE books SET available_copies = 0 WHERE id = 9')
     conn.commit()
+    # Indexes, loan count summary and triggers the borrow transaction relies on
+    database.apply_migrations(conn)
     monkeypatch.setattr(database, "get_db_connection", lambda: NonClosingConnection(conn))
 
     yield conn  # keep connection alive during test
@@ -147,20 +148,24 @@ def test_borrow_book_twice_same_book(in_memory_db):
     assert success == False
     assert "once" in message
 
-def test_borrow_insert_fail(in_memory_db,monkeypatch):
-    monkeypatch.setattr(library_service, "insert_borrow_record", lambda *args, **kwargs: False)
-    monkeypatch.setattr(library_service, "update_book_availability", lambda *args, **kwargs: True)
+def test_borrow_insert_fail(in_memory_db):
+    """Test a failing borrow record insert rolls back the availability decrement."""
+    in_memory_db.execute('''CREATE TRIGGER fail_insert BEFORE INSERT ON borrow_records
+        BEGIN SELECT RAISE(ABORT, 'insert failed'); END''')
     
     success, message = library_service.borrow_book_by_patron("111111", 1)
     
     assert success == False
     assert "creating" in message
+    assert database.get_book_by_id(1)['available_copies'] == 2
 
-def test_borrow_update_fail(in_memory_db,monkeypatch):
-    monkeypatch.setattr(library_service, "update_book_availability", lambda *args, **kwargs: False)
-    monkeypatch.setattr(library_service, "insert_borrow_record", lambda *args, **kwargs: True)
+def test_borrow_update_fail(in_memory_db):
+    """Test a failing availability update leaves no borrow record behind."""
+    in_memory_db.execute('''CREATE TRIGGER fail_update BEFORE UPDATE ON books
+        BEGIN SELECT RAISE(ABORT, 'update failed'); END''')
     
     success, message = library_service.borrow_book_by_patron("111111", 1)
     
     assert success == False
-    assert "updating" in message
\ No newline at end of file
+    assert "updating" in message
+    assert database.get_patron_borrow_count("111111") == 0
@@ -0,0 +1,57 @@
+import threading
+import pytest
+import database
+from services import library_service
+
+
+@pytest.fixture
+def pooled_db():
+    """Shared database with a pool big enough for each thread to hold its own connection."""
+    pool = database.configure_pool(size=8, timeout=30)
+    database.init_database()
+    database.insert_book("Last Copies", "Some Author", "9780000000001", 3, 3)
+    return pool
+
+
+def _borrow_concurrently(patron_ids, book_id):
+    barrier = threading.Barrier(len(patron_ids))
+    results = []
+    lock = threading.Lock()
+
+    def worker(patron_id):
+        barrier.wait()
+        result = library_service.borrow_book_by_patron(patron_id, book_id)
+        with lock:
+            results.append(result)
+
+    threads = [threading.Thread(target=worker, args=(pid,)) for pid in patron_ids]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def test_concurrent_borrows_never_oversell(pooled_db):
+    """Test 20 patrons racing for 3 copies: exactly 3 succeed and copies never go negative."""
+    patron_ids = [f"{100000 + i}" for i in range(20)]
+    results = _borrow_concurrently(patron_ids, 1)
+
+    successes = [msg for ok, msg in results if ok]
+    failures = [msg for ok, msg in results if not ok]
+    assert len(successes) == 3
+    assert all("not available" in msg for msg in failures)
+
+    book = database.get_book_by_id(1)
+    assert book['available_copies'] == 0
+    with database.db_connection() as conn:
+        loans = conn.execute('SELECT COUNT(*) FROM borrow_records WHERE book_id = 1').fetchone()[0]
+    assert loans == 3
+
+def test_concurrent_duplicate_borrow_by_same_patron(pooled_db):
+    """Test one patron submitting the same borrow many times at once gets one loan."""
+    results = _borrow_concurrently(["222222"] * 10, 1)
+
+    assert sum(1 for ok, _ in results if ok) == 1
+    assert database.get_book_by_id(1)['available_copies'] == 2
+    assert database.get_patron_borrow_count("222222") == 1
@@ -0,0 +1,99 @@
+import io
+import json
+import pytest
+import database
+from app import create_app
+from services import import_service
+
+
+@pytest.fixture
+def import_db(library_db):
+    """Empty database with one existing book."""
+    database.insert_book("Existing", "Author", "9780000000000", 1, 1)
+    return library_db
+
+
+def _csv(rows):
+    lines = ["title,author,isbn,total_copies"] + [','.join(map(str, row)) for row in rows]
+    return io.StringIO('\n'.join(lines) + '\n')
+
+
+def test_import_csv_in_batches(import_db):
+    """Test valid rows are inserted in batches and counted."""
+    rows = [(f"Book {i}", "Author", 9781000000000 + i, 2) for i in range(250)]
+    report = import_service.import_books(import_service.read_records(_csv(rows), 'csv'), batch_size=100)
+
+    assert report.imported == 250
+    assert report.batches == 3
+    assert report.errors == []
+    assert len(database.get_all_books()) == 251
+    assert database.get_book_by_isbn("9781000000249")['available_copies'] == 2
+
+def test_import_reports_validation_errors_per_row(import_db):
+    """Test rows breaking R1 rules are rejected with the same messages as add_book."""
+    rows = [
+        ("Good", "Author", "9781000000001", 1),
+        ("", "Author", "9781000000002", 1),
+        ("Title", "Author", "123", 1),
+        ("Title", "Author", "9781000000003", 0),
+        ("Title", "Author", "9781000000004", "many"),
+        ("Dup of existing", "Author", "9780000000000", 1),
+        ("Dup in file", "Author", "9781000000001", 1),
+    ]
+    report = import_service.import_books(import_service.read_records(_csv(rows), 'csv'))
+
+    assert report.imported == 1
+    assert report.errors == [
+        (2, "Title is required."),
+        (3, "ISBN must be exactly 13 digits."),
+        (4, "Total copies must be a positive integer."),
+        (5, "Total copies must be a positive integer."),
+        (6, "A book with this ISBN already exists."),
+        (7, "A book with this ISBN already exists."),
+    ]
+
+def test_import_ndjson_with_malformed_line(import_db):
+    """Test NDJSON import skips blank lines and reports unparseable ones."""
+    stream = io.StringIO(
+        json.dumps({'title': 'A', 'author': 'B', 'isbn': '9781000000010', 'total_copies': 3}) + '\n'
+        '\n'
+        '{not json\n'
+        + json.dumps({'title': 'C', 'author': 'D', 'isbn': '9781000000011', 'total_copies': 1}) + '\n')
+    report = import_service.import_books(import_service.read_records(stream, 'ndjson'))
+
+    assert report.imported == 2
+    assert report.errors == [(2, "Malformed record.")]
+
+def test_failed_batch_falls_back_to_single_rows(import_db, monkeypatch):
+    """Test a rolled-back batch is retried row by row so good rows still land."""
+    monkeypatch.setattr(import_service, "insert_books_batch", lambda books: False)
+    rows = [(f"Book {i}", "Author", 9781000000100 + i, 1) for i in range(3)]
+
+    report = import_service.import_books(import_service.read_records(_csv(rows), 'csv'))
+
+    assert report.imported == 3
+    assert report.batches == 1
+
+def test_import_endpoint(import_db):
+    """Test the HTTP endpoint imports a posted CSV body and returns the report."""
+    client = create_app({'DB_CHECKPOINT_INTERVAL': 0}).test_client()
+    body = _csv([("Posted", "Author", "9781000000200", 1), ("Bad", "", "9781000000201", 1)]).getvalue()
+
+    result = client.post('/api/books/import?format=csv', data=body).get_json()
+
+    assert result['imported'] == 1
+    assert result['errors'] == [{'row': 2, 'error': "Author is required."}]
+    assert client.post('/api/books/import?format=xml', data='').status_code == 400
+
+def test_import_cli(import_db, tmp_path):
+    """Test the import-books CLI picks the format from the extension and writes rejects."""
+    source = tmp_path / "catalog.csv"
+    source.write_text(_csv([("CLI", "Author", "9781000000300", 1), ("CLI", "Author", "9781000000300", 1)]).getvalue())
+    rejects = tmp_path / "rejects.csv"
+    app = create_app({'DB_CHECKPOINT_INTERVAL': 0})
+
+    result = app.test_cli_runner().invoke(args=['import-books', str(source), '--errors-out', str(rejects)])
+
+    assert result.exit_code == 0
+    assert "Imported 1 of 2 rows" in result.output
+    assert "already exists" in rejects.read_text()
@@ -1,5 +1,4 @@
 import pytest
-import json
 import pytest
 import sqlite3
 from services import library_service
@@ -91,7 +90,7 @@ def in_memory_db(monkeypatch):
 """assume the function has been implemented"""
 def test_caluculate_fee_with_valid_input(in_memory_db):
     """Test if the returned result is with the correct type"""
-    result = json.loads(library_service.calculate_late_fee_for_book("123456", 4))
+    result = library_service.calculate_late_fee_for_book("123456", 4).to_dict()
     assert "fee_amount" in result
     assert "days_overdue" in result
     assert "status" in result
@@ -101,33 +100,33 @@ def test_caluculate_fee_with_valid_input(in_memory_db):
 
 def test_calculate_fee_with_not_borrowed_book(in_memory_db):
     """Test calculated fee with book that is not borrowed"""
-    result = json.loads(library_service.calculate_late_fee_for_book("123456",5))
+    result = library_service.calculate_late_fee_for_book("123456",5).to_dict()
     assert result['fee_amount']==0.0
     assert result['days_overdue']==0
 
 def test_calculate_fee_with_borrowed_book(in_memory_db):
     """Test fee with borreowed book """
     # chnaged book id from 5 to 1
-    result = json.loads(library_service.calculate_late_fee_for_book("999999", 6))
+    result = library_service.calculate_late_fee_for_book("999999", 6).to_dict()
     assert result['fee_amount']!=0.0
     assert result['days_overdue']!=0
 
 def test_calculate_empty_patron_id(in_memory_db):
     """Test calculate fee for a book with empty patron id."""
-    result = json.loads(library_service.calculate_late_fee_for_book("", 1))
+    result = library_service.calculate_late_fee_for_book("", 1).to_dict()
 
     assert "invalid patron id" in result['status']
 
 def test_calculate_invalid_book_id(in_memory_db):
     """Test calculate fee fro a book with invalid book id."""
-    result = json.loads(library_service.calculate_late_fee_for_book("123456", -1))
+    result = library_service.calculate_late_fee_for_book("123456", -1).to_dict()
 
     assert "invalid book id" in result['status']
 
 # added test case
 def test_calculate_book_overdue_fee(in_memory_db):
     """Test calculate fee for a book that is overdue for patron id 111111 that overdue for 4 days."""
-    result = json.loads(library_service.calculate_late_fee_for_book("111111", 5))
+    result = library_service.calculate_late_fee_for_book("111111", 5).to_dict()
 
     assert result['fee_amount'] == 2.0
     assert result['days_overdue'] == 4
@@ -135,7 +134,7 @@ def test_calculate_book_overdue_fee(in_memory_db):
 
 def test_calculate_book_by_patron_id_never_borrowed(in_memory_db):
     """Test calculate fee for a book that was never borrowed by the patron."""
-    result = json.loads(library_service.calculate_late_fee_for_book("101010", 1))
+    result = library_service.calculate_late_fee_for_book("101010", 1).to_dict()
 
     assert result['fee_amount'] == 0.00
     assert result['days_overdue'] == 0
@@ -143,8 +142,18 @@ def test_calculate_book_by_patron_id_never_borrowed(in_memory_db):
 
 def test_calculate_book_with_nonexistent_book_id(in_memory_db):
     """Test calculate fee for a book that does not exist."""
-    result = json.loads(library_service.calculate_late_fee_for_book("123456", 999))
+    result = library_service.calculate_late_fee_for_book("123456", 999).to_dict()
 
     assert result['fee_amount'] == 0.00
     assert result['days_overdue'] == 0
-    assert "Book not found" in result['status']
\ No newline at end of file
+    assert "Book not found" in result['status']
+
+def test_late_fee_api_serializes_result(in_memory_db):
+    """Test /api/late_fee turns the fee result into JSON at the edge."""
+    from app import create_app
+    client = create_app({'DB_CHECKPOINT_INTERVAL': 0}).test_client()
+
+    response = client.get('/api/late_fee/111111/5')
+
+    assert response.status_code == 200
+    assert response.get_json() == {'fee_amount': 2.0, 'days_overdue': 4, 'status': 'Book overdue'}
@@ -0,0 +1,77 @@
+import pytest
+import database
+from app import create_app
+from services import library_service
+
+
+@pytest.fixture
+def catalog_db(library_db):
+    """Database with 25 books whose titles share prefixes and duplicates."""
+    for i in range(25):
+        # every title appears twice so pages must break ties on id
+        database.insert_book(f"Title {i // 2:02d}", "Author", f"{9780000000000 + i}", 1, 1)
+    return library_db
+
+
+def _all_pages(limit):
+    pages, cursor = [], None
+    while True:
+        success, message, page = library_service.get_catalog_page(cursor, limit)
+        assert success
+        pages.append(page['books'])
+        cursor = page['next_cursor']
+        if cursor is None:
+            return pages
+
+
+def test_pages_cover_catalog_in_order(catalog_db):
+    """Test walking the cursors returns every book once, in (title, id) order."""
+    pages = _all_pages(4)
+    ids = [book['id'] for page in pages for book in page]
+    expected = [book['id'] for book in sorted(database.get_all_books(), key=lambda b: (b['title'], b['id']))]
+
+    assert ids == expected
+    assert [len(page) for page in pages] == [4, 4, 4, 4, 4, 4, 1]
+
+def test_last_page_has_no_cursor(catalog_db):
+    """Test an exact-fit page does not advertise an empty next page."""
+    success, message, page = library_service.get_catalog_page(limit=25)
+
+    assert len(page['books']) == 25
+    assert page['next_cursor'] is None
+
+def test_invalid_cursor_and_limit(catalog_db):
+    """Test malformed cursors and out-of-range limits are rejected."""
+    assert library_service.get_catalog_page("not-a-cursor")[:2] == (False, "Invalid page cursor.")
+    assert library_service.get_catalog_page(limit=0)[0] is False
+    assert library_service.get_catalog_page(limit=library_service.MAX_CATALOG_PAGE_SIZE + 1)[0] is False
+
+def test_page_query_uses_title_index(catalog_db):
+    """Test the seek query is an index range scan with no sort step."""
+    with database.db_connection() as conn:
+        plan = ' '.join(row['detail'] for row in conn.execute('''
+            EXPLAIN QUERY PLAN SELECT * FROM books WHERE (title, id) > (?, ?) ORDER BY title, id LIMIT ?
+        ''', ('Title 05', 3, 10)))
+
+    assert 'idx_books_title' in plan
+    assert 'TEMP B-TREE' not in plan
+
+def test_api_books_endpoint(catalog_db):
+    """Test /api/books pages through the catalog with cursor and limit."""
+    client = create_app({'DB_CHECKPOINT_INTERVAL': 0}).test_client()
+
+    first = client.get('/api/books?limit=10').get_json()
+    second = client.get(f"/api/books?limit=10&cursor={first['next_cursor']}").get_json()
+
+    assert first['count'] == 10
+    assert second['results'][0]['id'] not in [book['id'] for book in first['results']]
+    assert client.get('/api/books?cursor=bogus').status_code == 400
+
+def test_catalog_page_renders_next_link(catalog_db):
+    """Test the catalog page shows one page and a link to the next."""
+    client = create_app({'DB_CHECKPOINT_INTERVAL': 0}).test_client()
+
+    html = client.get('/catalog?limit=5').get_data(as_text=True)
+
+    assert html.count('name="book_id"') == 5
+    assert 'Next Page' in html
@@ -0,0 +1,89 @@
+import threading
+import pytest
+import database
+from app import create_app
+
+
+@pytest.fixture
+def pooled_db():
+    """A fresh pool over the test's database."""
+    pool = database.configure_pool(size=2, timeout=0.2)
+    database.init_database()
+    return pool
+
+
+def test_pool_reuses_returned_connection(pooled_db):
+    """Test a returned connection is handed out again (hit) instead of reopened."""
+    with database.db_connection() as conn:
+        first = conn._conn
+    with database.db_connection() as conn:
+        second = conn._conn
+
+    stats = database.get_pool_stats()
+    assert first is second
+    assert stats['misses'] == 1
+    assert stats['hits'] >= 1
+
+def test_pool_helpers_share_connections(pooled_db):
+    """Test a series of helper calls never opens more than the pool size."""
+    database.insert_book("Pool Book", "Author", "1111111111111", 2, 2)
+    for _ in range(10):
+        database.get_all_books()
+        database.get_book_by_isbn("1111111111111")
+
+    stats = database.get_pool_stats()
+    assert stats['open'] <= 2
+    assert stats['idle'] == stats['open']
+
+def test_pool_times_out_when_exhausted(pooled_db):
+    """Test checking out more connections than the pool size times out."""
+    a = database.get_db_connection()
+    b = database.get_db_connection()
+    with pytest.raises(database.PoolTimeoutError):
+        database.get_db_connection()
+    a.close()
+    b.close()
+
+    assert database.get_pool_stats()['timeouts'] == 1
+
+def test_pool_waiter_gets_released_connection(pooled_db):
+    """Test a waiting thread receives a connection released by another thread."""
+    pooled_db.timeout = 2
+    held = [database.get_db_connection(), database.get_db_connection()]
+    got = []
+
+    def worker():
+        with database.db_connection() as conn:
+            got.append(conn.execute('SELECT 1').fetchone()[0])
+
+    t = threading.Thread(target=worker)
+    t.start()
+    held[0].close()
+    t.join()
+    held[1].close()
+
+    assert got == [1]
+    assert database.get_pool_stats()['waits'] == 1
+
+def test_pool_rolls_back_uncommitted_work(pooled_db):
+    """Test a connection returned mid-transaction does not leak the transaction."""
+    with database.db_connection() as conn:
+        conn.execute("INSERT INTO books (title, author, isbn, total_copies, available_copies) VALUES ('T', 'A', '2222222222222', 1, 1)")
+
+    assert database.get_book_by_isbn("2222222222222") is None
+
+def test_close_twice_is_safe(pooled_db):
+    """Test closing a pooled connection twice only returns it once."""
+    conn = database.get_db_connection()
+    conn.close()
+    conn.close()
+
+    assert database.get_pool_stats()['idle'] == 1
+
+def test_create_app_configures_pool():
+    """Test pool size and timeout come from create_app config."""
+    app = create_app({'DB_POOL_SIZE': 3, 'DB_POOL_TIMEOUT': 1.5, 'DB_CHECKPOINT_INTERVAL': 0})
+
+    stats = app.test_client().get('/api/metrics').get_json()['db_pool']
+    assert stats['size'] == 3
+    assert database._get_pool().timeout == 1.5
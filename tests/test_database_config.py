@@ -0,0 +1,102 @@
+import os
+import threading
+import pytest
+import database
+from app import create_app
+from services import library_service
+
+
+def test_default_path_from_environment(monkeypatch):
+    """Test LIBRARY_DATABASE overrides library.db and xdist workers get their own file."""
+    monkeypatch.delenv("PYTEST_XDIST_WORKER", raising=False)
+    monkeypatch.delenv("LIBRARY_DATABASE", raising=False)
+    assert database.default_database_path() == "library.db"
+
+    monkeypatch.setenv("LIBRARY_DATABASE", "/data/catalog.db")
+    assert database.default_database_path() == "/data/catalog.db"
+
+    monkeypatch.setenv("PYTEST_XDIST_WORKER", "gw3")
+    assert database.default_database_path() == "/data/catalog.gw3.db"
+    monkeypatch.setenv("LIBRARY_DATABASE", "file:/data/catalog.db?mode=rwc")
+    assert database.default_database_path() == "file:/data/catalog.gw3.db?mode=rwc"
+    monkeypatch.setenv("LIBRARY_DATABASE", ":memory:")
+    assert database.default_database_path() == database.MEMORY_DATABASE
+
+def test_shared_memory_database_survives_pool_resets():
+    """Test an in-memory database keeps its data while the pool is recreated, and is dropped when left."""
+    database.configure_database(":memory:")
+    database.init_database()
+    database.insert_book("Dune", "Frank Herbert", "9780441172719", 1, 1)
+
+    database.configure_pool(size=2)
+    assert database.get_book_by_isbn("9780441172719")['title'] == "Dune"
+
+    database.configure_database(database.memory_database_uri("elsewhere"))
+    database.configure_database(":memory:")
+    database.init_database()
+    assert database.get_all_books() == []
+
+def test_configure_database_resets_caches(tmp_path):
+    """Test switching databases never serves books cached from the previous one."""
+    database.init_database()
+    database.insert_book("Dune", "Frank Herbert", "9780441172719", 1, 1)
+    assert library_service.get_book_by_id(1)['title'] == "Dune"
+
+    path = database.configure_database(str(tmp_path / "other.db"))
+    database.init_database()
+
+    assert path == str(tmp_path / "other.db") and os.path.exists(path)
+    assert library_service.get_book_by_id(1) is None
+
+def test_create_app_database_and_sample_data_settings():
+    """Test create_app uses the configured database and only seeds it when asked."""
+    config = {'DB_CHECKPOINT_INTERVAL': 0, 'PAYMENT_WORKERS': 0, 'DATABASE': database.memory_database_uri('app')}
+
+    create_app({**config, 'SAMPLE_DATA': False})
+    assert database.DATABASE == database.memory_database_uri('app')
+    assert database.get_all_books() == []
+
+    create_app(config)
+    assert len(database.get_all_books()) == 3
+
+def test_create_app_starts_background_services_when_serving(mocker):
+    """Test payment workers start with the first request, and never when disabled."""
+    start = mocker.patch("app.payment_queue.start_payment_workers")
+    config = {'DB_CHECKPOINT_INTERVAL': 0, 'PAYMENT_WORKERS': 2, 'DATABASE': database.memory_database_uri('app')}
+
+    quiet = create_app({**config, 'BACKGROUND_SERVICES': False})
+    quiet.test_client().get('/api/metrics')
+    assert not start.called
+
+    app = create_app(config)
+    assert not start.called
+    client = app.test_client()
+    client.get('/api/metrics')
+    client.get('/api/metrics')
+    start.assert_called_once_with(2, app.config['PAYMENT_POLL_INTERVAL'])
+
+def test_memory_database_waits_for_writers():
+    """Test readers and writers on the in-memory database wait for each other instead of failing."""
+    database.configure_pool(size=8)
+    database.init_database()
+    for i in range(5):
+        database.insert_book(f"Book {i}", "Author", f"97800000000{i:02d}", 20, 20)
+    errors = []
+
+    def borrow(patron):
+        for _ in range(10):
+            for book_id in range(1, 6):
+                for success, message in (library_service.borrow_book_by_patron(patron, book_id),
+                                         library_service.return_book_by_patron(patron, book_id)[:2]):
+                    if not success:
+                        errors.append(message)
+                database.get_all_books()
+
+    threads = [threading.Thread(target=borrow, args=(f"{100000 + i}",)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert sum(book['available_copies'] for book in database.get_all_books()) == 100
@@ -0,0 +1,112 @@
+import csv
+import gzip
+import io
+import json
+import pytest
+import database
+from app import create_app
+from services import export_service
+
+
+@pytest.fixture
+def export_db(library_db):
+    """Database with enough rows to span several export batches."""
+    with database.db_connection() as conn:
+        conn.executemany('''
+            INSERT INTO books (title, author, isbn, total_copies, available_copies) VALUES (?, ?, ?, ?, ?)
+        ''', [(f'Book, "{i}"', 'Author', f'{9780000000000 + i}', 2, 2) for i in range(2500)])
+        conn.executemany('''
+            INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date) VALUES (?, ?, ?, ?)
+        ''', [('123456', i, '2025-01-01T10:00:00', '2025-01-15T10:00:00') for i in range(1, 11)])
+        conn.commit()
+    return library_db
+
+
+def test_ndjson_export(export_db):
+    """Test NDJSON export emits one object per row in id order."""
+    chunks = list(export_service.iter_export('books', 'ndjson', batch_size=1000))
+    rows = [json.loads(line) for line in ''.join(chunks).splitlines()]
+
+    assert len(chunks) == 3
+    assert len(rows) == 2500
+    assert rows[0] == {'id': 1, 'title': 'Book, "0"', 'author': 'Author', 'isbn': '9780000000000',
+                       'total_copies': 2, 'available_copies': 2}
+
+def test_csv_export_with_quoting(export_db):
+    """Test CSV export has a header and round-trips commas and quotes."""
+    text = ''.join(export_service.iter_export('books', 'csv', batch_size=700))
+    rows = list(csv.reader(io.StringIO(text)))
+
+    assert rows[0] == database.EXPORT_TABLES['books']
+    assert len(rows) == 2501
+    assert rows[1][1] == 'Book, "0"'
+
+def test_csv_export_empty_table(export_db):
+    """Test an empty table still exports its header."""
+    with database.db_connection() as conn:
+        conn.execute('DELETE FROM borrow_records')
+        conn.commit()
+
+    assert ''.join(export_service.iter_export('borrow_records', 'csv')) == ','.join(database.EXPORT_TABLES['borrow_records']) + '\n'
+
+def test_gzip_export_to_file(export_db):
+    """Test the gzip stream decompresses to the plain export."""
+    out = io.BytesIO()
+    export_service.export_table('borrow_records', out, 'ndjson', compress=True, batch_size=3)
+    plain = ''.join(export_service.iter_export('borrow_records', 'ndjson'))
+
+    assert gzip.decompress(out.getvalue()).decode('utf-8') == plain
+
+def test_export_rejects_unknown_table_and_format(export_db):
+    """Test unknown tables and formats are refused before touching the database."""
+    with pytest.raises(ValueError):
+        export_service.iter_export('sqlite_master')
+    with pytest.raises(ValueError):
+        export_service.iter_export('books', 'xml')
+
+def test_export_releases_connection_when_abandoned(export_db):
+    """Test closing a half-read export hands its connection back to the pool."""
+    chunks = export_service.iter_export('books', 'ndjson', batch_size=10)
+    next(chunks)
+    chunks.close()
+
+    stats = database.get_pool_stats()
+    assert stats['idle'] == stats['open']
+
+def test_export_leaves_pool_free(export_db):
+    """Test a streaming export uses its own connection, and exports are capped separately."""
+    database.configure_pool(size=1, timeout=0.1)
+    database.configure_export_connections(1)
+    chunks = export_service.iter_export('books', 'ndjson', batch_size=10)
+    next(chunks)
+
+    assert database.get_book_by_id(1)['title'] == 'Book, "0"'
+    assert database.get_pool_stats()['timeouts'] == 0
+    with pytest.raises(database.PoolTimeoutError):
+        next(export_service.iter_export('borrow_records', 'ndjson'))
+
+    chunks.close()
+    assert next(export_service.iter_export('borrow_records', 'ndjson'))
+
+def test_export_endpoint_streams(export_db):
+    """Test the HTTP endpoint streams gzip CSV as an attachment."""
+    client = create_app({'DB_CHECKPOINT_INTERVAL': 0}).test_client()
+
+    response = client.get('/api/export/books?format=csv&gzip=1')
+
+    assert response.status_code == 200
+    assert response.is_streamed
+    assert 'books.csv.gz' in response.headers['Content-Disposition']
+    assert len(gzip.decompress(response.data).decode('utf-8').splitlines()) == 2501
+    assert client.get('/api/export/patrons').status_code == 404
+    assert client.get('/api/export/books?format=xml').status_code == 400
+
+def test_export_cli(export_db, tmp_path):
+    """Test the export CLI command writes the file."""
+    app = create_app({'DB_CHECKPOINT_INTERVAL': 0})
+    output = tmp_path / "loans.ndjson"
+
+    result = app.test_cli_runner().invoke(args=['export', 'borrow_records', '-o', str(output)])
+
+    assert result.exit_code == 0
+    assert len(output.read_text().splitlines()) == 10
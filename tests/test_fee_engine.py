@@ -0,0 +1,75 @@
+from datetime import date, datetime, timedelta
+import pytest
+import database
+from app import create_app
+from services import fee_engine, library_service
+
+
+@pytest.fixture
+def loans_db(library_db):
+    """Database with open loans 0-40 days overdue, plus returned and future ones."""
+    database.insert_book("Book", "Author", "9780000000001", 100, 100)
+    with database.db_connection() as conn:
+        for days in range(-3, 41):
+            due = datetime(2025, 11, 1, 15, 30) - timedelta(days=days)
+            conn.execute('''
+                INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date) VALUES (?, ?, ?, ?)
+            ''', (f"{100000 + days % 3}", days + 10, (due - timedelta(days=14)).isoformat(), due.isoformat()))
+        # a returned overdue loan must not be assessed
+        conn.execute('''
+            INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date, return_date)
+            VALUES ('200000', 1, '2025-09-01T10:00:00', '2025-09-15T10:00:00', '2025-10-01T10:00:00')
+        ''')
+        conn.commit()
+    return library_db
+
+
+def test_assessment_matches_per_loan_fee(loans_db):
+    """Test every assessed fee equals late_fee_for_due_date for that loan."""
+    result = fee_engine.run_fee_assessment(date(2025, 11, 1))
+    rows = database.get_fee_assessments('2025-11-01')
+
+    assert result['assessed_loans'] == 40
+    assert len(rows) == 40
+    for row in rows:
+        expected = library_service.late_fee_for_due_date(datetime.fromisoformat(row['due_date']), datetime(2025, 11, 1))
+        assert (row['fee_amount'], row['days_overdue']) == (expected.fee_amount, expected.days_overdue)
+
+def test_assessment_tiers_and_cap(loans_db):
+    """Test tier boundaries and the $15 cap."""
+    fee_engine.run_fee_assessment(date(2025, 11, 1))
+    fees = {row['days_overdue']: row['fee_amount'] for row in database.get_fee_assessments('2025-11-01')}
+
+    assert fees[1] == 0.5
+    assert fees[7] == 3.5
+    assert fees[8] == 4.5
+    assert fees[18] == 14.5
+    assert fees[19] == 15.0
+    assert fees[40] == 15.0
+    assert 0 not in fees
+
+def test_rerun_replaces_same_day(loans_db):
+    """Test re-running a day replaces rows instead of duplicating them."""
+    fee_engine.run_fee_assessment(date(2025, 11, 1))
+    fee_engine.run_fee_assessment(date(2025, 11, 1))
+    fee_engine.run_fee_assessment(date(2025, 11, 2))
+
+    assert len(database.get_fee_assessments('2025-11-01')) == 40
+    assert len(database.get_fee_assessments('2025-11-02')) == 41
+
+def test_patron_assessment(loans_db):
+    """Test one patron's assessed loans can be looked up."""
+    fee_engine.run_fee_assessment(date(2025, 11, 1))
+
+    rows = fee_engine.get_patron_assessment("100001", date(2025, 11, 1))
+    assert rows and all(row['patron_id'] == "100001" for row in rows)
+    assert fee_engine.get_patron_assessment("200000", date(2025, 11, 1)) == []
+
+def test_assess_fees_cli(loans_db):
+    """Test the assess-fees CLI command."""
+    app = create_app({'DB_CHECKPOINT_INTERVAL': 0})
+
+    result = app.test_cli_runner().invoke(args=['assess-fees', '--date', '2025-11-01'])
+
+    assert result.exit_code == 0
+    assert "Assessed 40 overdue loans for 2025-11-01" in result.output
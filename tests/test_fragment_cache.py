@@ -0,0 +1,56 @@
+import pytest
+from app import create_app
+from routes import fragments
+
+
+@pytest.fixture
+def app():
+    """App over the test's database with the sample catalog."""
+    return create_app({'DB_CHECKPOINT_INTERVAL': 0})
+
+
+def _book(book_id, available):
+    return {'id': book_id, 'title': f"Title {book_id}", 'author': "Author", 'isbn': f"{book_id:013d}",
+            'total_copies': 3, 'available_copies': available}
+
+
+def test_rows_rendered_once_until_they_change(app):
+    """Test unchanged rows come from the cache and only changed rows are re-rendered."""
+    books = [_book(1, 1), _book(2, 2)]
+    with app.test_request_context('/catalog'):
+        first = fragments.render_book_rows(books)
+        assert fragments.get_fragment_cache_stats()['misses'] == 2
+
+        assert fragments.render_book_rows(books) == first
+        assert fragments.get_fragment_cache_stats()['hits'] == 2
+
+        changed = fragments.render_book_rows([_book(1, 0), _book(2, 2)])
+
+    stats = fragments.get_fragment_cache_stats()
+    assert stats['misses'] == 3
+    assert stats['hits'] == 3
+    assert "Not Available" in changed
+    assert "Not Available" not in first
+
+def test_row_markup_is_escaped(app):
+    """Test cached rows keep Jinja autoescaping of book fields."""
+    book = dict(_book(1, 1), title="<script>x</script>")
+    with app.test_request_context('/catalog'):
+        rows = fragments.render_book_rows([book])
+
+    assert "&lt;script&gt;" in rows
+    assert "<script>" not in rows
+
+def test_catalog_page_reflects_borrow(app):
+    """Test the catalog page shows new availability after a borrow, not the cached row."""
+    client = app.test_client()
+    page = client.get('/catalog').get_data(as_text=True)
+    assert "3/3 Available" in page
+
+    client.post('/borrow', data={'patron_id': '654321', 'book_id': '1'})
+    page = client.get('/catalog').get_data(as_text=True)
+
+    assert "3/3 Available" not in page
+    assert "2/3 Available" in page
+    assert page.count("<tr>") == 4
+    assert client.get('/api/metrics').get_json()['fragment_cache']['hits'] >= 2
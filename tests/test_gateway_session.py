@@ -0,0 +1,74 @@
+import threading
+from datetime import datetime, timedelta
+import pytest
+import requests
+import database
+from app import create_app
+from services import library_service, payment_service
+from services.fake_payment_server import FakePaymentServer
+from services.payment_service import PaymentGateway
+
+
+@pytest.fixture
+def server():
+    """Fake gateway on a free local port."""
+    with FakePaymentServer() as server:
+        yield server
+
+
+def test_live_calls_reuse_one_connection(server):
+    """Test sequential calls share a keep-alive connection."""
+    gateway = PaymentGateway(base_url=server.url, live=True)
+
+    success, txn, _ = gateway.process_payment("123456", 6.5, "Late fees")
+    assert success
+    assert gateway.verify_payment_status(txn)['amount'] == 6.5
+    assert gateway.refund_payment(txn, 6.5)[0]
+
+    assert gateway.stats() == {'live': True, 'requests': 3, 'connections_opened': 1,
+                               'connections_reused': 2, 'pool_size': payment_service.GATEWAY_POOL_SIZE}
+
+def test_pool_shared_across_threads(server):
+    """Test concurrent threads draw from one bounded connection pool."""
+    gateway = PaymentGateway(base_url=server.url, live=True, pool_size=4)
+
+    def work():
+        for _ in range(10):
+            assert gateway.verify_payment_status("txn_1")['status'] == 'not_found'
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    stats = gateway.stats()
+    assert stats['requests'] == 80
+    assert stats['connections_opened'] <= 4
+
+def test_status_lookup_retried_but_charge_not(server):
+    """Test a 503 is retried for GETs but a charge is never resent."""
+    gateway = PaymentGateway(base_url=server.url, live=True, backoff_factor=0)
+
+    server.fail_next(2)
+    assert gateway.verify_payment_status("txn_1")['status'] == 'not_found'
+    assert server.requests == 3
+
+    server.fail_next(1)
+    with pytest.raises(requests.HTTPError):
+        gateway.process_payment("123456", 5)
+    assert server.charges == {}
+
+def test_default_gateway_shared_by_services(server):
+    """Test pay_late_fees uses the process-wide gateway configured by create_app."""
+    client = create_app({'DB_CHECKPOINT_INTERVAL': 0, 'PAYMENT_WORKERS': 0, 'PAYMENT_GATEWAY_LIVE': True,
+                         'PAYMENT_GATEWAY_URL': server.url}).test_client()
+    now = datetime.now()
+    database.insert_borrow_record("654321", 1, now - timedelta(days=20), now - timedelta(days=6))
+
+    success, _, txn = library_service.pay_late_fees("654321", 1)
+
+    assert success and txn in server.charges
+    assert payment_service.get_default_gateway() is payment_service.get_default_gateway()
+    stats = client.get('/api/metrics').get_json()['payment_gateway']
+    assert stats['live'] is True
+    assert stats['requests'] == 1
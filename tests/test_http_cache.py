@@ -0,0 +1,124 @@
+import time
+from datetime import datetime, timezone
+import pytest
+import database
+from app import create_app
+from routes.http_cache import catalog_last_modified
+
+
+@pytest.fixture
+def client():
+    """Test client over the test's database with the sample catalog."""
+    return create_app({'DB_CHECKPOINT_INTERVAL': 0}).test_client()
+
+
+class RecordingConnection:
+    """Pooled connection wrapper that records every statement run on it."""
+
+    def __init__(self, conn, statements):
+        self._conn = conn
+        self._statements = statements
+
+    def execute(self, sql, *args):
+        self._statements.append(sql)
+        return self._conn.execute(sql, *args)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+def _record_queries(monkeypatch):
+    statements = []
+    acquire = database.get_db_connection
+    monkeypatch.setattr(database, "get_db_connection", lambda: RecordingConnection(acquire(), statements))
+    return statements
+
+def _age_catalog(seconds=5):
+    """Move the last catalog write into the past without writing to books."""
+    with database.db_connection() as conn:
+        conn.execute('UPDATE catalog_version SET modified_at = modified_at - ?', (seconds,))
+        conn.commit()
+
+
+@pytest.mark.parametrize("url", ['/catalog', '/search?q=gatsby&type=title', '/api/search?q=gatsby&type=title'])
+def test_matching_etag_returns_304_without_query(client, monkeypatch, url):
+    """Test a revalidation with the current ETag only reads the catalog version."""
+    _age_catalog()
+    first = client.get(url)
+    assert first.status_code == 200
+    assert first.headers['ETag'].startswith('"')
+    assert 'Last-Modified' in first.headers
+
+    statements = _record_queries(monkeypatch)
+    second = client.get(url, headers={'If-None-Match': first.headers['ETag']})
+
+    assert second.status_code == 304
+    assert second.data == b''
+    assert second.headers['ETag'] == first.headers['ETag']
+    assert len(statements) == 1 and 'catalog_version' in statements[0]
+
+def test_etag_varies_with_query(client):
+    """Test different pages and searches get different ETags."""
+    a = client.get('/api/search?q=gatsby&type=title').headers['ETag']
+    b = client.get('/api/search?q=orwell&type=author').headers['ETag']
+    c = client.get('/catalog?limit=1').headers['ETag']
+
+    assert len({a, b, c}) == 3
+
+def test_book_write_changes_etag(client):
+    """Test adding a book or borrowing a copy invalidates earlier ETags."""
+    etag = client.get('/catalog').headers['ETag']
+
+    assert database.insert_book("New Book", "Author", "9781111111111", 1, 1)
+    response = client.get('/catalog', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert b"New Book" in response.data
+
+    etag = response.headers['ETag']
+    assert database.update_book_availability(1, -1)
+    assert client.get('/catalog', headers={'If-None-Match': etag}).status_code == 200
+
+def test_if_modified_since(client):
+    """Test Last-Modified revalidation when no ETag is sent."""
+    _age_catalog()
+    last_modified = client.get('/api/search?q=gatsby&type=title').headers['Last-Modified']
+
+    response = client.get('/api/search?q=gatsby&type=title', headers={'If-Modified-Since': last_modified})
+
+    assert response.status_code == 304
+
+def test_write_in_same_second_not_hidden_by_if_modified_since(client):
+    """Test Last-Modified waits for its second to end, and a later write beats it."""
+    assert catalog_last_modified(time.time()) is None
+    assert catalog_last_modified(100.5) == datetime.fromtimestamp(101, timezone.utc)
+
+    _age_catalog(1.2)
+    last_modified = client.get('/catalog').headers['Last-Modified']
+    assert database.insert_book("New Book", "Author", "9781111111111", 1, 1)
+    response = client.get('/catalog', headers={'If-Modified-Since': last_modified})
+
+    assert response.status_code == 200
+    assert b"New Book" in response.data
+
+def test_version_shared_across_connections(client):
+    """Test a books write made outside this process's write path still changes the ETag."""
+    etag = client.get('/catalog').headers['ETag']
+    with database.db_connection() as conn:
+        conn.execute("UPDATE books SET title = 'Renamed' WHERE id = 1")
+        conn.commit()
+
+    response = client.get('/catalog', headers={'If-None-Match': etag})
+
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+def test_errors_and_pending_flashes_not_cached(client):
+    """Test error responses and pages showing earlier flashes carry no validators."""
+    assert 'ETag' not in client.get('/api/search').headers
+
+    client.post('/add_book', data={'title': 'T', 'author': 'A', 'isbn': '9782222222222', 'total_copies': '1'})
+    response = client.get('/catalog')
+
+    assert b"successfully added" in response.data
+    assert 'ETag' not in response.headers
+    assert 'ETag' in client.get('/catalog').headers
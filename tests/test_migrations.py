@@ -0,0 +1,94 @@
+import sqlite3
+import pytest
+import database
+
+
+@pytest.fixture
+def pooled_db():
+    """Fresh, unmigrated database with its own pool."""
+    return database.configure_pool(size=2, timeout=5)
+
+
+def _query_plan(conn, sql, params):
+    rows = conn.execute('EXPLAIN QUERY PLAN ' + sql, params).fetchall()
+    return ' '.join(row['detail'] for row in rows)
+
+
+def test_init_database_applies_all_migrations(pooled_db):
+    """Test a fresh database ends up at the latest schema version."""
+    database.init_database()
+
+    with database.db_connection() as conn:
+        assert database.get_schema_version(conn) == database.MIGRATIONS[-1][0]
+        applied = [row['version'] for row in conn.execute('SELECT version FROM schema_version ORDER BY version')]
+    assert applied == [version for version, _, _ in database.MIGRATIONS]
+
+def test_migrations_are_applied_once(pooled_db):
+    """Test running init_database again does not re-apply migrations."""
+    database.init_database()
+    database.init_database()
+
+    with database.db_connection() as conn:
+        count = conn.execute('SELECT COUNT(*) FROM schema_version').fetchone()[0]
+    assert count == len(database.MIGRATIONS)
+
+def test_failed_migration_rolls_back(pooled_db, monkeypatch):
+    """Test a failing migration leaves the schema version and tables untouched."""
+    database.init_database()
+    with database.db_connection() as conn:
+        before = database.get_schema_version(conn)
+    broken = database.MIGRATIONS + [(before + 1, 'broken', [
+        'CREATE TABLE migration_probe (id INTEGER)',
+        'THIS IS NOT SQL',
+    ])]
+    monkeypatch.setattr(database, "MIGRATIONS", broken)
+
+    with database.db_connection() as conn:
+        with pytest.raises(sqlite3.OperationalError):
+            database.apply_migrations(conn)
+        assert database.get_schema_version(conn) == before
+        probe = conn.execute("SELECT name FROM sqlite_master WHERE name = 'migration_probe'").fetchone()
+    assert probe is None
+
+def test_duplicate_open_loans_closed_before_unique_index(pooled_db, monkeypatch):
+    """Test migrating a database with double-borrowed books keeps one open loan and returns the copy."""
+    migrations = database.MIGRATIONS
+    monkeypatch.setattr(database, "MIGRATIONS", [m for m in migrations if m[0] < 5])
+    database.init_database()
+    with database.db_connection() as conn:
+        conn.execute('''INSERT INTO books (title, author, isbn, total_copies, available_copies)
+                        VALUES ('Dup', 'Author', '9780000000001', 3, 0)''')
+        conn.executemany('''INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date)
+                            VALUES (?, 1, ?, '2000-01-15')''',
+                         [('123456', '2000-01-01'), ('123456', '2000-01-02'), ('654321', '2000-01-03')])
+        conn.commit()
+
+    monkeypatch.setattr(database, "MIGRATIONS", migrations)
+    database.init_database()
+
+    with database.db_connection() as conn:
+        loans = [dict(row) for row in conn.execute('SELECT * FROM borrow_records ORDER BY id')]
+    assert [loan['return_date'] for loan in loans] == [None, '2000-01-02', None]
+    assert database.get_book_by_id(1)['available_copies'] == 1
+    assert database.get_patron_open_loan_count("123456") == 1
+    assert database.get_patron_open_loan_count("654321") == 1
+
+def test_open_loan_queries_use_indexes(pooled_db):
+    """Test the hot borrow_records lookups are index searches, not table scans."""
+    database.init_database()
+
+    with database.db_connection() as conn:
+        count_plan = _query_plan(conn, '''
+            SELECT COUNT(*) FROM borrow_records WHERE patron_id = ? AND return_date IS NULL
+        ''', ('123456',))
+        open_plan = _query_plan(conn, '''
+            SELECT * FROM borrow_records WHERE patron_id = ? AND book_id = ? AND return_date IS NULL
+        ''', ('123456', 1))
+        history_plan = _query_plan(conn, '''
+            SELECT * FROM borrow_records WHERE patron_id = ? ORDER BY borrow_date
+        ''', ('123456',))
+
+    assert 'SEARCH borrow_records USING' in count_plan
+    assert '_open' in open_plan
+    assert 'idx_borrow_records_patron_history' in history_plan
+    assert 'TEMP B-TREE' not in history_plan
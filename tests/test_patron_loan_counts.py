@@ -0,0 +1,74 @@
+from datetime import datetime, timedelta
+import pytest
+import database
+from services import library_service
+
+
+@pytest.fixture
+def counts_db(library_db):
+    """Database with a few books, fully migrated."""
+    for i in range(7):
+        database.insert_book(f"Book {i}", "Author", f"{9780000000000 + i}", 2, 2)
+    return library_db
+
+
+def test_counts_follow_borrow_and_return(counts_db):
+    """Test the summary row tracks borrows and returns."""
+    for book_id in (1, 2, 3):
+        assert library_service.borrow_book_by_patron("123456", book_id)[0]
+    assert database.get_patron_open_loan_count("123456") == 3
+
+    assert library_service.return_book_by_patron("123456", 2)[0]
+    assert database.get_patron_open_loan_count("123456") == 2
+    assert database.get_patron_open_loan_count("123456") == database.get_patron_borrow_count("123456")
+
+def test_limit_enforced_from_summary(counts_db):
+    """Test the borrowing limit is read from patron_loan_counts."""
+    with database.db_connection() as conn:
+        conn.execute("INSERT INTO patron_loan_counts (patron_id, open_loans) VALUES ('654321', 5)")
+        conn.commit()
+
+    success, message = library_service.borrow_book_by_patron("654321", 1)
+
+    assert success is False
+    assert "maximum" in message
+
+def test_sixth_borrow_refused(counts_db):
+    """Test a patron with five open loans cannot take a sixth."""
+    for book_id in range(1, 6):
+        assert library_service.borrow_book_by_patron("111111", book_id)[0]
+
+    success, message = library_service.borrow_book_by_patron("111111", 6)
+
+    assert success is False
+    assert "maximum" in message
+    assert database.get_patron_open_loan_count("111111") == 5
+
+def test_duplicate_open_loan_rejected_by_schema(counts_db):
+    """Test the unique open-loan index blocks a second open loan even outside the service."""
+    now = datetime.now()
+    assert database.insert_borrow_record("222222", 1, now, now + timedelta(days=14))
+
+    assert database.insert_borrow_record("222222", 1, now, now + timedelta(days=14)) is False
+    assert database.get_patron_open_loan_count("222222") == 1
+
+def test_migration_backfills_existing_loans(monkeypatch):
+    """Test upgrading a database with open loans seeds the counts from history."""
+    database.configure_pool(size=1, timeout=5)
+    migrations = database.MIGRATIONS
+    monkeypatch.setattr(database, "MIGRATIONS", [m for m in migrations if m[0] < 5])
+    database.init_database()
+    with database.db_connection() as conn:
+        conn.executemany('''
+            INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date, return_date) VALUES (?, ?, ?, ?, ?)
+        ''', [('333333', 1, '2025-01-01', '2025-01-15', None),
+              ('333333', 2, '2025-01-01', '2025-01-15', None),
+              ('333333', 3, '2025-01-01', '2025-01-15', '2025-01-10'),
+              ('444444', 1, '2025-01-01', '2025-01-15', None)])
+        conn.commit()
+
+    monkeypatch.setattr(database, "MIGRATIONS", migrations)
+    database.init_database()
+
+    assert database.get_patron_open_loan_count("333333") == 2
+    assert database.get_patron_open_loan_count("444444") == 1
@@ -0,0 +1,110 @@
+from datetime import datetime, timedelta
+from unittest.mock import Mock
+import pytest
+import database
+from services import library_service
+from services.payment_service import PaymentGateway
+
+
+@pytest.fixture
+def fee_db(library_db):
+    """Database where patron 123456 has two overdue loans and one on time."""
+    now = datetime.now()
+    for i, title in enumerate(["Ten Days", "Three Days", "On Time"], start=1):
+        database.insert_book(title, "Author", f"978000000000{i}", 1, 0)
+    database.insert_borrow_record("123456", 1, now - timedelta(days=24), now - timedelta(days=10))
+    database.insert_borrow_record("123456", 2, now - timedelta(days=17), now - timedelta(days=3))
+    database.insert_borrow_record("123456", 3, now - timedelta(days=1), now + timedelta(days=13))
+    return library_db
+
+
+def _gateway(transaction_id="txn_123456_1"):
+    gateway = Mock(spec=PaymentGateway)
+    gateway.process_payment.return_value = (True, transaction_id, "Payment processed successfully")
+    gateway.refund_payment.return_value = (True, "Refund processed successfully.")
+    return gateway
+
+
+def test_pay_all_charges_once_with_itemised_description(fee_db):
+    """Test every overdue loan is paid by one charge listing each book."""
+    gateway = _gateway()
+
+    success, message, txn = library_service.pay_all_late_fees("123456", gateway)
+
+    assert success and txn == "txn_123456_1"
+    gateway.process_payment.assert_called_once_with(
+        patron_id="123456", amount=8.0,
+        description="Late fees: 'Ten Days' $6.50; 'Three Days' $1.50")
+    payment, = database.get_payments()
+    assert (payment['book_id'], payment['amount']) == (None, 8.0)
+    assert database.get_payment_allocation(txn, 1)['amount'] == 6.5
+    assert database.get_payment_allocation(txn, 2)['amount'] == 1.5
+    assert database.get_payment_allocation(txn, 3) is None
+
+def test_pay_all_nets_earlier_payments(fee_db):
+    """Test fees already paid book by book are not charged again."""
+    library_service.pay_late_fees("123456", 1, _gateway("txn_123456_0"))
+    gateway = _gateway()
+
+    assert library_service.pay_all_late_fees("123456", gateway)[0]
+    gateway.process_payment.assert_called_once_with(
+        patron_id="123456", amount=1.5, description="Late fees: 'Three Days' $1.50")
+
+    assert library_service.pay_all_late_fees("123456", _gateway()) == (False, "No late fees to pay.", None)
+
+def test_single_book_payment_nets_pay_all(fee_db):
+    """Test paying one book after pay-all charges only what is still owed on it."""
+    library_service.pay_all_late_fees("123456", _gateway())
+    gateway = _gateway("txn_123456_2")
+
+    assert library_service.pay_late_fees("123456", 1, gateway) == \
+        (False, "No late fees to pay for this book.", None)
+    gateway.process_payment.assert_not_called()
+
+    library_service.refund_late_fee_payment("txn_123456_1", 2.0, _gateway(), book_id=1)
+    assert library_service.pay_late_fees("123456", 1, gateway)[0]
+    assert gateway.process_payment.call_args.kwargs['amount'] == 2.0
+
+def test_refunded_fee_becomes_outstanding_again(fee_db):
+    """Test a per-book refund makes that book's fee payable again."""
+    library_service.pay_all_late_fees("123456", _gateway())
+    assert library_service.refund_late_fee_payment("txn_123456_1", 1.5, _gateway(), book_id=2)[0]
+
+    gateway = _gateway("txn_123456_2")
+    assert library_service.pay_all_late_fees("123456", gateway)[0]
+    assert gateway.process_payment.call_args.kwargs['amount'] == 1.5
+
+def test_refund_one_book_of_batch_payment(fee_db):
+    """Test refunds target one book and cannot exceed what was paid for it."""
+    library_service.pay_all_late_fees("123456", _gateway())
+    gateway = _gateway()
+
+    assert library_service.refund_late_fee_payment("txn_123456_1", 4.0, gateway, book_id=1)[0]
+    refund = database.get_payments()[-1]
+    assert (refund['kind'], refund['patron_id'], refund['book_id'], refund['amount']) == ('refund', '123456', 1, 4.0)
+
+    success, message = library_service.refund_late_fee_payment("txn_123456_1", 3.0, gateway, book_id=1)
+    assert not success and message == "Refund amount exceeds the amount paid for this book."
+    success, message = library_service.refund_late_fee_payment("txn_123456_1", 1.0, gateway, book_id=3)
+    assert not success and message == "This payment did not cover that book."
+    success, message = library_service.refund_late_fee_payment("txn_123456_1", 1.0, gateway)
+    assert not success and message == "This payment covered several books; choose the book to refund."
+    gateway.refund_payment.assert_called_once_with("txn_123456_1", 4.0)
+
+def test_pay_all_without_fees_or_bad_patron(fee_db):
+    """Test nothing is charged when there is nothing to pay or the patron ID is invalid."""
+    gateway = _gateway()
+
+    assert library_service.pay_all_late_fees("654321", gateway) == (False, "No late fees to pay.", None)
+    assert not library_service.pay_all_late_fees("12a456", gateway)[0]
+    gateway.process_payment.assert_not_called()
+
+def test_declined_batch_payment_not_recorded(fee_db):
+    """Test a declined charge leaves no payment or allocation behind."""
+    gateway = Mock(spec=PaymentGateway)
+    gateway.process_payment.return_value = (False, "", "Payment declined")
+
+    success, message, txn = library_service.pay_all_late_fees("123456", gateway)
+
+    assert not success and message == "Payment failed: Payment declined"
+    assert database.get_payments() == []
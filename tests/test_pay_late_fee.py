@@ -2,12 +2,16 @@ import pytest
 from unittest.mock import Mock
 from services import library_service
 from services.payment_service import PaymentGateway
+from services.library_service import LateFeeResult
+
+# Earlier payments are looked up in the payments ledger
+pytestmark = pytest.mark.usefixtures("library_db")
 
 
 def test_pay_fee_success(mocker):
     """Test successful payment of late fee."""
     mock_gateway = Mock(spec=PaymentGateway)
-    mocker.patch("services.library_service.calculate_late_fee_for_book", return_value={'fee_amount': 3,'days_overdue': 6,'status': "Book overdue"})
+    mocker.patch("services.library_service.calculate_late_fee_for_book", return_value=LateFeeResult(3, 6, "Book overdue"))
     mocker.patch("services.library_service.get_book_by_id", return_value={'id': 2, 'title': "Test Book"})
     mock_gateway.process_payment.return_value = True, f"txn_123456_1730946927", f"Payment of $3 called successfully"
     
@@ -22,7 +26,7 @@ def test_pay_fee_success(mocker):
 def test_pay_fee_declined_by_gateway(mocker):
     """Test payment declined by gateway."""
     mock_gateway = Mock(spec=PaymentGateway)
-    mocker.patch("services.library_service.calculate_late_fee_for_book", return_value={'fee_amount': 3,'days_overdue': 6,'status': "Book overdue"})
+    mocker.patch("services.library_service.calculate_late_fee_for_book", return_value=LateFeeResult(3, 6, "Book overdue"))
     mocker.patch("services.library_service.get_book_by_id", return_value={'id': 2, 'title': "Test Book"})
     mock_gateway.process_payment.return_value = False, "", "Payment declined: amount exceeds limit"
     
@@ -37,7 +41,7 @@ def test_pay_fee_declined_by_gateway(mocker):
 def test_invalid_ID(mocker):
     """Test invalid patron ID (verify mock NOT called)."""
     mock_gateway = Mock(spec=PaymentGateway)
-    mocker.patch("services.library_service.calculate_late_fee_for_book", return_value={'fee_amount': 3,'days_overdue': 6,'status': "Book overdue"})
+    mocker.patch("services.library_service.calculate_late_fee_for_book", return_value=LateFeeResult(3, 6, "Book overdue"))
     mocker.patch("services.library_service.get_book_by_id", return_value={'id': 2, 'title': "Test Book"})
     mock_gateway.process_payment.return_value = True, f"txn_123456_1730946927", f"Payment of $3 processed successfully"
     
@@ -51,7 +55,7 @@ def test_invalid_ID(mocker):
 def test_zero_late_fees (mocker):
     """Test zero late fees (verify mock NOT called)."""
     mock_gateway = Mock(spec=PaymentGateway)
-    mocker.patch("services.library_service.calculate_late_fee_for_book", return_value={'fee_amount': 0,'days_overdue': 0,'status': "Book not overdue"})
+    mocker.patch("services.library_service.calculate_late_fee_for_book", return_value=LateFeeResult(0, 0, "Book not overdue"))
     mocker.patch("services.library_service.get_book_by_id", return_value={'id': 2, 'title': "Test Book"})
     mock_gateway.process_payment.return_value = True, f"txn_123456_1730946927", f"Payment of $3 called successfully"
     
@@ -65,7 +69,7 @@ def test_zero_late_fees (mocker):
 def test_network_error_exception_handling(mocker):
     """Test network error exception."""
     mock_gateway = Mock(spec=PaymentGateway)
-    mocker.patch("services.library_service.calculate_late_fee_for_book", return_value={'fee_amount': 3,'days_overdue': 6,'status': "Book overdue"})
+    mocker.patch("services.library_service.calculate_late_fee_for_book", return_value=LateFeeResult(3, 6, "Book overdue"))
     mocker.patch("services.library_service.get_book_by_id", return_value={'id': 2, 'title': "Test Book"})
     mock_gateway.process_payment.return_value = ConnectionError("Network error")
     
@@ -79,23 +83,21 @@ def test_network_error_exception_handling(mocker):
 
 # ouside from requied tests
 def test_no_fee_info(mocker):
-    """Test with calculate_late_fee_for_book not working as requried."""
+    """Test a book with no loan to calculate a fee for is never charged."""
     mock_gateway = Mock(spec=PaymentGateway)
-    mocker.patch("services.library_service.calculate_late_fee_for_book", return_value={'days_overdue': 0,'status': "Book not overdue"})
-    mocker.patch("services.library_service.get_book_by_id", return_value={'id': 2, 'title': "Test Book"})
     mock_gateway.process_payment.return_value = True, f"txn_123456_1730946927", f"Payment of $3 called successfully"
     
 
     result,msg,opmsg = library_service.pay_late_fees("123456", 2,payment_gateway=mock_gateway)
 
     assert result is False
-    assert "Unable to calculate" in msg
+    assert "No late fees" in msg
     mock_gateway.process_payment.assert_not_called()
 
 def test_invalid_book(mocker):
     """Test with book with book id not found."""
     mock_gateway = Mock(spec=PaymentGateway)
-    mocker.patch("services.library_service.calculate_late_fee_for_book", return_value={'fee_amount': 3,'days_overdue': 6,'status': "Book overdue"})
+    mocker.patch("services.library_service.calculate_late_fee_for_book", return_value=LateFeeResult(3, 6, "Book overdue"))
     mocker.patch("services.library_service.get_book_by_id", return_value=None)
     mock_gateway.process_payment.return_value = True, f"txn_123456_1730946927", f"Payment of $3 called successfully"
     
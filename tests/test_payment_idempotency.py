@@ -0,0 +1,159 @@
+import threading
+from datetime import datetime, timedelta
+from unittest.mock import Mock
+import pytest
+import database
+from app import create_app
+from services import library_service
+from services.payment_service import PaymentGateway
+from services.resilience import CircuitOpenError
+
+
+@pytest.fixture
+def ledger_db(library_db):
+    """Database where patron 123456 owes $6.50 on book 1."""
+    now = datetime.now()
+    database.insert_book("Overdue", "Author", "9780000000001", 1, 0)
+    database.insert_book("Also Overdue", "Author", "9780000000002", 1, 0)
+    database.insert_borrow_record("123456", 1, now - timedelta(days=24), now - timedelta(days=10))
+    database.insert_borrow_record("123456", 2, now - timedelta(days=17), now - timedelta(days=3))
+    return library_db
+
+
+def _gateway():
+    gateway = Mock(spec=PaymentGateway)
+    gateway.process_payment.return_value = (True, "txn_123456_1", "Payment of $6.50 processed successfully")
+    gateway.refund_payment.return_value = (True, "Refund processed successfully.")
+    return gateway
+
+
+def test_duplicate_submission_returns_stored_result(ledger_db):
+    """Test a retried payment with the same key is answered from the ledger without charging again."""
+    gateway = _gateway()
+
+    first = library_service.pay_late_fees("123456", 1, gateway, idempotency_key="retry-1")
+    again = library_service.pay_late_fees("123456", 1, gateway, idempotency_key="retry-1")
+
+    assert first[0] and first[2] == "txn_123456_1"
+    assert again == (True, "Payment already processed. Transaction ID: txn_123456_1", "txn_123456_1")
+    gateway.process_payment.assert_called_once()
+    assert database.get_payment("txn_123456_1")['idempotency_key'] == "retry-1"
+
+def test_concurrent_retry_does_not_charge_twice(ledger_db):
+    """Test a retry arriving while the first attempt waits on the gateway is refused, not charged."""
+    charging, release = threading.Event(), threading.Event()
+    gateway = _gateway()
+    def slow_charge(**kwargs):
+        charging.set()
+        release.wait(5)
+        return (True, "txn_123456_1", "Payment of $6.50 processed successfully")
+    gateway.process_payment.side_effect = slow_charge
+    results = []
+    first = threading.Thread(target=lambda: results.append(
+        library_service.pay_late_fees("123456", 1, gateway, idempotency_key="retry-1")))
+    first.start()
+    assert charging.wait(5)
+
+    retry = library_service.pay_late_fees("123456", 1, gateway, idempotency_key="retry-1")
+    release.set()
+    first.join()
+
+    assert retry == (False, "Payment with this idempotency key is already in progress.", None)
+    assert results[0][0] and results[0][2] == "txn_123456_1"
+    assert library_service.pay_late_fees("123456", 1, gateway, idempotency_key="retry-1")[2] == "txn_123456_1"
+    gateway.process_payment.assert_called_once()
+
+def test_failed_attempt_can_be_retried_with_same_key(ledger_db):
+    """Test a declined payment leaves its key free for another attempt."""
+    gateway = _gateway()
+    gateway.process_payment.return_value = (False, "", "Payment declined")
+    assert not library_service.pay_late_fees("123456", 1, gateway, idempotency_key="retry-1")[0]
+
+    gateway.process_payment.return_value = (True, "txn_123456_1", "Payment processed successfully")
+    assert library_service.pay_late_fees("123456", 1, gateway, idempotency_key="retry-1")[0]
+    assert gateway.process_payment.call_count == 2
+
+def test_timed_out_charge_never_retried_under_its_key(ledger_db):
+    """Test a charge that broke off midway keeps its key pending, since the patron may have paid."""
+    gateway = _gateway()
+    gateway.process_payment.side_effect = TimeoutError("Read timed out")
+
+    success, message, _ = library_service.pay_late_fees("123456", 1, gateway, idempotency_key="k1")
+    retry = library_service.pay_late_fees("123456", 1, gateway, idempotency_key="k1")
+
+    assert not success and library_service.CHARGE_MAY_HAVE_GONE_THROUGH in message
+    assert retry == (False, message, None)
+    gateway.process_payment.assert_called_once()
+
+def test_refused_charge_can_be_retried_with_same_key(ledger_db):
+    """Test a charge the breaker refused before reaching the gateway leaves its key free."""
+    gateway = _gateway()
+    gateway.process_payment.side_effect = CircuitOpenError("Payment gateway is temporarily unavailable.")
+    assert not library_service.pay_late_fees("123456", 1, gateway, idempotency_key="k1")[0]
+
+    gateway.process_payment.side_effect = None
+    assert library_service.pay_late_fees("123456", 1, gateway, idempotency_key="k1")[0]
+
+def test_charge_kept_when_ledger_pool_times_out(ledger_db, monkeypatch):
+    """Test a charge whose ledger writes cannot get a connection is reported as paid and not retried."""
+    gateway = _gateway()
+    acquire = database.get_db_connection
+    def no_connection_for_ledger():
+        if gateway.process_payment.called:
+            raise database.PoolTimeoutError("No database connection available")
+        return acquire()
+    monkeypatch.setattr(database, "get_db_connection", no_connection_for_ledger)
+
+    success, message, txn = library_service.pay_late_fees("123456", 1, gateway, idempotency_key="k1")
+
+    assert success and txn == "txn_123456_1"
+    assert "not recorded in the payments ledger" in message
+    monkeypatch.setattr(database, "get_db_connection", acquire)
+    assert not library_service.pay_late_fees("123456", 1, gateway, idempotency_key="k1")[0]
+    gateway.process_payment.assert_called_once()
+
+def test_idempotency_key_reused_for_other_payment(ledger_db):
+    """Test a key already used for one book cannot pay for another."""
+    gateway = _gateway()
+    library_service.pay_late_fees("123456", 1, gateway, idempotency_key="retry-1")
+
+    success, message, txn = library_service.pay_late_fees("123456", 2, gateway, idempotency_key="retry-1")
+
+    assert not success and txn is None
+    assert message == "Idempotency key was already used for a different payment."
+    gateway.process_payment.assert_called_once()
+
+def test_pay_all_replays_by_key(ledger_db):
+    """Test pay_all_late_fees honours the idempotency key too."""
+    gateway = _gateway()
+
+    library_service.pay_all_late_fees("123456", gateway, idempotency_key="all-1")
+    success, _, txn = library_service.pay_all_late_fees("123456", gateway, idempotency_key="all-1")
+
+    assert success and txn == "txn_123456_1"
+    gateway.process_payment.assert_called_once()
+
+def test_refunds_limited_to_recorded_amount(ledger_db):
+    """Test refunds of a recorded charge cannot add up to more than was charged."""
+    gateway = _gateway()
+    library_service.pay_late_fees("123456", 1, gateway)
+
+    assert library_service.refund_late_fee_payment("txn_123456_1", 4.0, gateway)[0]
+    success, message = library_service.refund_late_fee_payment("txn_123456_1", 3.0, gateway)
+    assert not success and message == "Refund amount exceeds the amount paid."
+    assert library_service.refund_late_fee_payment("txn_123456_1", 2.5, gateway)[0]
+    assert database.get_payment("txn_123456_1")['refunded'] == 6.5
+    assert gateway.refund_payment.call_count == 2
+
+def test_patron_payments_api(ledger_db):
+    """Test the ledger can be listed per patron and per book."""
+    gateway = _gateway()
+    library_service.pay_late_fees("123456", 1, gateway)
+    library_service.refund_late_fee_payment("txn_123456_1", 1.0, gateway)
+    app = create_app({'DB_CHECKPOINT_INTERVAL': 0, 'PAYMENT_WORKERS': 0})
+
+    with app.test_client() as client:
+        payments = client.get('/api/patrons/123456/payments?book_id=1').get_json()['payments']
+        assert [p['kind'] for p in payments] == ['payment', 'refund']
+        assert client.get('/api/patrons/123456/payments?book_id=2').get_json()['payments'] == []
+        assert client.get('/api/patrons/12x456/payments').status_code == 400
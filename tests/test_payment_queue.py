@@ -0,0 +1,228 @@
+import threading
+import time
+from datetime import datetime, timedelta
+from unittest.mock import Mock
+import pytest
+import database
+from app import create_app
+from services import payment_queue
+from services.payment_service import PaymentGateway
+from services.resilience import BulkheadFullError, CircuitOpenError
+
+
+@pytest.fixture
+def queue_db():
+    """Database with eight overdue loans, one per patron."""
+    pool = database.configure_pool(size=6, timeout=5)
+    database.init_database()
+    now = datetime.now()
+    for i in range(1, 9):
+        database.insert_book(f"Book {i}", "Author", f"{9780000000000 + i}", 1, 0)
+        database.insert_borrow_record(f"10000{i}", i, now - timedelta(days=24), now - timedelta(days=10))
+    return pool
+
+
+class SlowGateway:
+    """Gateway stand-in that takes `delay` seconds per charge and counts calls."""
+
+    def __init__(self, delay=0.2):
+        self.delay = delay
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def process_payment(self, patron_id, amount, description=""):
+        time.sleep(self.delay)
+        with self._lock:
+            self.calls.append(patron_id)
+        return True, f"txn_{patron_id}", f"Payment of ${amount:.2f} processed successfully"
+
+
+def _wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.02)
+
+
+def test_enqueue_is_idempotent(queue_db):
+    """Test resubmitting a key returns the original job instead of a new one."""
+    ok, message, job = payment_queue.enqueue_payment("100001", 1, "key-1")
+    assert ok and message == "Payment queued."
+    assert job['status'] == 'queued'
+
+    ok, message, again = payment_queue.enqueue_payment("100001", 1, "key-1")
+
+    assert ok and message == "Payment already submitted."
+    assert again['id'] == job['id']
+    assert database.get_payment_job_counts()['queued'] == 1
+
+def test_enqueue_rejects_key_reuse_for_other_payment(queue_db):
+    """Test an idempotency key cannot be replayed for a different patron or book."""
+    payment_queue.enqueue_payment("100001", 1, "key-1")
+
+    ok, message, job = payment_queue.enqueue_payment("100002", 2, "key-1")
+
+    assert ok is False
+    assert "different payment" in message
+    assert job is None
+
+def test_enqueue_validates_input(queue_db):
+    """Test bad patron and book IDs are refused before anything is queued."""
+    assert payment_queue.enqueue_payment("12ab56", 1)[0] is False
+    assert payment_queue.enqueue_payment("100001", 0)[0] is False
+    assert database.get_payment_job_counts()['queued'] == 0
+
+def test_job_charged_once(queue_db):
+    """Test a processed job records the transaction and a retry does not charge again."""
+    gateway = Mock(spec=PaymentGateway)
+    gateway.process_payment.return_value = (True, "txn_100001_1", "Payment of $8.50 processed successfully")
+    _, _, job = payment_queue.enqueue_payment("100001", 1, "key-1")
+
+    done = payment_queue.process_next_job(gateway)
+    payment_queue.enqueue_payment("100001", 1, "key-1")
+
+    assert done['id'] == job['id']
+    assert payment_queue.process_next_job(gateway) is None
+    gateway.process_payment.assert_called_once()
+    stored = database.get_payment_job(job['id'])
+    assert stored['status'] == 'succeeded'
+    assert stored['transaction_id'] == "txn_100001_1"
+    assert stored['attempts'] == 1
+
+def test_gateway_failure_recorded(queue_db):
+    """Test a declined or crashing gateway call fails the job with the message."""
+    gateway = Mock(spec=PaymentGateway)
+    gateway.process_payment.side_effect = ConnectionError("Network down")
+    _, _, job = payment_queue.enqueue_payment("100001", 1)
+
+    payment_queue.process_next_job(gateway)
+
+    stored = database.get_payment_job(job['id'])
+    assert stored['status'] == 'failed'
+    assert "Network down" in stored['message']
+
+def test_refused_job_queued_again_with_backoff(queue_db):
+    """Test a charge refused by an open breaker re-queues the job until its backoff passes."""
+    gateway = Mock(spec=PaymentGateway)
+    gateway.process_payment.side_effect = CircuitOpenError("Payment gateway is temporarily unavailable.")
+    _, _, job = payment_queue.enqueue_payment("100001", 1)
+
+    retried = payment_queue.process_next_job(gateway)
+
+    stored = database.get_payment_job(job['id'])
+    assert retried['status'] == stored['status'] == 'queued'
+    assert stored['available_at'] > datetime.now().isoformat()
+    assert payment_queue.process_next_job(gateway) is None
+    with database.db_connection() as conn:
+        conn.execute("UPDATE payment_jobs SET available_at = '2000-01-01T00:00:00'")
+        conn.commit()
+    gateway.process_payment.side_effect = None
+    gateway.process_payment.return_value = (True, "txn_100001", "Payment processed successfully")
+    done = payment_queue.process_next_job(gateway)
+    assert done['status'] == 'succeeded' and done['attempts'] == 2
+
+def test_refused_job_fails_after_max_attempts(queue_db, monkeypatch):
+    """Test a job refused on its last allowed attempt is failed rather than re-queued."""
+    monkeypatch.setattr(payment_queue, "MAX_ATTEMPTS", 1)
+    gateway = Mock(spec=PaymentGateway)
+    gateway.process_payment.side_effect = BulkheadFullError("Payment gateway is busy.")
+    _, _, job = payment_queue.enqueue_payment("100001", 1)
+
+    payment_queue.process_next_job(gateway)
+
+    stored = database.get_payment_job(job['id'])
+    assert stored['status'] == 'failed'
+    assert "busy" in stored['message']
+
+def test_retry_delay_doubles_up_to_cap():
+    """Test the backoff doubles per attempt and stops growing at the cap."""
+    assert payment_queue.retry_delay(1) == payment_queue.RETRY_BACKOFF
+    assert payment_queue.retry_delay(3) == payment_queue.RETRY_BACKOFF * 4
+    assert payment_queue.retry_delay(50) == payment_queue.RETRY_MAX_BACKOFF
+
+def test_failed_job_queued_again_on_resubmit(queue_db):
+    """Test a payment that failed without a charge can be submitted again under its key."""
+    gateway = Mock(spec=PaymentGateway)
+    gateway.process_payment.return_value = (False, "", "Payment declined")
+    _, _, job = payment_queue.enqueue_payment("100001", 1)
+    payment_queue.process_next_job(gateway)
+
+    success, message, again = payment_queue.enqueue_payment("100001", 1)
+
+    assert (success, message) == (True, "Payment queued.")
+    assert again['id'] == job['id'] and again['status'] == 'queued'
+    gateway.process_payment.return_value = (True, "txn_100001", "Payment processed successfully")
+    assert payment_queue.process_next_job(gateway)['status'] == 'succeeded'
+    assert payment_queue.enqueue_payment("100001", 1)[1] == "Payment already submitted."
+
+def test_timed_out_charge_not_queued_again(queue_db):
+    """Test a job whose gateway call timed out fails and is not re-queued, as it may have charged."""
+    gateway = Mock(spec=PaymentGateway)
+    gateway.process_payment.side_effect = TimeoutError("Read timed out")
+    _, _, job = payment_queue.enqueue_payment("100001", 1)
+    payment_queue.process_next_job(gateway)
+
+    success, message, again = payment_queue.enqueue_payment("100001", 1)
+
+    assert message == "Payment already submitted." and again['status'] == 'failed'
+    assert payment_queue.process_next_job(gateway) is None
+    gateway.process_payment.assert_called_once()
+
+def test_interrupted_charge_not_queued_again(queue_db):
+    """Test a job whose charge may have reached the gateway is not re-queued."""
+    _, _, job = payment_queue.enqueue_payment("100001", 1)
+    database.claim_payment_job()
+    database.claim_payment_request(job['idempotency_key'], "100001", 1)
+    database.finish_payment_job(job['id'], False, payment_queue.STALE_JOB_MESSAGE, None)
+
+    success, message, again = payment_queue.enqueue_payment("100001", 1)
+
+    assert message == "Payment already submitted." and again['status'] == 'failed'
+
+def test_workers_drain_queue_concurrently(queue_db):
+    """Test the worker pool charges every job exactly once, in parallel."""
+    gateway = SlowGateway(delay=0.2)
+    workers = payment_queue.start_payment_workers(4, poll_interval=1, gateway_factory=lambda: gateway)
+    start = time.perf_counter()
+
+    for i in range(1, 9):
+        payment_queue.enqueue_payment(f"10000{i}", i)
+    _wait_for(lambda: database.get_payment_job_counts()['succeeded'] == 8)
+
+    assert time.perf_counter() - start < 8 * 0.2
+    assert sorted(gateway.calls) == [f"10000{i}" for i in range(1, 9)]
+    assert workers.stats()['succeeded'] == 8
+
+def test_stale_processing_job_failed_not_retried(queue_db):
+    """Test a job abandoned mid-charge is failed on restart rather than charged again."""
+    _, _, job = payment_queue.enqueue_payment("100001", 1)
+    database.claim_payment_job()
+    with database.db_connection() as conn:
+        conn.execute("UPDATE payment_jobs SET updated_at = '2000-01-01T00:00:00'")
+        conn.commit()
+
+    payment_queue.start_payment_workers(0)
+
+    stored = database.get_payment_job(job['id'])
+    assert stored['status'] == 'failed'
+    assert stored['message'] == payment_queue.STALE_JOB_MESSAGE
+
+def test_payment_endpoints(queue_db, monkeypatch):
+    """Test POST returns 202 with a job immediately and GET reports its progress."""
+    client = create_app({'DB_CHECKPOINT_INTERVAL': 0, 'PAYMENT_WORKERS': 0}).test_client()
+
+    response = client.post('/api/payments', json={'patron_id': '100001', 'book_id': 1},
+                           headers={'Idempotency-Key': 'abc'})
+    assert response.status_code == 202
+    job = response.get_json()['job']
+    assert client.get(response.get_json()['status_url']).get_json()['status'] == 'queued'
+
+    retry = client.post('/api/payments', json={'patron_id': '100001', 'book_id': 1},
+                        headers={'Idempotency-Key': 'abc'})
+    assert retry.get_json()['job']['id'] == job['id']
+
+    assert client.post('/api/payments', json={'patron_id': '100002', 'book_id': 2},
+                       headers={'Idempotency-Key': 'abc'}).status_code == 409
+    assert client.post('/api/payments', json={'patron_id': '1', 'book_id': 2}).status_code == 400
+    assert client.get('/api/payments/999').status_code == 404
+    assert client.get('/api/metrics').get_json()['payment_queue']['jobs']['queued'] == 1
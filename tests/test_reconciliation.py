@@ -0,0 +1,134 @@
+import asyncio
+from datetime import datetime, timedelta
+from unittest.mock import Mock
+import pytest
+import database
+from app import create_app
+from services import library_service, reconciliation
+from services.async_payment_gateway import AsyncPaymentGateway
+from services.fake_payment_server import FakePaymentServer
+from services.payment_service import PaymentGateway
+
+
+@pytest.fixture
+def ledger_db(library_db):
+    """Database with one overdue loan."""
+    now = datetime.now()
+    database.insert_book("Overdue", "Author", "9780000000001", 1, 0)
+    database.insert_borrow_record("123456", 1, now - timedelta(days=24), now - timedelta(days=10))
+    return library_db
+
+
+def _charge(server, charges):
+    async def run():
+        gateway = AsyncPaymentGateway(base_url=server.url)
+        return await gateway.process_payments(charges)
+    return [txn for _, txn, _ in asyncio.run(run())]
+
+
+def test_pay_and_refund_recorded_in_ledger(ledger_db):
+    """Test successful payments and refunds land in the ledger as pending rows."""
+    gateway = Mock(spec=PaymentGateway)
+    gateway.process_payment.return_value = (True, "txn_123456_1", "Payment of $6.50 processed successfully")
+    gateway.refund_payment.return_value = (True, "Refund of $2.00 processed successfully.")
+
+    assert library_service.pay_late_fees("123456", 1, gateway)[0]
+    assert library_service.refund_late_fee_payment("txn_123456_1", 2.0, gateway)[0]
+
+    payment, refund = database.get_payments()
+    assert (payment['kind'], payment['patron_id'], payment['book_id'], payment['amount']) == ('payment', '123456', 1, 6.5)
+    assert (refund['kind'], refund['patron_id'], refund['book_id'], refund['amount']) == ('refund', '123456', 1, 2.0)
+    assert payment['status'] == refund['status'] == 'pending'
+
+def test_failed_payment_not_recorded(ledger_db):
+    """Test declined charges leave no ledger row."""
+    gateway = Mock(spec=PaymentGateway)
+    gateway.process_payment.return_value = (False, "", "Payment declined")
+
+    library_service.pay_late_fees("123456", 1, gateway)
+
+    assert database.get_payments() == []
+
+def test_reconcile_reports_mismatches(ledger_db):
+    """Test matching rows are verified and wrong amounts or unknown transactions are flagged."""
+    with FakePaymentServer() as server:
+        good, wrong = _charge(server, [("123456", 6.5, ""), ("123456", 3.0, "")])
+        database.record_payment(good, "123456", 1, 6.5)
+        database.record_payment(wrong, "123456", 1, 4.0)
+        database.record_payment("txn_000000_404", "000000", 1, 1.0)
+        database.record_refund(good, 6.5)
+
+        report = reconciliation.reconcile_payments(AsyncPaymentGateway(base_url=server.url))
+
+    assert report.checked == 4
+    assert report.verified == 2
+    assert [m['transaction_id'] for m in report.mismatches] == [wrong, "txn_000000_404"]
+    assert "$4.00" in report.mismatches[0]['message']
+    assert [p['status'] for p in database.get_payments()] == ['verified', 'mismatch', 'mismatch', 'verified']
+    assert database.get_pending_payments() == []
+
+def test_unreachable_gateway_leaves_rows_pending(ledger_db):
+    """Test rows the gateway could not answer for are reported and retried next run."""
+    database.record_payment("txn_123456_1", "123456", 1, 6.5)
+
+    report = reconciliation.reconcile_payments(AsyncPaymentGateway(base_url="http://127.0.0.1:1"))
+
+    assert len(report.errors) == 1
+    assert report.verified == 0
+    assert len(database.get_pending_payments()) == 1
+
+def test_reconcile_throughput(ledger_db):
+    """Test thousands of 300ms verifications run at over 1,000 per second against the stub."""
+    with database.db_connection() as conn:
+        conn.executemany('''
+            INSERT INTO payments (transaction_id, kind, patron_id, book_id, amount, created_at)
+            VALUES (?, 'payment', '123456', 1, 10.5, '2025-01-01')
+        ''', [(f"txn_123456_{i}",) for i in range(3000)])
+        conn.commit()
+
+    report = reconciliation.reconcile_payments(concurrency=1000, batch_size=1000, dry_run=True)
+
+    assert report.verified == 3000
+    assert report.batches == 3
+    assert report.verifications_per_second > 1000
+
+def test_reconcile_cli(ledger_db):
+    """Test the CLI prints mismatches and a summary."""
+    database.record_payment("txn_123456_1", "123456", 1, 6.5)
+    app = create_app({'DB_CHECKPOINT_INTERVAL': 0, 'PAYMENT_WORKERS': 0})
+
+    with FakePaymentServer() as server:
+        result = app.test_cli_runner().invoke(args=['reconcile-payments', '--gateway-url', server.url])
+
+    assert result.exit_code == 0
+    assert "MISMATCH payment txn_123456_1" in result.output
+    assert "Checked 1 payments: 0 verified, 1 mismatched" in result.output
+
+def test_simulated_gateway_never_updates_ledger(ledger_db):
+    """Test the simulator only runs as a dry run, leaving real rows pending."""
+    database.record_payment("txn_123456_1", "123456", 1, 6.5)
+
+    with pytest.raises(ValueError):
+        reconciliation.reconcile_payments()
+    report = reconciliation.reconcile_payments(dry_run=True)
+
+    assert report.checked == 1
+    assert len(database.get_pending_payments()) == 1
+
+def test_reconcile_cli_gateway_from_config(ledger_db):
+    """Test the CLI uses the configured live gateway, and without one does a dry run."""
+    database.record_payment("txn_123456_1", "123456", 1, 6.5)
+
+    simulated = create_app({'DB_CHECKPOINT_INTERVAL': 0, 'PAYMENT_WORKERS': 0})
+    result = simulated.test_cli_runner().invoke(args=['reconcile-payments'])
+    assert result.exit_code == 0
+    assert "Dry run: ledger not updated." in result.output
+    assert database.get_payments()[0]['status'] == 'pending'
+
+    with FakePaymentServer() as server:
+        live = create_app({'DB_CHECKPOINT_INTERVAL': 0, 'PAYMENT_WORKERS': 0,
+                           'PAYMENT_GATEWAY_LIVE': True, 'PAYMENT_GATEWAY_URL': server.url})
+        result = live.test_cli_runner().invoke(args=['reconcile-payments'])
+
+    assert "Checked 1 payments: 0 verified, 1 mismatched" in result.output
+    assert database.get_payments()[0]['status'] == 'mismatch'
@@ -3,6 +3,9 @@ from unittest.mock import Mock
 from services import library_service
 from services.payment_service import PaymentGateway
 
+# Refunds are checked against the payments ledger
+pytestmark = pytest.mark.usefixtures("library_db")
+
 
 def test_refund_fee_success():
     """Test successful refund."""
@@ -89,3 +92,17 @@ def test_exception_handling(mocker):
     assert "Refund processing error" in msg
     mock_gateway.refund_payment.assert_called_once()
     mock_gateway.refund_payment.assert_called_with('txn_123456_1730946927_1730946928', 13)
+
+
+def test_refund_refused_when_ledger_unavailable(monkeypatch):
+    """Test a refund is not sent when the original payment cannot be checked."""
+    def broken(transaction_id):
+        raise RuntimeError("database is locked")
+    monkeypatch.setattr(library_service, "get_payment", broken)
+    mock_gateway = Mock(spec=PaymentGateway)
+
+    result, msg = library_service.refund_late_fee_payment("txn_123456_1730946927", 5.0, payment_gateway=mock_gateway)
+
+    assert result is False
+    assert msg == "Unable to verify the original payment."
+    mock_gateway.refund_payment.assert_not_called()
@@ -0,0 +1,137 @@
+from datetime import datetime, timedelta
+from unittest.mock import Mock
+import pytest
+import database
+import repositories
+from app import create_app
+from services import library_service
+from services.payment_service import PaymentGateway
+
+
+@pytest.fixture(params=['sqlite', 'memory'])
+def repository(request):
+    """Each backend, configured as the repository the business logic uses."""
+    if request.param == 'sqlite':
+        database.init_database()
+    return repositories.configure_repository(repositories.create_repository(request.param))
+
+
+def _overdue_loan(repository, patron_id, book_id, days_overdue):
+    now = datetime.now()
+    due = now - timedelta(days=days_overdue)
+    assert repository.loans.borrow(patron_id, book_id, due - timedelta(days=14), due)[0]
+
+
+def test_catalog_flow(repository):
+    """Test adding, paging and searching books behave the same on every backend."""
+    assert library_service.add_book_to_catalog("Dune", "Frank Herbert", "9780441172719", 2)[0]
+    assert library_service.add_book_to_catalog("Emma", "Jane Austen", "9780141439587", 1)[0]
+    assert library_service.add_book_to_catalog("Dune", "Someone", "9780441172719", 1) == \
+        (False, "A book with this ISBN already exists.")
+
+    success, _, page = library_service.get_catalog_page(limit=1)
+    assert success and [b['title'] for b in page['books']] == ["Dune"]
+    success, _, page = library_service.get_catalog_page(page['next_cursor'], limit=1)
+    assert [b['title'] for b in page['books']] == ["Emma"] and page['next_cursor'] is None
+
+    assert [b['title'] for b in library_service.search_books_in_catalog("austen", "author")] == ["Emma"]
+    assert library_service.search_books_in_catalog("9780441172719", "isbn")[0]['title'] == "Dune"
+
+def test_loan_flow(repository):
+    """Test borrowing limits, returns and the status report on every backend."""
+    library_service.add_book_to_catalog("Dune", "Frank Herbert", "9780441172719", 1)
+
+    assert library_service.borrow_book_by_patron("123456", 1)[0]
+    assert library_service.borrow_book_by_patron("654321", 1) == (False, "This book is currently not available.")
+    report = library_service.get_patron_status_report("123456")
+    assert report['currently_borrowed_number'] == 1 and len(report['history']) == 1
+
+    success, message = library_service.return_book_by_patron("123456", 1)
+    assert success and message.startswith("Fee amount owed: $0.00")
+    assert repository.books.get(1)['available_copies'] == 1
+    assert library_service.get_patron_status_report("123456")['currently_borrowed_number'] == 0
+
+def test_payment_flow(repository):
+    """Test batch payments, per-book refunds and idempotent retries on every backend."""
+    library_service.add_book_to_catalog("Ten Days", "Author", "9780000000001", 1)
+    library_service.add_book_to_catalog("Three Days", "Author", "9780000000002", 1)
+    _overdue_loan(repository, "123456", 1, 10)
+    _overdue_loan(repository, "123456", 2, 3)
+    gateway = Mock(spec=PaymentGateway)
+    gateway.process_payment.return_value = (True, "txn_123456_1", "Payment processed successfully")
+    gateway.refund_payment.return_value = (True, "Refund processed successfully.")
+
+    assert library_service.pay_all_late_fees("123456", gateway, idempotency_key="k1")[0]
+    assert library_service.pay_all_late_fees("123456", gateway, idempotency_key="k1")[2] == "txn_123456_1"
+    gateway.process_payment.assert_called_once()
+    assert gateway.process_payment.call_args.kwargs['amount'] == 8.0
+
+    assert library_service.refund_late_fee_payment("txn_123456_1", 1.5, gateway, book_id=2)[0]
+    assert not library_service.refund_late_fee_payment("txn_123456_1", 0.5, gateway, book_id=2)[0]
+    assert [p['kind'] for p in repository.payments.list_for_patron("123456", 2)] == ['refund']
+    assert repository.loans.outstanding_fee_loans("123456", datetime.now().date().isoformat())[1]['paid'] == 0
+
+def test_memory_backend_leaves_sqlite_untouched(monkeypatch):
+    """Test the memory backend never opens a database connection."""
+    def no_database():
+        raise AssertionError("database used")
+    monkeypatch.setattr(database, "get_db_connection", no_database)
+    repositories.configure_repository(repositories.create_repository('memory'))
+
+    assert library_service.add_book_to_catalog("Dune", "Frank Herbert", "9780441172719", 1)[0]
+    assert library_service.borrow_book_by_patron("123456", 1)[0]
+    assert library_service.get_patron_status_report("123456")['currently_borrowed_number'] == 1
+
+def test_backend_chosen_in_create_app():
+    """Test create_app selects registered backends and rejects unknown ones."""
+    created = []
+    def factory(**options):
+        created.append(options)
+        return repositories.create_memory_repository()
+    repositories.register_backend('custom', factory)
+
+    create_app({'DB_CHECKPOINT_INTERVAL': 0, 'PAYMENT_WORKERS': 0,
+                'STORAGE_BACKEND': 'custom', 'STORAGE_OPTIONS': {'dsn': 'server://db'}})
+
+    assert created == [{'dsn': 'server://db'}]
+    assert len(library_service.get_all_books()) == 3
+    assert database.get_all_books() == []
+    with pytest.raises(ValueError):
+        create_app({'DB_CHECKPOINT_INTERVAL': 0, 'PAYMENT_WORKERS': 0, 'STORAGE_BACKEND': 'nope'})
+
+def test_memory_backend_catalog_validators():
+    """Test writes to the memory backend change the catalog ETag served by create_app."""
+    app = create_app({'DB_CHECKPOINT_INTERVAL': 0, 'PAYMENT_WORKERS': 0, 'STORAGE_BACKEND': 'memory'})
+    client = app.test_client()
+    first = client.get('/catalog')
+    assert b'The Great Gatsby' in first.data
+
+    assert client.get('/catalog', headers={'If-None-Match': first.headers['ETag']}).status_code == 304
+    assert library_service.borrow_book_by_patron("654321", 1)[0]
+    changed = client.get('/catalog', headers={'If-None-Match': first.headers['ETag']})
+
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != first.headers['ETag']
+
+def test_memory_backend_patron_payments_api():
+    """Test the payments API lists charges from the configured backend, not the SQLite ledger."""
+    app = create_app({'DB_CHECKPOINT_INTERVAL': 0, 'PAYMENT_WORKERS': 0, 'STORAGE_BACKEND': 'memory'})
+    client = app.test_client()
+    _overdue_loan(repositories.get_repository(), "123456", 1, 3)
+    gateway = Mock(spec=PaymentGateway)
+    gateway.process_payment.return_value = (True, "txn_123456_1", "Payment of $1.50 processed successfully")
+    assert library_service.pay_late_fees("123456", 1, gateway)[0]
+
+    payments = client.get('/api/patrons/123456/payments').get_json()['payments']
+
+    assert [(p['transaction_id'], p['book_id'], p['amount']) for p in payments] == [("txn_123456_1", 1, 1.5)]
+    assert database.get_payments() == []
+
+def test_sample_data_added_once(repository, monkeypatch):
+    """Test sample data only fills an empty catalog, without reading the whole catalog to check."""
+    monkeypatch.setattr(repository.books, 'list_all', Mock(side_effect=AssertionError("full catalog read")))
+    library_service.add_sample_data()
+    library_service.add_sample_data()
+
+    assert [book['title'] for book in library_service.get_books_page(10)] == \
+        ['1984', 'The Great Gatsby', 'To Kill a Mockingbird']
@@ -0,0 +1,160 @@
+import threading
+import time
+from unittest.mock import Mock
+import pytest
+from app import create_app
+from services import library_service, payment_service
+from services.payment_service import PaymentGateway
+from services.resilience import (
+    Bulkhead, BulkheadFullError, CircuitBreaker, CircuitOpenError, ResilientPaymentGateway
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _breaker(clock, **kwargs):
+    settings = dict(window_seconds=60, min_calls=4, error_rate=0.5, slow_call_seconds=2,
+                    slow_call_rate=0.5, open_seconds=30, clock=clock)
+    settings.update(kwargs)
+    return CircuitBreaker(**settings)
+
+
+def test_breaker_opens_on_error_rate_and_fails_fast():
+    """Test half the calls in the window failing opens the breaker and refuses calls."""
+    breaker = _breaker(FakeClock())
+    for succeeded in (True, False, True):
+        breaker.before_call()
+        breaker.record(succeeded, 0.1)
+    assert breaker.state == 'closed'
+
+    breaker.before_call()
+    breaker.record(False, 0.1)
+
+    assert breaker.state == 'open'
+    with pytest.raises(CircuitOpenError, match="temporarily unavailable. Try again in 30s"):
+        breaker.before_call()
+    assert breaker.stats()['rejected'] == 1
+
+def test_breaker_opens_on_slow_calls():
+    """Test calls slower than the latency threshold trip the breaker even when they succeed."""
+    breaker = _breaker(FakeClock())
+    for elapsed in (0.1, 3.0, 0.1, 2.5):
+        breaker.before_call()
+        breaker.record(True, elapsed)
+
+    assert breaker.state == 'open'
+
+def test_old_failures_leave_the_window():
+    """Test failures older than the rolling window no longer count."""
+    clock = FakeClock()
+    breaker = _breaker(clock)
+    for _ in range(3):
+        breaker.record(False, 0.1)
+    clock.now = 61
+    for _ in range(3):
+        breaker.record(True, 0.1)
+
+    assert breaker.state == 'closed'
+    assert breaker.stats()['window_calls'] == 3
+
+def test_half_open_trial_closes_or_reopens():
+    """Test after the open period one trial call decides the next state."""
+    clock = FakeClock()
+    breaker = _breaker(clock)
+    for _ in range(4):
+        breaker.record(False, 0.1)
+
+    clock.now = 30
+    assert breaker.state == 'half_open'
+    breaker.before_call()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()  # only one trial at a time
+    breaker.record(False, 0.1)
+    assert breaker.state == 'open'
+
+    clock.now = 60
+    breaker.before_call()
+    breaker.record(True, 0.1)
+
+    stats = breaker.stats()
+    assert stats['state'] == 'closed'
+    assert (stats['opened'], stats['half_opened'], stats['closed']) == (2, 2, 1)
+
+def test_bulkhead_rejects_beyond_capacity():
+    """Test callers beyond max_concurrent are refused instead of waiting."""
+    bulkhead = Bulkhead(max_concurrent=2)
+    bulkhead.acquire()
+    bulkhead.acquire()
+
+    with pytest.raises(BulkheadFullError, match="busy"):
+        bulkhead.acquire()
+    bulkhead.release()
+    bulkhead.acquire()
+    assert bulkhead.stats() == {'max_concurrent': 2, 'in_flight': 2, 'rejected': 1}
+
+def test_wrapper_counts_exceptions_not_declines():
+    """Test declined payments keep the breaker closed but gateway errors open it."""
+    inner = Mock(spec=PaymentGateway)
+    inner.process_payment.return_value = (False, "", "Payment declined")
+    gateway = ResilientPaymentGateway(inner, _breaker(FakeClock()), Bulkhead(2))
+    for _ in range(4):
+        assert gateway.process_payment("123456", 5)[0] is False
+    assert gateway.circuit_breaker.state == 'closed'
+
+    inner.process_payment.side_effect = ConnectionError("timed out")
+    for _ in range(4):
+        with pytest.raises(ConnectionError):
+            gateway.process_payment("123456", 5)
+    with pytest.raises(CircuitOpenError):
+        gateway.process_payment("123456", 5)
+
+    assert inner.process_payment.call_count == 8
+    assert gateway.bulkhead.stats()['in_flight'] == 0
+
+def test_slow_gateway_cannot_hold_every_thread():
+    """Test while the bulkhead is full further payments fail fast with a clear message."""
+    release = threading.Event()
+    inner = Mock(spec=PaymentGateway)
+    inner.process_payment.side_effect = lambda **kwargs: release.wait(5) and (True, "txn_1", "ok")
+    gateway = ResilientPaymentGateway(inner, CircuitBreaker(), Bulkhead(1))
+    slow = threading.Thread(target=gateway.process_payment, kwargs={'patron_id': "123456", 'amount': 5})
+    slow.start()
+    while gateway.bulkhead.stats()['in_flight'] == 0:
+        time.sleep(0.001)
+
+    with pytest.raises(BulkheadFullError):
+        gateway.refund_payment("txn_1", 5)
+    release.set()
+    slow.join()
+
+def test_pay_late_fees_reports_open_breaker(mocker, library_db):
+    """Test the service surfaces the fail-fast message without calling the gateway."""
+    mocker.patch("services.library_service.calculate_late_fee_for_book",
+                 return_value=library_service.LateFeeResult(3, 6, "Book overdue"))
+    mocker.patch("services.library_service.get_book_by_id", return_value={'id': 2, 'title': "Test Book"})
+    inner = Mock(spec=PaymentGateway)
+    breaker = CircuitBreaker(min_calls=1)
+    breaker.record(False, 0.1)
+
+    success, message, txn = library_service.pay_late_fees("123456", 2, ResilientPaymentGateway(inner, breaker))
+
+    assert success is False
+    assert "temporarily unavailable" in message
+    inner.process_payment.assert_not_called()
+
+def test_breaker_state_in_metrics():
+    """Test create_app wires the breaker settings and /api/metrics reports them."""
+    client = create_app({'DB_CHECKPOINT_INTERVAL': 0, 'PAYMENT_WORKERS': 0, 'PAYMENT_BULKHEAD_SIZE': 3,
+                         'PAYMENT_BREAKER_OPEN_SECONDS': 5}).test_client()
+
+    stats = client.get('/api/metrics').get_json()['payment_gateway']
+
+    assert stats['circuit_breaker']['state'] == 'closed'
+    assert stats['bulkhead']['max_concurrent'] == 3
+    assert payment_service.get_default_gateway().circuit_breaker.open_seconds == 5
@@ -1,5 +1,4 @@
 import pytest
-import json
 import pytest
 import sqlite3
 from services import library_service
@@ -128,3 +127,34 @@ def test_return_book_by_checking_amount(in_memory_db):
     assert "15" in message 
 
 
+
+def test_return_book_updates_both_tables(in_memory_db):
+    """Test a return closes the borrow record and restores the copy together."""
+    success, message = library_service.return_book_by_patron("999999", 6)
+
+    assert success == True
+    assert database.get_book_by_id(6)['available_copies'] == 5
+    assert database.get_patron_borrow_count("999999") == 0
+
+def test_return_book_failure_rolls_back(in_memory_db):
+    """Test a failing borrow record update leaves availability untouched."""
+    in_memory_db.execute('''CREATE TRIGGER fail_return BEFORE UPDATE ON borrow_records
+        BEGIN SELECT RAISE(ABORT, 'update failed'); END''')
+
+    success, message = library_service.return_book_by_patron("999999", 6)
+
+    assert success == False
+    assert "Database error" in message
+    assert database.get_book_by_id(6)['available_copies'] == 4
+    assert database.get_patron_borrow_count("999999") == 1
+
+def test_late_fee_for_due_date_tiers():
+    """Test the fee tiers: $0.50/day for 7 days, $1/day after, capped at $15."""
+    today = datetime(2025, 10, 30, 9, 0)
+
+    fee = lambda days: library_service.late_fee_for_due_date(today - timedelta(days=days), today)
+
+    assert (fee(-1).fee_amount, fee(-1).days_overdue) == (0.0, 0)
+    assert (fee(3).fee_amount, fee(3).days_overdue) == (1.5, 3)
+    assert (fee(10).fee_amount, fee(10).days_overdue) == (6.5, 10)
+    assert (fee(40).fee_amount, fee(40).days_overdue) == (15.0, 40)
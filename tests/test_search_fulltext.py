@@ -0,0 +1,89 @@
+import random
+import pytest
+import database
+from services import library_service
+
+
+@pytest.fixture
+def fts_db(library_db):
+    """Database with migrations (and so the books_fts index) applied."""
+    books = [
+        ('The Great Gatsby', 'F. Scott Fitzgerald', '9780743273565'),
+        ('Great Expectations', 'Charles Dickens', '9780141439563'),
+        ('The Greatest Salesman', 'Og Mandino', '9780553277579'),
+        ('A Tale of Two Cities', 'Charles Dickens', '9780486406510'),
+        ('Les Misérables', 'Victor Hugo', '9780451419439'),
+    ]
+    for title, author, isbn in books:
+        database.insert_book(title, author, isbn, 2, 2)
+    return library_db
+
+
+def _scan(term, column):
+    return [book for book in database.get_all_books() if term.lower() in book[column].lower()]
+
+
+def test_title_search_uses_fulltext_index(fts_db):
+    """Test title search is answered by the index and matches case-insensitively."""
+    indexed = database.search_books_fulltext('title', 'GREAT')
+
+    assert indexed is not None
+    assert {b['title'] for b in library_service.search_books_in_catalog('GREAT', 'title')} == {
+        'The Great Gatsby', 'Great Expectations', 'The Greatest Salesman'}
+
+def test_author_search_partial_match(fts_db):
+    """Test partial author match through the index."""
+    result = library_service.search_books_in_catalog('dicK', 'author')
+
+    assert sorted(b['title'] for b in result) == ['A Tale of Two Cities', 'Great Expectations']
+
+def test_index_follows_inserts_and_updates(fts_db):
+    """Test triggers keep the index in sync with books."""
+    database.insert_book('Dune', 'Frank Herbert', '9780441013593', 1, 1)
+    assert [b['title'] for b in library_service.search_books_in_catalog('dune', 'title')] == ['Dune']
+
+    with database.db_connection() as conn:
+        conn.execute("UPDATE books SET title = 'Dune Messiah' WHERE isbn = '9780441013593'")
+        conn.commit()
+    assert [b['title'] for b in library_service.search_books_in_catalog('messiah', 'title')] == ['Dune Messiah']
+
+def test_availability_update_keeps_index_results(fts_db):
+    """Test availability changes do not drop a book from the index."""
+    database.update_book_availability(1, -1)
+
+    result = library_service.search_books_in_catalog('gatsby', 'title')
+    assert result[0]['available_copies'] == 1
+
+def test_short_term_falls_back_to_scan(fts_db):
+    """Test terms shorter than a trigram still match like the scan does."""
+    assert database.search_books_fulltext('title', 'Ta') is None
+    assert library_service.search_books_in_catalog('Ta', 'title') == _scan('Ta', 'title')
+
+def test_query_syntax_is_literal(fts_db):
+    """Test FTS operators and quotes in the term are searched literally."""
+    assert library_service.search_books_in_catalog('"great" OR tale', 'title') == []
+    assert library_service.search_books_in_catalog('Two*', 'title') == []
+
+def test_non_ascii_case_insensitive(fts_db):
+    """Test accented titles match regardless of case."""
+    result = library_service.search_books_in_catalog('MISÉRABLES', 'title')
+
+    assert [b['title'] for b in result] == ['Les Misérables']
+
+def test_isbn_exact_lookup(fts_db):
+    """Test ISBN search is exact and goes to the unique index."""
+    assert [b['title'] for b in library_service.search_books_in_catalog('9780486406510', 'isbn')] == ['A Tale of Two Cities']
+    assert library_service.search_books_in_catalog('978048640651', 'isbn') == []
+
+def test_fulltext_matches_scan_semantics(fts_db):
+    """Test the indexed search returns exactly the books the plain scan would."""
+    rng = random.Random(327)
+    words = ['river', 'night', 'garden', 'stone', 'winter', 'silver', 'crown', 'echo']
+    for i in range(200):
+        title = ' '.join(rng.choice(words).capitalize() for _ in range(3))
+        database.insert_book(title, f"Author {rng.choice(words)}", f"{9790000000000 + i}", 1, 1)
+
+    for term in ['ver', 'NIGHT', 'den sto', 'ho', 'crown echo', 'zzz']:
+        for column in ('title', 'author'):
+            result = library_service.search_books_in_catalog(term, column)
+            assert sorted(b['id'] for b in result) == sorted(b['id'] for b in _scan(term, column))
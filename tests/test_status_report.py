@@ -1,5 +1,4 @@
 import pytest
-import json
 import pytest
 import sqlite3
 from services import library_service
@@ -78,7 +77,6 @@ def in_memory_db(monkeypatch):
 
     # Patch get_db_connection 
     monkeypatch.setattr(database, "get_db_connection", lambda: NonClosingConnection(conn))
-    monkeypatch.setattr(library_service, "get_db_connection", lambda: NonClosingConnection(conn))
     
     yield conn  # keep connection alive during test
     conn.close()
@@ -127,3 +125,33 @@ def test_status_report_non_numeric_patron(in_memory_db):
 
     assert len(result) == 0
 
+
+class CountingConnection(NonClosingConnection):
+    """Non-closing connection that counts executed statements."""
+    executed = 0
+
+    def execute(self, *args, **kwargs):
+        CountingConnection.executed += 1
+        return self._conn.execute(*args, **kwargs)
+
+def test_status_report_uses_two_queries(in_memory_db, monkeypatch):
+    """Test the report loads loans and history once each, however many loans there are."""
+    counting = lambda: CountingConnection(in_memory_db)
+    monkeypatch.setattr(database, "get_db_connection", counting)
+    CountingConnection.executed = 0
+
+    result = library_service.get_patron_status_report("123456")
+
+    assert result['currently_borrowed_number'] == 1
+    assert CountingConnection.executed == 2
+
+def test_calculate_late_fees_matches_single_book(in_memory_db):
+    """Test the batched fees agree with calculate_late_fee_for_book for every loan."""
+    for patron_id in ("123456", "999999"):
+        loans = database.get_patron_borrowed_books(patron_id)
+
+        fees = library_service.calculate_late_fees(loans)
+
+        assert len(fees) == len(loans)
+        for loan, fee in zip(loans, fees):
+            assert fee == library_service.calculate_late_fee_for_book(patron_id, loan['book_id'])
@@ -0,0 +1,100 @@
+import pytest
+import database
+from app import create_app
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    """Point the database module at a temporary file."""
+    path = str(tmp_path / "storage.db")
+    monkeypatch.setattr(database, "DATABASE", path)
+    yield path
+    database.stop_checkpointer()
+    database._get_pool().close_all()
+
+
+def _pragma(name):
+    with database.db_connection() as conn:
+        return conn.execute(f'PRAGMA {name}').fetchone()[0]
+
+
+def test_safe_profile_pragmas(db_path):
+    """Test the safe profile runs in WAL mode with full fsync."""
+    database.configure_pool(storage_profile='safe')
+
+    assert _pragma('journal_mode') == 'wal'
+    assert _pragma('synchronous') == 2  # FULL
+    assert _pragma('busy_timeout') == 5000
+
+def test_fast_profile_pragmas(db_path):
+    """Test the fast profile relaxes fsync and keeps temp data in memory."""
+    database.configure_pool(storage_profile='fast')
+
+    assert _pragma('journal_mode') == 'wal'
+    assert _pragma('synchronous') == 1  # NORMAL
+    assert _pragma('temp_store') == 2  # MEMORY
+    assert _pragma('cache_size') == -64000
+
+def test_profile_overrides(db_path):
+    """Test individual PRAGMAs can be overridden on top of a profile."""
+    database.configure_pool(storage_profile='fast', pragmas={'cache_size': -2000})
+
+    assert _pragma('cache_size') == -2000
+    assert _pragma('synchronous') == 1
+
+def test_unknown_profile_rejected(db_path):
+    """Test an unknown profile name is reported instead of silently ignored."""
+    with pytest.raises(ValueError):
+        database.configure_pool(storage_profile='turbo')
+
+def test_readers_not_blocked_by_open_write(db_path):
+    """Test a reader sees committed data while another connection holds a write transaction."""
+    database.configure_pool(size=2, timeout=1, storage_profile='safe', pragmas={'busy_timeout': 100})
+    database.init_database()
+    database.insert_book("Committed", "Author", "1000000000001", 1, 1)
+
+    with database.db_connection() as writer:
+        writer.execute('BEGIN IMMEDIATE')
+        writer.execute("INSERT INTO books (title, author, isbn, total_copies, available_copies) VALUES ('Pending', 'A', '1000000000002', 1, 1)")
+        titles = [book['title'] for book in database.get_all_books()]
+        writer.commit()
+
+    assert titles == ["Committed"]
+
+def test_checkpoint_records_stats(db_path):
+    """Test a checkpoint truncates the WAL into the database and is counted."""
+    database.configure_pool(storage_profile='safe')
+    database.init_database()
+    database.insert_book("WAL Book", "Author", "1000000000003", 1, 1)
+    checkpointer = database.start_checkpointer(3600)
+
+    result = checkpointer.checkpoint()
+    stats = database.get_wal_stats()
+
+    assert result['busy'] is False
+    assert result['checkpointed_frames'] == result['log_frames']
+    assert stats['journal_mode'] == 'wal'
+    assert stats['checkpoints'] == 1
+    assert stats['checkpoint_interval'] == 3600
+
+def test_wal_size_of_uri_database(tmp_path, monkeypatch):
+    """Test the WAL file is found when the database is given as a URI with a query string."""
+    path = tmp_path / "catalog.db"
+    monkeypatch.setattr(database, "DATABASE", f"file:{path}?mode=rwc")
+    database.configure_pool(storage_profile='safe')
+    database.init_database()
+    database.insert_book("URI Book", "Author", "1000000000004", 1, 1)
+
+    try:
+        assert database.get_wal_stats()['wal_bytes'] == (tmp_path / "catalog.db-wal").stat().st_size > 0
+    finally:
+        database._get_pool().close_all()
+
+def test_create_app_storage_config(db_path):
+    """Test storage profile and checkpoint interval come from create_app config."""
+    app = create_app({'DB_STORAGE_PROFILE': 'fast', 'DB_CHECKPOINT_INTERVAL': 0})
+
+    wal = app.test_client().get('/api/metrics').get_json()['wal']
+    assert wal['journal_mode'] == 'wal'
+    assert wal['checkpoint_interval'] == 0
+    assert _pragma('synchronous') == 1